@@ -1,111 +1,12 @@
-from threading import Thread
-from typing import List, Text, Tuple, Callable
-import dataclasses
-import json
-import os
-import os.path
-import re
 import sys
-import threading
-import time
 
 import gi
 
 gi.require_version('Gtk', '4.0')
-from gi.repository import Gtk, Gio, GObject, Gdk, GLib, Adw
+from gi.repository import Gtk, Gio, GObject, Gdk, Adw
 
-
-@dataclasses.dataclass
-class VideoFile:
-    file_path: Text = ''
-    scrubbed_file_name: Text = ''
-    scrubbed_file_year: Text = ''
-    imdb_tt: Text = ''
-    imdb_name: Text = ''
-    imdb_year: Text = ''
-    imdb_rating: Text = ''
-    imdb_genres: List[Text] = None
-    imdb_plot: Text = None
-    is_dirty: bool = False
-
-
-class FolderScanWorker(Thread):
-    def __init__(self, folder_path: Text, ignore_extensions: Text = None, filename_metadata_tokens: Text = None, progress_callback: Callable = None):
-        super().__init__()
-        self.folder_data = None
-        self.ignore_extensions = ignore_extensions or 'png,jpg,nfo,srt'
-        self.filename_metadata_tokens = filename_metadata_tokens or '480p,720p,1080p,bluray,hevc,x265,x264,web,webrip,web-dl,repack,proper,extended,remastered,dvdrip,dvd,hdtv,xvid,hdrip,brrip,dvdscr,pdtv'
-        self.folder_path = folder_path
-        self.keep_scanning = True
-        self.progress_callback = progress_callback
-
-    def stop_scanning(self):
-        self.keep_scanning = False
-
-    @staticmethod
-    def scrub_video_file_name(file_name: Text, filename_metadata_tokens: Text) -> Tuple[Text, Text]:
-        year = ''
-
-        match = re.match(r'((.*)\((\d{4})\))', file_name)
-        if match:
-            file_name = match.group(2)
-            year = match.group(3)
-            scrubbed_file_name_list = file_name.replace('.', ' ').split()
-
-        else:
-            metadata_token_list = [token.lower().strip() for token in filename_metadata_tokens.split(',')]
-            file_name_parts = file_name.replace('.', ' ').split()
-            scrubbed_file_name_list = list()
-
-            for file_name_part in file_name_parts:
-                file_name_part = file_name_part.lower()
-
-                if file_name_part in metadata_token_list:
-                    break
-                scrubbed_file_name_list.append(file_name_part)
-
-            if scrubbed_file_name_list:
-                match = re.match(r'\(?(\d{4})\)?', scrubbed_file_name_list[-1])
-                if match:
-                    year = match.group(1)
-                    del scrubbed_file_name_list[-1]
-
-        scrubbed_file_name = ' '.join(scrubbed_file_name_list).strip()
-        scrubbed_file_name = re.sub(' +', ' ', scrubbed_file_name)
-        return scrubbed_file_name, year
-
-    def run(self):
-        print(f'FolderScanWorker: Begin processing directory "{self.folder_path}"')
-
-        ignore_extensions_list = [ext.lower().strip() for ext in self.ignore_extensions.split(',')]
-
-        self.folder_data = list()
-
-        for dir_path, dirs, files in os.walk(self.folder_path):
-            for filename in files:
-                if self.keep_scanning is False:
-                    print(f'FolderScanWorker: Stopping scanning')
-                    return
-
-                print(f'FolderScanWorker: Processing file "{filename}"')
-                GLib.idle_add(self.progress_callback, f'FolderScanWorker: Processing file "{filename}"')
-                time.sleep(1.0)
-
-                file_path = os.path.join(dir_path, filename)
-                filename_parts = os.path.splitext(filename)
-                filename_no_extension = filename_parts[0]
-                filename_extension = filename_parts[1]
-                if filename_extension.startswith('.'):
-                    filename_extension = filename_extension[1:]
-
-                if filename_extension.lower() in ignore_extensions_list:
-                    continue
-
-                scrubbed_video_file_name, year = self.scrub_video_file_name(filename_no_extension, self.filename_metadata_tokens)
-                video_file = VideoFile(file_path=file_path, scrubbed_file_name=scrubbed_video_file_name, scrubbed_file_year=year)
-                self.folder_data.append(video_file)
-
-        print(f'FolderScanWorker: End processing directory "{self.folder_path}"')
+from mmm.core.scan_progress import ScanProgress
+from mmm.file_scanner import FolderScanWorker
 
 
 class MyListModelDataItem(GObject.Object):
@@ -261,7 +162,8 @@ class MainWindow(Gtk.ApplicationWindow):
         # dialog = Gtk.AlertDialog(message='Main Message', buttons=['Cancel'])
         # dialog.choose(self, None, self.on_dialog_cancel, 'My User Data')
 
-    def on_dialog_progress_update(self, progress_message):
+    def on_dialog_progress_update(self, progress: ScanProgress):
+        progress_message = progress.summary()
         print(f'on_dialog_progress_update: {progress_message}')
 
         box: Gtk.Widget = self.message_dialog.get_message_area()
@@ -22,6 +22,7 @@ class MainWindow(Gtk.ApplicationWindow):
         self.file_scanner_panel.connect('file_scanning_complete', self.file_scanning_complete_handler)
 
         self.file_browser_panel = FileBrowserPanel()
+        self.file_scanner_panel.connect('file_scanning_started', self.file_scanning_started_handler)
 
         self.simple_grid = ConstraintLayoutDemo()
 
@@ -34,8 +35,13 @@ class MainWindow(Gtk.ApplicationWindow):
     def file_added_handler(self, _signal_factory, filename):
         print(f'MainWindow:file_added_handler: {filename}')
 
+    def file_scanning_started_handler(self, _signal_factory, result_queue):
+        self.file_browser_panel.consume_video_file_batches(result_queue)
+
     def file_scanning_complete_handler(self, _signal_factory, dirname):
         print(f'MainWindow:file_scanning_complete_handler: {dirname}')
+        self.file_browser_panel.merge_scan_results(self.file_scanner_panel.file_scanning_thread.scan_engine)
+        self.file_browser_panel.watch_folder(dirname)
 
 
 class MyApp(Gtk.Application):
@@ -0,0 +1,70 @@
+# Library startup benchmark: loading a JSON library by parsing it vs. from its memory-mapped snapshot.
+#
+# Writes a synthetic library of --count records, then times, for each way of loading it, how long until the first
+# batch of rows is available and until the whole library is. Opening the snapshot with open_rows() and decoding a
+# screenful of rows from the middle of it is timed too, which is what a front end pays at startup when it shows an
+# up-to-date snapshot as it is.
+#
+#   python main_library_load_benchmark.py --count 300000 --plot-chars 200
+
+import argparse
+import os
+import os.path
+import random
+import tempfile
+import time
+
+from main_video_file_memory_benchmark import CHUNK_SIZE, make_video_file_json_chunk
+from mmm.core.library_journal import LibraryJournal
+
+
+def time_load(library_journal: LibraryJournal, use_snapshot: bool):
+    start_time = time.perf_counter()
+    first_batch_elapsed = None
+    row_count = 0
+    for video_files in library_journal.iter_batches(use_snapshot=use_snapshot):
+        if first_batch_elapsed is None:
+            first_batch_elapsed = time.perf_counter() - start_time
+        row_count += len(video_files)
+    return first_batch_elapsed, time.perf_counter() - start_time, row_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare library startup from JSON and from the mmap snapshot')
+    parser.add_argument('--count', type=int, default=300_000)
+    parser.add_argument('--plot-chars', type=int, default=200, help='Length of a unique plot string per record (0 = no plot)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        library_path = os.path.join(temp_dir, 'library.json')
+        rng = random.Random(args.seed)
+        with open(library_path, 'w', encoding='utf8') as f:
+            f.write('[\n')
+            for first_index in range(0, args.count, CHUNK_SIZE):
+                json_chunk = make_video_file_json_chunk(rng, first_index, min(CHUNK_SIZE, args.count - first_index), args.plot_chars)
+                f.write((',\n' if first_index else '') + json_chunk[1:-1])
+            f.write('\n]\n')
+
+        library_journal = LibraryJournal(library_path)
+        first_batch_elapsed, elapsed, row_count = time_load(library_journal, use_snapshot=False)
+        print(f'JSON:      {row_count} rows, first batch {first_batch_elapsed * 1000:7.1f}ms, all rows {elapsed:6.2f}s ({os.path.getsize(library_path) / 1e6:.0f} MB)')
+
+        video_files = [video_file for video_files in library_journal.iter_batches(use_snapshot=False) for video_file in video_files]
+        start_time = time.perf_counter()
+        library_journal.save_snapshot(video_files, library_journal.library_source_state())
+        print(f'Snapshot written in {time.perf_counter() - start_time:.2f}s ({os.path.getsize(library_journal.snapshot_path) / 1e6:.0f} MB)')
+
+        first_batch_elapsed, elapsed, row_count = time_load(library_journal, use_snapshot=True)
+        print(f'Snapshot:  {row_count} rows, first batch {first_batch_elapsed * 1000:7.1f}ms, all rows {elapsed:6.2f}s')
+
+        # What the front ends do with an up-to-date snapshot: show it as it is and decode the rows on screen
+        start_time = time.perf_counter()
+        with library_journal.open_rows() as snapshot:
+            screen_video_files = [snapshot[row] for row in range(len(snapshot) // 2, len(snapshot) // 2 + 50)]
+            assert len(screen_video_files) == 50
+            print(f'Snapshot open_rows() + decode a screenful (50 rows): {(time.perf_counter() - start_time) * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
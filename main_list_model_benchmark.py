@@ -0,0 +1,92 @@
+# GTK list model benchmark: the lazy VideoFileListModel vs. a Gio.ListStore with one item per record.
+#
+# For each model, builds a synthetic library of --count records, then times what the main loop does once a library
+# has been parsed (FileBrowserPanel used to build and splice an item per record, 5000 at a time; now it wraps the
+# list) and how long until the first screenful of items is in hand, and measures the resident memory that adds on
+# top of the records themselves. Scrolling is then simulated by holding one screenful of items at a time, as GTK
+# does for the rows it has bound, to show the lazy model's cache stays at a screenful. Each model runs in its own
+# process so neither sees memory the other has freed. Needs only Gio, not a display.
+#
+#   python main_list_model_benchmark.py --count 200000
+
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import gi
+gi.require_version('Gio', '2.0')
+
+from gi.repository import Gio
+
+from main_video_file_memory_benchmark import CHUNK_SIZE, make_video_file_json_chunk
+from mmm.core.video_file import VideoFile
+from mmm.video_file_list_model import FileBrowserListModelDataItem, VideoFileListModel
+
+SCREEN_ROWS = 60
+MODELS = ['list-store', 'lazy']
+
+
+def resident_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def run_model(model_name: str, count: int, seed: int):
+    rng = random.Random(seed)
+    video_files = list()
+    for first_index in range(0, count, CHUNK_SIZE):
+        video_file_dicts = json.loads(make_video_file_json_chunk(rng, first_index, min(CHUNK_SIZE, count - first_index), plot_chars=0))
+        video_files.extend(VideoFile(**video_file_dict) for video_file_dict in video_file_dicts)
+    gc.collect()
+    base_bytes = resident_bytes()
+
+    start_time = time.perf_counter()
+    if model_name == 'list-store':
+        list_model = Gio.ListStore()
+        for first_index in range(0, count, 5000):
+            list_items = [FileBrowserListModelDataItem.from_video_file(video_file) for video_file in video_files[first_index:first_index + 5000]]
+            list_model.splice(list_model.get_n_items(), 0, list_items)
+    else:
+        list_model = VideoFileListModel(video_files)
+    load_elapsed = time.perf_counter() - start_time
+    screen_items = [list_model.get_item(position) for position in range(min(SCREEN_ROWS, count))]
+    assert None not in screen_items
+    first_screen_elapsed = time.perf_counter() - start_time
+    gc.collect()
+    model_bytes = resident_bytes() - base_bytes
+
+    screen_count = 0
+    start_time = time.perf_counter()
+    for first_position in range(0, count, SCREEN_ROWS):
+        screen_count += 1
+        screen_items = [list_model.get_item(position) for position in range(first_position, min(first_position + SCREEN_ROWS, count))]
+        assert None not in screen_items
+    scroll_elapsed = time.perf_counter() - start_time
+    gc.collect()
+    cached_items = len(list_model.items) if model_name == 'lazy' else list_model.get_n_items()
+
+    print(f'{model_name:>10}: {count} rows  load {load_elapsed * 1000:8.1f}ms  first screen {first_screen_elapsed * 1000:8.1f}ms  '
+          f'RSS +{model_bytes / 1024 / 1024:6.1f}MB  scrolling {scroll_elapsed / screen_count * 1000:5.2f}ms per screen  items alive after scrolling {cached_items}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the lazy GTK list model with a Gio.ListStore')
+    parser.add_argument('--count', type=int, default=200_000)
+    parser.add_argument('--model', choices=MODELS, help='Run just this model, in this process')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.model is not None:
+        run_model(args.model, args.count, args.seed)
+        return
+    for model_name in MODELS:
+        subprocess.run([sys.executable, __file__, '--model', model_name, '--count', str(args.count), '--seed', str(args.seed)], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# Scrub stage benchmark: InlineScrubStage (scanner thread only) vs. ProcessPoolScrubStage.
+#
+# Feeds in-memory directory listings of generated release names straight into each stage, so only the CPU-bound
+# scrubbing and VideoFile construction is measured, not the disk.
+#
+#   python main_pipeline_benchmark.py --files 1000000 --workers 2,4,8 --batch-sizes 500,2000,10000
+
+from typing import List
+import argparse
+import time
+import types
+
+from mmm.core.filename_scrubber import DEFAULT_FILENAME_METADATA_TOKENS
+from mmm.core.scan_pipeline import InlineScrubStage, ProcessPoolScrubStage
+from mmm.core.scan_traversal import DirectoryListing
+
+from main_scrubber_benchmark import make_release_names
+
+
+IGNORE_EXTENSIONS = 'png,jpg,nfo,srt'
+
+
+def make_directory_listings(file_count: int, files_per_dir: int) -> List[DirectoryListing]:
+    release_names = make_release_names(file_count, unique_fraction=1.0, seed=1)
+    directory_listings = list()
+    for dir_index, first_file_index in enumerate(range(0, file_count, files_per_dir)):
+        file_entries = [types.SimpleNamespace(name=f'{release_name}.mkv') for release_name in release_names[first_file_index:first_file_index + files_per_dir]]
+        directory_listings.append(DirectoryListing(dir_path=f'/library/Folder {dir_index:06d}', subdir_paths=[], file_entries=file_entries))
+    return directory_listings
+
+
+def time_stage(scrub_stage, directory_listings: List[DirectoryListing]):
+    start_time = time.perf_counter()
+    results = [(directory_listing.dir_path, [video_file.file_path for video_file in video_files]) for directory_listing, video_files, _ignored_file_count in scrub_stage.process(directory_listings)]
+    return time.perf_counter() - start_time, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare thread-only and process-pool scrubbing')
+    parser.add_argument('--files', type=int, default=1_000_000)
+    parser.add_argument('--files-per-dir', type=int, default=5)
+    parser.add_argument('--workers', default='2,4,8')
+    parser.add_argument('--batch-sizes', default='500,2000,10000')
+    args = parser.parse_args()
+
+    print(f'Generating {args.files} files in directories of {args.files_per_dir}...')
+    directory_listings = make_directory_listings(args.files, args.files_per_dir)
+
+    # A fresh InlineScrubStage shares the process-wide memoized scrubber, so warm nothing up front: each name is unique
+    inline_elapsed, reference_results = time_stage(InlineScrubStage(IGNORE_EXTENSIONS, DEFAULT_FILENAME_METADATA_TOKENS), directory_listings)
+    print(f'{"thread only":>28}: {inline_elapsed:7.3f}s  {args.files / inline_elapsed:10.0f} files/s')
+
+    for worker_count in [int(worker_count) for worker_count in args.workers.split(',')]:
+        for batch_size in [int(batch_size) for batch_size in args.batch_sizes.split(',')]:
+            scrub_stage = ProcessPoolScrubStage(IGNORE_EXTENSIONS, DEFAULT_FILENAME_METADATA_TOKENS, max_workers=worker_count, batch_size=batch_size)
+            elapsed, results = time_stage(scrub_stage, directory_listings)
+            order_status = 'same results' if results == reference_results else 'RESULTS DIFFER'
+            print(f'{worker_count:>3} workers, batch {batch_size:>6}: {elapsed:7.3f}s  {args.files / elapsed:10.0f} files/s  {inline_elapsed / elapsed:5.2f}x  ({order_status})')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 import time
-from typing import List, Text, Tuple
-import dataclasses
-import json
-import os
-import os.path
-import re
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Text, Tuple
+import bisect
+import itertools
+import operator
 import sys
+import threading
 
 from PySide6 import QtCore
+from PySide6.QtCore import QAbstractTableModel
 from PySide6.QtCore import QEvent
 from PySide6.QtCore import QModelIndex
 from PySide6.QtCore import QSettings
@@ -15,6 +15,7 @@ from PySide6.QtCore import QSize
 from PySide6.QtCore import Qt
 from PySide6.QtCore import Signal
 from PySide6.QtCore import QThread
+from PySide6.QtCore import QTimer
 from PySide6.QtGui import QGuiApplication
 from PySide6.QtGui import QPainter
 from PySide6.QtGui import QPalette
@@ -26,8 +27,7 @@ from PySide6.QtWidgets import QMainWindow
 from PySide6.QtWidgets import QSplitter
 from PySide6.QtWidgets import QStyleOptionViewItem
 from PySide6.QtWidgets import QStyledItemDelegate
-from PySide6.QtWidgets import QTableWidget
-from PySide6.QtWidgets import QTableWidgetItem
+from PySide6.QtWidgets import QTableView
 from PySide6.QtWidgets import QTextEdit
 from PySide6.QtWidgets import QWidget
 from PySide6.QtWidgets import QVBoxLayout
@@ -36,112 +36,79 @@ from PySide6.QtWidgets import QPushButton
 from PySide6.QtWidgets import QHeaderView
 from PySide6.QtWidgets import QDialog
 from PySide6.QtWidgets import QLabel
-
-
-@dataclasses.dataclass
-class VideoFile:
-    file_path: Text = ''
-    scrubbed_file_name: Text = ''
-    scrubbed_file_year: Text = ''
-    imdb_tt: Text = ''
-    imdb_name: Text = ''
-    imdb_year: Text = ''
-    imdb_rating: Text = ''
-    imdb_genres: List[Text] = None
-    imdb_plot: Text = None
-    is_dirty: bool = False
+from PySide6.QtWidgets import QCheckBox
+from PySide6.QtWidgets import QMessageBox
+from PySide6.QtWidgets import QProgressBar
+from PySide6.QtWidgets import QInputDialog
+from PySide6.QtWidgets import QLineEdit
+
+from mmm.core.scan_engine import ScanEngine
+from mmm.core.scan_progress import ScanProgress
+from mmm.core.library_catalog import CatalogShard, LibraryCatalog, is_catalog_manifest, normalize_root_path
+from mmm.core.library_loader import LibraryLoader
+from mmm.core.library_reconcile import apply_library_diff, reconcile_scan
+from mmm.core.library_saver import LibrarySaveResult, LibrarySaver
+from mmm.core.library_search import MAX_INDEX_CATCH_UP_RECORDS, LibrarySearchIndex, index_library, search_tokens
+from mmm.core.library_sort import LibrarySortOrder, RowEdit
+from mmm.core.library_store import open_library
+from mmm.core.library_watch import LibraryEdit, LibraryEditLog, index_runs, is_same_or_under
+from mmm.core.video_file import VideoFile
 
 
 class FolderScanWorker(QThread):
-    progress_signal = Signal(str)
+    # Runs a ScanEngine on this QThread; progress arrives on the GUI thread through progress_signal.
+    # Keyword arguments are ScanEngine options (ignore_extensions, max_workers, use_process_pool, ...).
+    # With a library_catalog, a completed scan is merged into the folder's own shard here, off the GUI thread.
+    progress_signal = Signal(object)
 
-    def __init__(self, folder_path: Text, ignore_extensions: Text = None, filename_metadata_tokens: Text = None):
+    def __init__(self, folder_path: Text, library_catalog: LibraryCatalog = None, **scan_options):
         super().__init__()
-        self.folder_data = None
-        self.ignore_extensions = ignore_extensions or 'png,jpg,nfo,srt'
-        self.filename_metadata_tokens = filename_metadata_tokens or '480p,720p,1080p,bluray,hevc,x265,x264,web,webrip,web-dl,repack,proper,extended,remastered,dvdrip,dvd,hdtv,xvid,hdrip,brrip,dvdscr,pdtv'
         self.folder_path = folder_path
-        self.keep_scanning = True
-
-    def stop_scanning(self):
-        self.keep_scanning = False
-
-    @staticmethod
-    def scrub_video_file_name(file_name: Text, filename_metadata_tokens: Text) -> Tuple[Text, Text]:
-        year = ''
-
-        match = re.match(r'((.*)\((\d{4})\))', file_name)
-        if match:
-            file_name = match.group(2)
-            year = match.group(3)
-            scrubbed_file_name_list = file_name.replace('.', ' ').split()
+        self.scan_engine = ScanEngine(folder_path, progress_sink=self.progress_signal.emit, **scan_options)
+        self.library_catalog = library_catalog
+        self.catalog_change_set = None
+        self.catalog_error: Text = None
 
-        else:
-            metadata_token_list = [token.lower().strip() for token in filename_metadata_tokens.split(',')]
-            file_name_parts = file_name.replace('.', ' ').split()
-            scrubbed_file_name_list = list()
+    @property
+    def folder_data(self) -> List[VideoFile]:
+        return self.scan_engine.folder_data
 
-            for file_name_part in file_name_parts:
-                file_name_part = file_name_part.lower()
+    def stop_scanning(self):
+        self.scan_engine.stop_scanning()
 
-                if file_name_part in metadata_token_list:
-                    break
-                scrubbed_file_name_list.append(file_name_part)
+    def pause_scanning(self):
+        self.scan_engine.pause_scanning()
 
-            if scrubbed_file_name_list:
-                match = re.match(r'\(?(\d{4})\)?', scrubbed_file_name_list[-1])
-                if match:
-                    year = match.group(1)
-                    del scrubbed_file_name_list[-1]
+    def resume_scanning(self):
+        self.scan_engine.resume_scanning()
 
-        scrubbed_file_name = ' '.join(scrubbed_file_name_list).strip()
-        scrubbed_file_name = re.sub(' +', ' ', scrubbed_file_name)
-        return scrubbed_file_name, year
+    @property
+    def is_paused(self) -> bool:
+        return self.scan_engine.is_paused
 
     def run(self):
-        print(f'FolderScanWorker: Begin processing directory "{self.folder_path}"')
-
-        ignore_extensions_list = [ext.lower().strip() for ext in self.ignore_extensions.split(',')]
-
-        self.folder_data = list()
-
-        for dir_path, dirs, files in os.walk(self.folder_path):
-            for filename in files:
-                if self.keep_scanning is False:
-                    print(f'FolderScanWorker: Stopping scanning')
-                    return
-
-                print(f'FolderScanWorker: Processing file "{filename}"')
-                self.progress_signal.emit(f'FolderScanWorker: Processing file "{filename}"')
-                time.sleep(1.0)
+        if self.scan_engine.run() and self.library_catalog is not None:
+            try:
+                self.catalog_change_set = self.library_catalog.merge_scan(self.folder_path, self.scan_engine.folder_data, recorded_identity=self.scan_engine.recorded_file_identity)
+            except (OSError, ValueError) as e:
+                print(f'FolderScanWorker: Unable to merge "{self.folder_path}" into its catalog shard: {e}')
+                self.catalog_error = str(e)
 
-                file_path = os.path.join(dir_path, filename)
-                filename_parts = os.path.splitext(filename)
-                filename_no_extension = filename_parts[0]
-                filename_extension = filename_parts[1]
-                if filename_extension.startswith('.'):
-                    filename_extension = filename_extension[1:]
 
-                if filename_extension.lower() in ignore_extensions_list:
-                    continue
+class LibraryLoadWorker(QThread):
+    # Runs a LibraryLoader on this QThread; each batch of VideoFiles arrives on the GUI thread through batch_signal,
+    # and finished is emitted once it has loaded everything, been cancelled or failed
+    batch_signal = Signal(object)
 
-                scrubbed_video_file_name, year = self.scrub_video_file_name(filename_no_extension, self.filename_metadata_tokens)
-                video_file = VideoFile(file_path=file_path, scrubbed_file_name=scrubbed_video_file_name, scrubbed_file_year=year)
-                self.folder_data.append(video_file)
-
-        print(f'FolderScanWorker: End processing directory "{self.folder_path}"')
+    def __init__(self, library_path: Text):
+        super().__init__()
+        self.library_loader = LibraryLoader(library_path, batch_sink=self.batch_signal.emit)
 
+    def cancel_loading(self):
+        self.library_loader.cancel()
 
-# def load_video_file_data(video_file_path: str) -> List[VideoFile]:
-#     with open(video_file_path, encoding='utf8') as f:
-#         video_files_json = json.load(f)
-#
-#     video_files_data = list()
-#     for video_file_dict in video_files_json:
-#         video_file = VideoFile(**video_file_dict)
-#         video_files_data.append(video_file)
-#
-#     return video_files_data
+    def run(self):
+        self.library_loader.load()
 
 
 class CancellableProgressDialog(QDialog):
@@ -149,10 +116,16 @@ class CancellableProgressDialog(QDialog):
         super().__init__()
 
         self.message_label = QLabel(initial_message)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        self.progress_bar.hide()
+        self.pause_button = QPushButton('Pause')
         self.cancel_button = QPushButton('Cancel')
 
         self.layout = QVBoxLayout()
         self.layout.addWidget(self.message_label)
+        self.layout.addWidget(self.progress_bar)
+        self.layout.addWidget(self.pause_button)
         self.layout.addWidget(self.cancel_button)
         self.setLayout(self.layout)
 
@@ -163,6 +136,318 @@ class CancellableProgressDialog(QDialog):
         self.message_label.setText(message)
 
 
+class VideoFileTableModel(QAbstractTableModel):
+    # The library table, read straight from a list of VideoFiles (or anything indexable like one, such as a
+    # LibrarySnapshot). Nothing is kept per row: the view only asks for the cells it paints, so a million records
+    # cost no more to show than a thousand. The model shares the list with its owner, who changes it and then tells
+    # the model what changed, and every change reaches the view as whole ranges of rows, never cell by cell.
+    #
+    # Sorted by a column, rows map to list positions through a LibrarySortOrder, which keeps the sort keys; the list
+    # itself keeps its order. Searched, only the matching records are shown: search_positions holds their list
+    # positions in the order of the rows, from a LibrarySearchIndex kept up to date with every edit. The index is
+    # made on a worker thread whenever the model is given a list, never while a search is typed; until it is ready
+    # (indexing_signal says when) every record is shown. row_count is how many rows the view has been told about;
+    # it only catches up with the list in the begin/end calls that announce the difference, and while they are made
+    # the rows the view has been told about so far are read from announced_positions.
+    column_headers = ['Title', ' Year ', ' Rating ', ' IMDB ']
+    column_getters = [operator.attrgetter(name) for name in ('scrubbed_file_name', 'scrubbed_file_year', 'imdb_rating', 'imdb_tt')]
+    max_announced_runs = 16  # an edit scattered over more runs of rows than this is announced as one layout change
+    indexing_signal = Signal(bool)  # True when a search index starts being made, False once it can be searched
+    search_index_made_signal = Signal(int, object)  # emitted on the worker thread, to hand an index to the GUI thread
+
+    def __init__(self, parent: QtCore.QObject = None):
+        super().__init__(parent)
+        self.video_files: Sequence[VideoFile] = list()
+        self.row_count = 0
+        self.list_count = 0  # how long the list was when the model was last told about it
+        self.sort_order: LibrarySortOrder = None
+        self.sort_column = -1
+        self.sort_key_caches: Dict[int, Dict[Text, Text]] = dict()  # column -> sort key by text, kept across sorts and libraries
+        self.search_index: LibrarySearchIndex = None
+        self.search_index_edit_log: LibraryEditLog = None  # the edits made while the search index is being made
+        self.search_index_count = 0  # how many indexes have been started: only the last one is wanted
+        self.search_index_made_signal.connect(self.on_search_index_made)
+        self.search_query = ''
+        self.search_positions: List[int] = None  # None while no search is shown
+        self.announced_positions: List[int] = None  # the list position of each row announced so far (-1 for a removed record) while an edit is announced
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.row_count
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.column_headers)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        position = self.position(index.row())
+        if position < 0:
+            # Only while the removal of its record is being announced
+            return None
+        return self.column_getters[index.column()](self.video_files[position])
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.column_headers[section]
+        return None
+
+    def shown_count(self) -> int:
+        # How many rows there are once the view has been told everything (row_count may still lag behind)
+        if self.search_positions is not None:
+            return len(self.search_positions)
+        return len(self.video_files) if self.sort_order is None else len(self.sort_order)
+
+    def position(self, row: int) -> int:
+        # The list position of the record shown in row
+        if self.announced_positions is not None:
+            return self.announced_positions[row]
+        if self.search_positions is not None:
+            return self.search_positions[row]
+        return row if self.sort_order is None else self.sort_order.position(row)
+
+    def shown_positions(self) -> Sequence[int]:
+        # The list position of every row, once the view has been told everything; not to be changed
+        if self.search_positions is not None:
+            return self.search_positions
+        if self.sort_order is not None:
+            return self.sort_order.positions[::-1] if self.sort_order.descending else self.sort_order.positions
+        return range(self.list_count)
+
+    def rows_of(self, positions: Iterable[int]) -> Dict[int, int]:
+        # List position -> row, for a few positions; a record a search doesn't show has none
+        if self.search_positions is not None:
+            rows = dict()
+            for position in positions:
+                row = self.searched_row(position)
+                if row is not None:
+                    rows[position] = row
+            return rows
+        if self.sort_order is not None:
+            return self.sort_order.rows_of(positions)
+        return {position: position for position in positions}
+
+    def searched_row(self, position: int) -> Optional[int]:
+        # The row of a list position among search_positions, by binary search: unsorted they are ascending, sorted
+        # they are in the order's rows. None for a record the search doesn't show.
+        if self.sort_order is not None:
+            return self.sort_order.view_index(self.search_positions, position)
+        row = bisect.bisect_left(self.search_positions, position)
+        return row if row < len(self.search_positions) and self.search_positions[row] == position else None
+
+    def make_sort_order(self, column: int, descending: bool) -> LibrarySortOrder:
+        if column < 0:
+            return None
+        return LibrarySortOrder(self.video_files, self.column_getters[column], descending=descending, key_cache=self.sort_key_caches.setdefault(column, dict()))
+
+    def change_layout(self, change: Callable[[], None]):
+        # Rows are reordered, or a search shows different ones: selected rows (and any other persistent index)
+        # follow their records to their new rows, or are dropped if their record is no longer shown
+        self.layoutAboutToBeChanged.emit()
+        persistent_indexes = self.persistentIndexList()
+        persistent_positions = [self.position(index.row()) for index in persistent_indexes]
+        change()
+        if persistent_indexes:
+            rows = self.rows_of(persistent_positions)
+            self.changePersistentIndexList(persistent_indexes, [self.index(rows[position], index.column()) if position in rows else QModelIndex() for index, position in zip(persistent_indexes, persistent_positions)])
+        self.layoutChanged.emit()
+
+    def sort(self, column: int, order: Qt.SortOrder = Qt.AscendingOrder):
+        # Called by the view when a header is clicked; column -1 goes back to the order of the list
+        descending = order == Qt.DescendingOrder
+
+        def change_sort_order():
+            if column == self.sort_column and self.sort_order is not None:
+                self.sort_order.descending = descending
+            else:
+                self.sort_order = self.make_sort_order(column, descending)
+            self.sort_column = column
+            if self.search_positions is not None:
+                self.search_positions = self.searched_positions()
+
+        self.change_layout(change_sort_order)
+
+    def search(self, query: Text):
+        # Shows just the records matching query, as LibrarySearchIndex matches them; a query with no words shows
+        # them all again
+        def change_search():
+            self.search_query = query
+            self.search_positions = self.searched_positions()
+            self.row_count = self.shown_count()
+
+        self.change_layout(change_search)
+
+    def searched_positions(self) -> List[int]:
+        # The list positions search_query matches, in the order of the rows, or None if there is nothing to search for
+        # or no search index yet
+        if self.search_index is None or not search_tokens(self.search_query):
+            return None
+        positions = self.search_index.search(self.search_query)
+        return positions if self.sort_order is None else self.sort_order.view_positions(positions)
+
+    def start_indexing(self):
+        # Makes the search index of the list on a worker thread, from a copy of it if it is a list; edits made to
+        # the list meanwhile are logged, to be folded in once the index is back on the GUI thread
+        self.search_index = None
+        self.search_index_edit_log = LibraryEditLog(len(self.video_files))
+        self.search_index_count += 1
+        video_files = list(self.video_files) if isinstance(self.video_files, list) else self.video_files
+        threading.Thread(target=self.run_search_indexer, args=(self.search_index_count, video_files), daemon=True).start()
+        self.indexing_signal.emit(True)
+
+    def run_search_indexer(self, search_index_number: int, video_files: Sequence[VideoFile]):
+        start_time = time.perf_counter()
+        search_index = index_library(video_files)
+        print(f'VideoFileTableModel: Indexed {len(video_files)} records for search in {time.perf_counter() - start_time:.2f}s')
+        self.search_index_made_signal.emit(search_index_number, search_index)
+
+    def on_search_index_made(self, search_index_number: int, search_index: LibrarySearchIndex):
+        if search_index_number != self.search_index_count:
+            # Made for a list the model has since been given another one in place of
+            return
+        library_edit = self.search_index_edit_log.library_edit(self.video_files)
+        self.search_index_edit_log = None
+        if len(library_edit.renamed_indices) + len(library_edit.added) > MAX_INDEX_CATCH_UP_RECORDS:
+            # The list changed too much while it was indexed
+            self.start_indexing()
+            return
+
+        search_index.video_files = self.video_files
+        if library_edit.removed_indices or library_edit.renamed_indices or library_edit.added:
+            search_index.apply_library_edit(library_edit)
+        self.search_index = search_index
+        if search_tokens(self.search_query):
+            self.search(self.search_query)
+        self.indexing_signal.emit(False)
+
+    def set_video_files(self, video_files: Sequence[VideoFile]):
+        # A different library altogether: one reset, after which the view fetches just the rows on screen. It is
+        # shown sorted the way the last one was, and searched the same way once its search index is made.
+        self.beginResetModel()
+        self.video_files = video_files if video_files is not None else list()
+        if self.sort_order is not None:
+            self.sort_order = self.make_sort_order(self.sort_column, self.sort_order.descending)
+        self.start_indexing()
+        self.search_positions = None
+        self.list_count = len(self.video_files)
+        self.row_count = self.shown_count()
+        self.endResetModel()
+
+    def replace_video_files(self, video_files: Sequence[VideoFile]):
+        # The same records in another container (a read-only snapshot copied into a list to be edited): no row
+        # changes, so the view isn't told anything
+        self.video_files = video_files
+        if self.sort_order is not None:
+            self.sort_order.video_files = video_files
+        if self.search_index is not None:
+            self.search_index.video_files = video_files
+
+    def rows_appended(self):
+        # The list has grown at the end (a batch loaded or scanned): unsorted, one insertion for all of it; sorted,
+        # each new record goes in at its place in the order
+        added_count = len(self.video_files) - self.list_count
+        if added_count > 0:
+            self.apply_library_edit(LibraryEdit(removed_indices=list(), renamed_indices=list(), added=self.video_files[-added_count:]))
+
+    def rows_changed(self, rows: Iterable[int]):
+        # Records replaced or edited in place: one dataChanged per run of consecutive rows
+        last_column = len(self.column_headers) - 1
+        for first_row, last_row in index_runs(sorted(rows)):
+            self.dataChanged.emit(self.index(first_row, 0), self.index(last_row, last_column), [Qt.DisplayRole])
+
+    def refresh(self):
+        # Everything may have changed in place (IMDB details filled in, say), but no rows came or went
+        if self.row_count:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.row_count - 1, len(self.column_headers) - 1), [Qt.DisplayRole])
+
+    def apply_library_edit(self, library_edit: LibraryEdit):
+        # Mirror an edit already made to the list: runs of removed rows last first (so earlier rows keep their
+        # numbers), then runs of inserted rows first first, then the rows that changed in place. Unsorted, the
+        # inserted rows are everything added, in one run at the end.
+        #
+        # Between those calls the view must find the rows as the calls so far describe them, not as the list now
+        # is: announced_positions starts as the rows after the edit with the inserted ones taken out and the removed
+        # ones put back (as -1, their records being gone), and each call brings it a run forward. Rows only added at
+        # the end (a batch loaded) need none of that, and an edit touching rows all over (a big rescan, sorted) is
+        # told as one layout change rather than run by run.
+        if self.search_index is not None:
+            if self.search_positions is None and len(library_edit.renamed_indices) + len(library_edit.added) > MAX_INDEX_CATCH_UP_RECORDS:
+                # Too many records to index here (a scan streaming in, say): index the list again off this thread
+                self.start_indexing()
+            else:
+                self.search_index.apply_library_edit(library_edit)
+        elif self.search_index_edit_log is not None:
+            self.search_index_edit_log.add(library_edit)
+        if self.sort_order is None:
+            row_edit = RowEdit.from_library_edit(library_edit, len(self.video_files))
+        else:
+            row_edit = self.sort_order.apply_library_edit(library_edit)
+        if self.search_positions is not None:
+            # Searched: the rows are the matches before and after, with the old ones renumbered past the removals
+            old_positions = self.search_positions
+            position_map = LibrarySortOrder.position_map(library_edit.removed_indices, self.list_count)
+            if position_map is not None:
+                old_positions = list(map(position_map.__getitem__, old_positions))
+            self.search_positions = self.searched_positions()
+            row_edit = RowEdit.between(old_positions, self.search_positions, library_edit.renamed_indices)
+        self.list_count = len(self.video_files)
+
+        removed_runs = index_runs(row_edit.removed_rows)
+        inserted_runs = index_runs(row_edit.inserted_rows)
+        if not removed_runs and (not inserted_runs or inserted_runs[0][0] == self.row_count):
+            for first_row, last_row in inserted_runs:
+                self.beginInsertRows(QModelIndex(), first_row, last_row)
+                self.row_count = last_row + 1
+                self.endInsertRows()
+        elif len(removed_runs) + len(inserted_runs) > self.max_announced_runs:
+            self.change_layout_for_edit(row_edit)
+        else:
+            shown_positions = self.shown_positions()
+            is_kept_row = bytearray(b'\x01') * len(shown_positions)
+            for row in row_edit.inserted_rows:
+                is_kept_row[row] = 0
+            announced_positions = list(itertools.compress(shown_positions, is_kept_row))
+            for first_row, last_row in removed_runs:
+                announced_positions[first_row:first_row] = [-1] * (last_row - first_row + 1)
+            self.announced_positions = announced_positions
+            try:
+                for first_row, last_row in reversed(removed_runs):
+                    self.beginRemoveRows(QModelIndex(), first_row, last_row)
+                    del announced_positions[first_row:last_row + 1]
+                    self.row_count = len(announced_positions)
+                    self.endRemoveRows()
+                for first_row, last_row in inserted_runs:
+                    self.beginInsertRows(QModelIndex(), first_row, last_row)
+                    announced_positions[first_row:first_row] = shown_positions[first_row:last_row + 1]
+                    self.row_count = len(announced_positions)
+                    self.endInsertRows()
+            finally:
+                self.announced_positions = None
+        self.rows_changed(row_edit.changed_rows)
+
+    def change_layout_for_edit(self, row_edit: RowEdit):
+        # An edit's rows told all at once: every kept row moves to its row after the edit, which is the one among
+        # the rows that weren't inserted in the same place as it is among the rows that weren't removed. Persistent
+        # indexes of removed rows are dropped.
+        self.layoutAboutToBeChanged.emit()
+        persistent_indexes = self.persistentIndexList()
+        self.row_count = self.shown_count()
+        if persistent_indexes:
+            is_kept_row = bytearray(b'\x01') * self.row_count
+            for row in row_edit.inserted_rows:
+                is_kept_row[row] = 0
+            kept_rows = list(itertools.compress(range(self.row_count), is_kept_row))
+            removed_rows = set(row_edit.removed_rows)
+            new_indexes = list()
+            for index in persistent_indexes:
+                old_row = index.row()
+                if old_row in removed_rows:
+                    new_indexes.append(QModelIndex())
+                else:
+                    new_indexes.append(self.index(kept_rows[old_row - bisect.bisect_left(row_edit.removed_rows, old_row)], index.column()))
+            self.changePersistentIndexList(persistent_indexes, new_indexes)
+        self.layoutChanged.emit()
+
+
 class VerticalLineDelegate(QStyledItemDelegate):
     def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
         # Let the base class do the rendering
@@ -178,6 +463,9 @@ class VerticalLineDelegate(QStyledItemDelegate):
 
 
 class MainWindow(QMainWindow):
+    # LibrarySaver reports on its own thread; emitting this hands the result to the GUI thread
+    library_saved_signal = Signal(object)
+
     def __init__(self):
         super().__init__()
 
@@ -187,38 +475,56 @@ class MainWindow(QMainWindow):
         # The right side of the splitter is a dummy widget for now
         self.textedit = QTextEdit()
 
-        # The left side of the splitter is a table
-        self.table_widget = QTableWidget()
-
-        # Set up table columns
-        column_headers = ['Title', ' Year ', ' Rating ', ' IMDB ']
-        self.table_widget.setColumnCount(len(column_headers))
-        self.table_widget.setHorizontalHeaderLabels(column_headers)
-        self.table_widget.setAlternatingRowColors(True)
+        # The left side of the splitter is a table view over the library, with no items of its own
+        self.table_model = VideoFileTableModel(self)
+        self.table_view = QTableView()
+        self.table_view.setModel(self.table_model)
+        self.table_view.setAlternatingRowColors(True)
 
-        header = self.table_widget.horizontalHeader()
+        # The narrow columns are sized once from the font: ResizeToContents would measure rows again on every change
+        header = self.table_view.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
-        header.setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
-        header.setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
-        header.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents)
-
-        self.table_widget.setColumnWidth(0, 200)
-
-        # Configure table appearance and behaviour
-        self.table_widget.verticalHeader().setVisible(False)
-        self.table_widget.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
-        self.table_widget.setShowGrid(False)
-        self.table_widget.setItemDelegate(VerticalLineDelegate(self.table_widget))
-        self.table_widget.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
-        self.table_widget.selectRow(0)
-        self.table_widget.setFocus()
+        font_metrics = self.table_view.fontMetrics()
+        for column, widest_text in ((1, ' 0000 '), (2, ' Rating '), (3, ' tt00000000 ')):
+            header.setSectionResizeMode(column, QHeaderView.ResizeMode.Fixed)
+            self.table_view.setColumnWidth(column, font_metrics.horizontalAdvance(widest_text) + 16)
+
+        self.table_view.setColumnWidth(0, 200)
+
+        # Configure table appearance and behaviour; every row is the same height, so none has to be measured
+        self.table_view.verticalHeader().setVisible(False)
+        self.table_view.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table_view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table_view.setShowGrid(False)
+        self.table_view.setItemDelegate(VerticalLineDelegate(self.table_view))
+        self.table_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        # Clicking a header sorts by that column through the model (VideoFileTableModel.sort); a third click goes back
+        # to the library's own order
+        header.setSortIndicatorClearable(True)
+        header.setSortIndicator(-1, Qt.AscendingOrder)
+        self.table_view.setSortingEnabled(True)
+        self.table_view.selectRow(0)
+        self.table_view.setFocus()
 
         # Set up callbacks
-        self.table_widget.installEventFilter(self)
-        self.table_widget.selectionModel().selectionChanged.connect(self.selection_changed)
+        self.table_view.installEventFilter(self)
+        self.table_view.selectionModel().selectionChanged.connect(self.selection_changed)
+
+        # Above the table, a search box that filters it as you type (VideoFileTableModel.search)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('Search titles and file paths')
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.search_text_changed)
+        self.table_model.indexing_signal.connect(self.on_search_indexing)
+        self.library_vbox_layout = QVBoxLayout()
+        self.library_vbox_layout.setContentsMargins(0, 0, 0, 0)
+        self.library_vbox_layout.addWidget(self.search_edit)
+        self.library_vbox_layout.addWidget(self.table_view)
+        self.library_widget = QWidget()
+        self.library_widget.setLayout(self.library_vbox_layout)
 
         self.splitter = QSplitter(Qt.Horizontal)
-        self.splitter.addWidget(self.table_widget)
+        self.splitter.addWidget(self.library_widget)
         self.splitter.addWidget(self.textedit)
         self.splitter.setSizes([200, 100])
 
@@ -235,6 +541,8 @@ class MainWindow(QMainWindow):
         self.button_save_json = QPushButton("Save JSON")
         self.hbox_layout.addWidget(self.button_save_json)
         self.button_save_json.pressed.connect(self.save_json_clicked)
+        self.autosave_checkbox = QCheckBox("Autosave")
+        self.hbox_layout.addWidget(self.autosave_checkbox)
         self.hbox_layout.addSpacing(20)
         self.button_show_progress = QPushButton("Show Progress")
         self.hbox_layout.addWidget(self.button_show_progress)
@@ -267,14 +575,52 @@ class MainWindow(QMainWindow):
             self.move(pos)  # Does not seem to work on Wayland
 
         self.progress_dialog = CancellableProgressDialog('Initial Text!')
+        self.progress_dialog.pause_button.pressed.connect(self.do_pause_scanning)
         self.progress_dialog.cancel_button.pressed.connect(self.do_stop_scanning)
         self.folder_scan_worker = None
+        self.library_store = None
+
+        # With a catalog open, one shard (scan root) is browsed at a time; the others stay on disk
+        self.library_catalog: LibraryCatalog = None
+        self.catalog_shard: CatalogShard = None
+        self.loading_catalog_shard: Tuple[LibraryCatalog, CatalogShard] = (None, None)
+
+        # Loading shows its own progress dialog, with a progress bar and no pause
+        self.load_progress_dialog = CancellableProgressDialog('Loading...')
+        self.load_progress_dialog.progress_bar.show()
+        self.load_progress_dialog.pause_button.hide()
+        self.load_progress_dialog.cancel_button.pressed.connect(self.do_cancel_loading)
+        self.library_load_worker: LibraryLoadWorker = None
+        self.cancelled_load_workers: List[LibraryLoadWorker] = list()  # kept alive until their threads finish
+        self.loading_video_file_data: List[VideoFile] = None
+
+        # Saves are written by a worker thread; edits made while one runs go into the next
+        self.library_saver = LibrarySaver(completion_sink=self.library_saved_signal.emit)
+        self.library_saved_signal.connect(self.on_library_saved)
+        self.library_saver.start()
+        self.unsaved_removed_file_paths: List[Text] = list()
+
+        # Autosave writes just the edited records of a loaded library, every autosave_interval_seconds while enabled
+        self.autosave_interval_seconds = int(settings.value("autosave_interval_seconds", 60))
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.setInterval(self.autosave_interval_seconds * 1000)
+        self.autosave_timer.timeout.connect(self.on_autosave_timer)
+        self.autosave_checkbox.setText(f"Autosave ({self.autosave_interval_seconds}s)")
+        self.autosave_checkbox.toggled.connect(self.autosave_toggled)
+        self.autosave_checkbox.setChecked(settings.value("autosave_enabled", False, type=bool))
 
     def closeEvent(self, event):
         print('Main window closing!')
         settings = QSettings('MiniMediaManager', 'MiniMediaManager')
         settings.setValue("pos", self.pos())
         settings.setValue("size", self.size())
+        settings.setValue("autosave_enabled", self.autosave_checkbox.isChecked())
+        settings.setValue("autosave_interval_seconds", self.autosave_interval_seconds)
+
+        if self.autosave_checkbox.isChecked():
+            self.autosave_library()
+        if not self.library_saver.wait_until_idle(timeout=30.0):
+            print('Main window closing with a save still running!')
 
     # def moveEvent(self, event: QMoveEvent):
     #     print("moveEvent: x=`{}`, y=`{}`".format(event.pos().x(), event.pos().y()))
@@ -293,7 +639,7 @@ class MainWindow(QMainWindow):
         # print(f"deselected: {deselected_rows}")
 
     def eventFilter(self, watched: QtCore.QObject, event: QEvent):
-        if event.type() == QEvent.KeyPress and watched is self.table_widget:
+        if event.type() == QEvent.KeyPress and watched is self.table_view:
             key = event.key()
             if key == Qt.Key_Escape:
                 print('escape')
@@ -301,33 +647,131 @@ class MainWindow(QMainWindow):
                 print('return')
         return QWidget.eventFilter(self, watched, event)
 
-    def update_table_widget(self):
-        if not self.video_file_data:
-            return
+    def search_text_changed(self, text: Text):
+        self.table_model.search(text)
+        self.show_search_status()
 
-        # column_headers = ['Title', ' Year ', ' Rating ', ' IMDB ']
-        self.table_widget.setRowCount(len(self.video_file_data))
-        for row_index, video_file in enumerate(self.video_file_data):
-            self.table_widget.setItem(row_index, 0, QTableWidgetItem(video_file.scrubbed_file_name))
-            self.table_widget.setItem(row_index, 1, QTableWidgetItem(video_file.scrubbed_file_year))
-            self.table_widget.setItem(row_index, 2, QTableWidgetItem(video_file.imdb_rating))
-            self.table_widget.setItem(row_index, 2, QTableWidgetItem(video_file.imdb_tt))
+    def show_search_status(self):
+        if self.table_model.search_positions is not None:
+            self.statusBar().showMessage(f'{len(self.table_model.search_positions)} of {len(self.table_model.video_files)} records match "{self.table_model.search_query}"')
+        else:
+            self.statusBar().clearMessage()
+
+    def on_search_indexing(self, is_indexing: bool):
+        # The search box can't be used until the library has been indexed for search
+        self.search_edit.setEnabled(not is_indexing)
+        self.search_edit.setPlaceholderText('Indexing…' if is_indexing else 'Search titles and file paths')
+        if is_indexing:
+            self.statusBar().showMessage(f'Indexing {len(self.table_model.video_files)} records for search…')
+        else:
+            self.show_search_status()
 
     def load_json_clicked(self):
         dialog = QFileDialog(self)
         dialog.setFileMode(QFileDialog.FileMode.ExistingFile)
-        dialog.setNameFilter("*.json")
+        dialog.setNameFilter("Libraries (*.json *.ndjson *.db *.sqlite *.sqlite3)")
         if dialog.exec() and (selected_files := dialog.selectedFiles()):
-            self.video_file_path = selected_files[0]
-            with open(self.video_file_path, encoding='utf8') as f:
-                video_files_json = json.load(f)
+            if is_catalog_manifest(selected_files[0]):
+                self.open_catalog(selected_files[0])
+            else:
+                self.load_library(selected_files[0])
+
+    def open_catalog(self, catalog_path: Text):
+        # Only the manifest is read here; the chosen shard is then loaded like any other library
+        try:
+            library_catalog = LibraryCatalog.load(catalog_path)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Open Failed", f'Unable to open catalog "{catalog_path}":\n{e}')
+            return
+        if not library_catalog.shards:
+            QMessageBox.information(self, "Empty Catalog", f'"{catalog_path}" has no roots yet: scan a folder to add one')
+            self.library_catalog, self.catalog_shard = library_catalog, None
+            return
 
-            self.video_file_data = list()
-            for video_file_dict in video_files_json:
-                video_file = VideoFile(**video_file_dict)
-                self.video_file_data.append(video_file)
+        # Probing is bounded: a root that doesn't answer in time is shown as offline, and can still be browsed
+        online_roots = library_catalog.online_roots(timeout=0.5)
+        shards = list(library_catalog.shards.values())
+        shard_labels = list()
+        for shard in shards:
+            last_scan = time.strftime('%Y-%m-%d %H:%M', time.localtime(shard.last_scan_time)) if shard.last_scan_time else 'never'
+            shard_labels.append(f'{shard.root_path}  ({shard.video_file_count} videos, scanned {last_scan}){"" if online_roots[shard.root_path] else "  [offline]"}')
+
+        shard_label, ok = QInputDialog.getItem(self, "Browse Catalog", "Root:", shard_labels, 0, False)
+        if ok:
+            shard = shards[shard_labels.index(shard_label)]
+            self.load_library(library_catalog.shard_path(shard), library_catalog, shard)
+
+    def load_library(self, library_path: Text, library_catalog: LibraryCatalog = None, catalog_shard: CatalogShard = None):
+        # Parse on a worker thread while the current library stays on screen, then swap the new one in; cancelling
+        # or a failed load leaves the current library (and where it saves to) as it was
+        self.do_cancel_loading()
+
+        self.loading_catalog_shard = (library_catalog, catalog_shard)
+        self.loading_video_file_data = list()
+        self.library_load_worker = LibraryLoadWorker(library_path)
+        self.library_load_worker.batch_signal.connect(self.on_library_batch_loaded)
+        self.library_load_worker.finished.connect(self.on_library_load_finished)
+
+        self.load_progress_dialog.message_label.setText(f'Loading "{library_path}"...')
+        self.load_progress_dialog.progress_bar.setValue(0)
+        self.load_progress_dialog.show()
+        self.library_load_worker.start()
+
+    def on_library_batch_loaded(self, video_files: List[VideoFile]):
+        if self.sender() is not self.library_load_worker:
+            # A batch from a load that has since been cancelled
+            return
+        self.loading_video_file_data.extend(video_files)
+        library_loader = self.library_load_worker.library_loader
+        self.load_progress_dialog.message_label.setText(f'Loading "{library_loader.library_path}": {len(self.loading_video_file_data)} videos')
+        self.load_progress_dialog.progress_bar.setValue(int(library_loader.load_progress.fraction * 1000))
+
+    def on_library_load_finished(self):
+        library_load_worker = self.sender()
+        if library_load_worker is not self.library_load_worker:
+            if library_load_worker in self.cancelled_load_workers:
+                self.cancelled_load_workers.remove(library_load_worker)
+            return
+        library_loader = library_load_worker.library_loader
+        self.library_load_worker = None
+        self.load_progress_dialog.hide()
 
-            self.update_table_widget()
+        if library_loader.is_cancelled:
+            self.loading_video_file_data = None
+            return
+        if library_loader.error is not None:
+            self.loading_video_file_data = None
+            QMessageBox.warning(self, "Load Failed", f'Unable to load "{library_loader.library_path}":\n{library_loader.error}')
+            return
+
+        # An up-to-date snapshot is shown as it is, without being loaded (see LibraryLoader)
+        loaded_video_file_data = library_loader.video_file_rows if library_loader.video_file_rows is not None else self.loading_video_file_data
+        if self.video_file_data is not None and library_loader.library_path == self.video_file_path:
+            # The library on screen loaded again: update just the rows that differ, keeping scroll position and selection
+            self.table_model.apply_library_edit(apply_library_diff(self.editable_video_file_data(), loaded_video_file_data))
+        else:
+            self.video_file_data = loaded_video_file_data
+            self.table_model.set_video_files(self.video_file_data)
+        self.video_file_path = library_loader.library_path
+        self.library_store = library_loader.library_store
+        self.library_catalog, self.catalog_shard = self.loading_catalog_shard
+        self.loading_video_file_data = None
+        self.unsaved_removed_file_paths = list()
+
+    def editable_video_file_data(self) -> List[VideoFile]:
+        # A library shown straight from its snapshot can't be edited; the first edit copies it into a list
+        if not isinstance(self.video_file_data, list):
+            self.video_file_data = list(self.video_file_data)
+            self.table_model.replace_video_files(self.video_file_data)
+        return self.video_file_data
+
+    def do_cancel_loading(self):
+        if self.library_load_worker is not None:
+            self.library_load_worker.cancel_loading()
+            self.cancelled_load_workers.append(self.library_load_worker)
+            self.library_load_worker = None
+            self.loading_video_file_data = None
+        self.load_progress_dialog.hide()
 
     def save_json_clicked(self):
         if not self.video_file_path:
@@ -345,11 +789,51 @@ class MainWindow(QMainWindow):
             if dialog.exec() and (selected_files := dialog.selectedFiles()):
                 self.video_file_path = selected_files[0]
 
-        if self.video_file_path:
-            with open(self.video_file_path, 'w', encoding='utf8') as f:
-                json_list = [dataclasses.asdict(video_file) for video_file in self.video_file_data]
-                json_str = json.dumps(json_list, indent=4)
-                f.write(json_str)
+        if self.video_file_path and self.video_file_data is not None:
+            if self.library_store is not None and self.library_store.library_path == self.video_file_path:
+                # Saving into the library that was loaded: write just the edited records (journal append or SQLite upsert)
+                if not self.save_dirty_records():
+                    self.statusBar().showMessage(f'No changes to save to "{self.video_file_path}"', 5000)
+                    return
+            else:
+                self.library_store = open_library(self.video_file_path)
+                self.library_saver.save_full(self.library_store, self.video_file_data)
+            self.statusBar().showMessage(f'Saving "{self.video_file_path}"...')
+
+    def save_dirty_records(self) -> bool:
+        removed_file_paths, self.unsaved_removed_file_paths = self.unsaved_removed_file_paths, list()
+        return self.library_saver.save_dirty(self.library_store, self.video_file_data, removed_file_paths)
+
+    def autosave_toggled(self, checked: bool):
+        if checked:
+            self.autosave_timer.start()
+        else:
+            self.autosave_timer.stop()
+
+    def on_autosave_timer(self):
+        # A save still running will be followed by this one anyway; don't queue up behind it
+        if not self.library_saver.is_saving:
+            self.autosave_library()
+
+    def autosave_library(self):
+        # Only into the library that was loaded, never prompting for a file name
+        if self.library_store is not None and self.library_store.library_path == self.video_file_path and self.video_file_data is not None:
+            if self.save_dirty_records():
+                self.statusBar().showMessage(f'Autosaving "{self.video_file_path}"...')
+
+    def on_library_saved(self, save_result: LibrarySaveResult):
+        if save_result.error is None:
+            self.statusBar().showMessage(f'Saved {save_result.saved_count} records to "{save_result.library_path}" in {save_result.elapsed:.2f}s', 5000)
+            return
+
+        # Put what wasn't written back into the next save; after a failed full save that has to be a full save again
+        if save_result.is_full_save and self.library_store is not None and self.library_store.library_path == save_result.library_path:
+            self.library_store = None
+        for video_file in save_result.unsaved_video_files:
+            video_file.is_dirty = True
+        self.unsaved_removed_file_paths.extend(save_result.unsaved_removed_file_paths)
+        self.statusBar().showMessage(f'Unable to save "{save_result.library_path}"')
+        QMessageBox.warning(self, "Save Failed", f'Unable to save "{save_result.library_path}":\n{save_result.error}')
 
     def scan_folder_clicked(self):
         dialog = QFileDialog(self)
@@ -358,24 +842,72 @@ class MainWindow(QMainWindow):
         if dialog.exec() and (selected_files := dialog.selectedFiles()):
             chosen_directory = selected_files[0]
             print('Creating FolderScanWorker...')
-            self.folder_scan_worker = FolderScanWorker(folder_path=chosen_directory)
+            # A cancelled or interrupted scan of the same folder resumes from its checkpoint. With a catalog open, a
+            # folder outside the shard on screen is merged into its own shard rather than into what is shown.
+            library_catalog = None
+            if self.library_catalog is not None and (self.catalog_shard is None or not is_same_or_under(normalize_root_path(chosen_directory), self.catalog_shard.root_path)):
+                library_catalog = self.library_catalog
+            self.folder_scan_worker = FolderScanWorker(folder_path=chosen_directory, library_catalog=library_catalog, use_checkpoint=True)
             self.folder_scan_worker.progress_signal.connect(self.do_progress_update)
             self.folder_scan_worker.started.connect(self.show_progress_clicked)
             self.folder_scan_worker.finished.connect(self.hide_progress_clicked)
+            self.folder_scan_worker.finished.connect(self.on_folder_scan_finished)
             print('Starting FolderScanWorker...')
             self.folder_scan_worker.start()
             print('Started FolderScanWorker')
             # self.video_file_data = scan_folder(chosen_directory)
-            # self.update_table_widget()
+
+    def on_folder_scan_finished(self):
+        folder_scan_worker = self.sender()
+        scan_engine = folder_scan_worker.scan_engine
+        if scan_engine.folder_data is None:
+            # Cancelled: the checkpoint lets the next scan of this folder carry on from where it stopped
+            return
+
+        if folder_scan_worker.library_catalog is not None:
+            if folder_scan_worker.catalog_error is not None:
+                QMessageBox.warning(self, "Scan Not Saved", f'Unable to add "{scan_engine.folder_path}" to the catalog:\n{folder_scan_worker.catalog_error}')
+            else:
+                self.statusBar().showMessage(f'Scanned "{scan_engine.folder_path}" into the catalog: {folder_scan_worker.catalog_change_set.summary()}', 5000)
+            return
+
+        if self.video_file_data is None:
+            self.video_file_data = scan_engine.folder_data
+            self.table_model.set_video_files(self.video_file_data)
+            return
+
+        # Merge into the library that is showing, keeping its IMDB details; the next save writes just what changed
+        change_set = reconcile_scan(self.editable_video_file_data(), scan_engine.folder_data, scan_engine.folder_path, recorded_identity=scan_engine.recorded_file_identity)
+        self.unsaved_removed_file_paths.extend(change_set.removed_file_paths)
+        self.table_model.apply_library_edit(change_set.library_edit())
+        if self.catalog_shard is not None and self.video_file_path == self.library_catalog.shard_path(self.catalog_shard):
+            self.library_catalog.record_scan(self.catalog_shard.root_path, len(self.video_file_data))
+            try:
+                self.library_catalog.save()
+            except (OSError, ValueError) as e:
+                print(f'MainWindow: Unable to update catalog "{self.library_catalog.manifest_path}": {e}')
+        self.statusBar().showMessage(f'Scanned "{scan_engine.folder_path}": {change_set.summary()}', 5000)
 
     def show_progress_clicked(self):
+        self.progress_dialog.pause_button.setText('Pause')
         self.progress_dialog.show()
 
     def hide_progress_clicked(self):
         self.progress_dialog.hide()
 
-    def do_progress_update(self, message):
-        self.progress_dialog.set_message(message)
+    def do_progress_update(self, progress: ScanProgress):
+        self.progress_dialog.set_message(progress.summary())
+
+    def do_pause_scanning(self):
+        if not self.folder_scan_worker:
+            return
+
+        if self.folder_scan_worker.is_paused:
+            self.folder_scan_worker.resume_scanning()
+            self.progress_dialog.pause_button.setText('Pause')
+        else:
+            self.folder_scan_worker.pause_scanning()
+            self.progress_dialog.pause_button.setText('Resume')
 
     def do_stop_scanning(self):
         if self.folder_scan_worker:
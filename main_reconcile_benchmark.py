@@ -0,0 +1,74 @@
+# Reconciliation benchmark: merging a rescan into a loaded library with reconcile_scan().
+#
+# Builds a synthetic library of --count records with IMDB details, and a scan of the same folder in which
+# --change-percent of the files were each renamed, deleted, added or scrubbed differently. File identities come from
+# in-memory maps rather than the disk, so this times the merge itself: the path index, the identity matching of
+# what is left over and rebuilding the list.
+#
+#   python main_reconcile_benchmark.py --count 500000 --change-percent 1
+
+import argparse
+import dataclasses
+import json
+import random
+import time
+
+from main_video_file_memory_benchmark import CHUNK_SIZE, make_video_file_json_chunk
+from mmm.core.library_reconcile import reconcile_scan
+from mmm.core.video_file import VideoFile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time merging a rescan into a loaded library')
+    parser.add_argument('--count', type=int, default=500_000)
+    parser.add_argument('--change-percent', type=float, default=1.0, help='Percentage of files renamed, and again of files deleted, added and rescrubbed')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    library = list()
+    for first_index in range(0, args.count, CHUNK_SIZE):
+        video_file_dicts = json.loads(make_video_file_json_chunk(rng, first_index, min(CHUNK_SIZE, args.count - first_index), plot_chars=0))
+        library.extend(VideoFile(**video_file_dict) for video_file_dict in video_file_dicts)
+
+    change_count = int(args.count * args.change_percent / 100)
+    changed_indices = rng.sample(range(args.count), 3 * change_count)
+    renamed_indices = set(changed_indices[:change_count])
+    deleted_indices = set(changed_indices[change_count:2 * change_count])
+    rescrubbed_indices = set(changed_indices[2 * change_count:])
+
+    # (st_dev, st_ino, st_size, st_mtime_ns) per path as the previous scan recorded it, and as the disk has it now
+    recorded_identities = {video_file.file_path: (1, index, 1000 + index, index) for index, video_file in enumerate(library)}
+    current_identities = dict()
+    scanned_video_files = list()
+    for index, video_file in enumerate(library):
+        if index in deleted_indices:
+            continue
+        file_path = video_file.file_path
+        scrubbed_file_name = video_file.scrubbed_file_name
+        if index in renamed_indices:
+            file_path = file_path.replace('.mkv', '.renamed.mkv')
+            current_identities[file_path] = recorded_identities[video_file.file_path]
+        if index in rescrubbed_indices:
+            scrubbed_file_name += ' rescrubbed'
+        scanned_video_files.append(VideoFile(file_path=file_path, scrubbed_file_name=scrubbed_file_name, scrubbed_file_year=video_file.scrubbed_file_year))
+    for index in range(change_count):
+        file_path = f'/library/Movies/added/Added.Movie.{index}.mkv'
+        current_identities[file_path] = (1, args.count + index, 1, args.count + index)
+        scanned_video_files.append(VideoFile(file_path=file_path, scrubbed_file_name=f'added movie {index}', scrubbed_file_year=''))
+
+    start_time = time.perf_counter()
+    change_set = reconcile_scan(library, scanned_video_files, '/library/Movies', recorded_identity=recorded_identities.get, current_identity=current_identities.get)
+    elapsed = time.perf_counter() - start_time
+    print(f'{args.count} records, {len(scanned_video_files)} scanned: {change_set.summary()} in {elapsed * 1000:.0f}ms')
+
+    start_time = time.perf_counter()
+    unchanged_scan = [dataclasses.replace(video_file, is_dirty=False) for video_file in library]
+    copy_elapsed = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    change_set = reconcile_scan(library, unchanged_scan, '/library/Movies', recorded_identity=recorded_identities.get, current_identity=current_identities.get)
+    print(f'Rescan with no changes: {change_set.summary()} in {(time.perf_counter() - start_time) * 1000:.0f}ms (building the scan took {copy_elapsed * 1000:.0f}ms)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# FilenameScrubber benchmark and equivalence check against the original per-call scrub_video_file_name.
+#
+# Generates realistic release names, verifies that FilenameScrubber returns exactly what the original
+# implementation returns for every one of them, then times both.
+#
+#   python main_scrubber_benchmark.py --count 1000000
+
+from typing import List, Text, Tuple
+import argparse
+import random
+import re
+import time
+
+from mmm.core.filename_scrubber import DEFAULT_FILENAME_METADATA_TOKENS, FilenameScrubber
+
+
+# The original FolderScanWorker.scrub_video_file_name, kept verbatim as the reference implementation
+def reference_scrub_video_file_name(file_name: Text, filename_metadata_tokens: Text) -> Tuple[Text, Text]:
+    year = ''
+
+    match = re.match(r'((.*)\((\d{4})\))', file_name)
+    if match:
+        file_name = match.group(2)
+        year = match.group(3)
+        scrubbed_file_name_list = file_name.replace('.', ' ').split()
+
+    else:
+        metadata_token_list = [token.lower().strip() for token in filename_metadata_tokens.split(',')]
+        file_name_parts = file_name.replace('.', ' ').split()
+        scrubbed_file_name_list = list()
+
+        for file_name_part in file_name_parts:
+            file_name_part = file_name_part.lower()
+
+            if file_name_part in metadata_token_list:
+                break
+            scrubbed_file_name_list.append(file_name_part)
+
+        if scrubbed_file_name_list:
+            match = re.match(r'\(?(\d{4})\)?', scrubbed_file_name_list[-1])
+            if match:
+                year = match.group(1)
+                del scrubbed_file_name_list[-1]
+
+    scrubbed_file_name = ' '.join(scrubbed_file_name_list).strip()
+    scrubbed_file_name = re.sub(' +', ' ', scrubbed_file_name)
+    return scrubbed_file_name, year
+
+
+TITLE_WORDS = ['The', 'A', 'Of', 'Night', 'Return', 'King', 'Star', 'Wars', 'Alien', 'Matrix', 'Lost', 'City', 'Blade', 'Runner', 'Amélie',
+               'Über', 'Straße', 'Crouching', 'Tiger', 'II', '2', '1917', '300', 'Se7en', 'Mr.', 'Dr', 'Strangelove', 'Léon', 'Ōkami', 'ＷＩＤＥ']
+METADATA_WORDS = ['480p', '720p', '1080p', 'BluRay', 'HEVC', 'x265', 'x264', 'WEB', 'WEBRip', 'WEB-DL', 'REPACK', 'PROPER', 'EXTENDED',
+                  'Remastered', 'DVDRip', 'HDTV', 'XviD', 'HDRip', 'BRRip', 'DVDSCR', 'PDTV', 'AAC', '5.1', 'DTS', 'HDR', '10bit']
+SEPARATORS = ['.', ' ', '  ', '. ', '\t']
+
+
+def make_release_name(rng: random.Random) -> Text:
+    title = [rng.choice(TITLE_WORDS) for _i in range(rng.randint(1, 5))]
+    year = str(rng.randint(1920, 2025))
+    style = rng.random()
+    separator = rng.choice(SEPARATORS)
+
+    if style < 0.25:
+        # Plex style: "Title (Year)", sometimes with trailing metadata
+        name = f'{" ".join(title)} ({year})'
+        if rng.random() < 0.3:
+            name += ' ' + ' '.join(rng.sample(METADATA_WORDS, 2))
+        return name
+
+    parts = title + [rng.choice([year, f'({year})', f'[{year}]', f'{year}p'])] if rng.random() < 0.8 else list(title)
+    parts += rng.sample(METADATA_WORDS, rng.randint(0, 4))
+    if rng.random() < 0.5:
+        parts[-1] += '-' + rng.choice(['RARBG', 'YIFY', 'SPARKS', 'GalaxyRG'])
+    if rng.random() < 0.05:
+        parts = [''] + parts + ['']
+    return separator.join(parts)
+
+
+def make_release_names(count: int, unique_fraction: float, seed: int) -> List[Text]:
+    rng = random.Random(seed)
+    unique_names = [make_release_name(rng) for _i in range(max(1, int(count * unique_fraction)))]
+    release_names = unique_names + [rng.choice(unique_names) for _i in range(count - len(unique_names))]
+    rng.shuffle(release_names)
+    return release_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check FilenameScrubber against the original scrubber and time both')
+    parser.add_argument('--count', type=int, default=1_000_000)
+    parser.add_argument('--unique-fraction', type=float, default=0.5, help='Fraction of distinct names; the rest are repeats')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    tokens = DEFAULT_FILENAME_METADATA_TOKENS
+    print(f'Generating {args.count} release names...')
+    release_names = make_release_names(args.count, args.unique_fraction, args.seed)
+
+    start_time = time.perf_counter()
+    reference_results = [reference_scrub_video_file_name(release_name, tokens) for release_name in release_names]
+    reference_elapsed = time.perf_counter() - start_time
+
+    unmemoized_scrubber = FilenameScrubber(tokens, memo_size=0)
+    start_time = time.perf_counter()
+    unmemoized_results = [unmemoized_scrubber.scrub_uncached(release_name) for release_name in release_names]
+    unmemoized_elapsed = time.perf_counter() - start_time
+
+    scrubber = FilenameScrubber(tokens, memo_size=args.count)
+    start_time = time.perf_counter()
+    batch_results = scrubber.scrub_many(release_names)
+    batch_elapsed = time.perf_counter() - start_time
+
+    mismatches = [(release_name, expected, actual) for release_name, expected, actual in zip(release_names, reference_results, unmemoized_results) if expected != actual]
+    mismatches += [(release_name, expected, actual) for release_name, expected, actual in zip(release_names, reference_results, batch_results) if expected != actual]
+    for release_name, expected, actual in mismatches[:20]:
+        print(f'MISMATCH: {release_name!r}: expected {expected!r}, got {actual!r}')
+    print(f'Equivalence: {len(release_names)} names checked, {len(mismatches)} mismatches')
+
+    for label, elapsed in [('original', reference_elapsed), ('FilenameScrubber', unmemoized_elapsed), ('scrub_many+memo', batch_elapsed)]:
+        print(f'{label:>18}: {elapsed:7.3f}s  {elapsed / len(release_names) * 1e6:6.2f} us/name  {reference_elapsed / elapsed:5.1f}x')
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Library search benchmark: LibrarySearchIndex vs. testing every record's text on every keystroke.
+#
+# Times indexing --count records, then each keystroke of a few queries typed a character at a time (the search a
+# front end runs as the search box changes), putting the matches in the order of a sorted view, and folding a rescan
+# into the index. Testing each record's folded text in Python, as a QSortFilterProxyModel or Gtk.FilterListModel
+# would through a Python filter callback, is timed for reference on the last keystroke of each query.
+#
+#   python main_search_benchmark.py --count 500000
+
+from typing import List, Text
+import argparse
+import dataclasses
+import operator
+import random
+import time
+
+from main_sort_benchmark import make_video_files, timed
+from mmm.core.library_search import LibrarySearchIndex, record_search_text, search_tokens
+from mmm.core.library_sort import LibrarySortOrder, fold_text
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+
+
+QUERIES = ['star wars 1977', 'matrix', '1080p', 'arwa']
+
+
+def naive_search(video_files: List[VideoFile], query: Text) -> List[int]:
+    words = search_tokens(query)
+    return [position for position, video_file in enumerate(video_files) if all(word in fold_text(record_search_text(video_file)) for word in words)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time searching a library as a query is typed')
+    parser.add_argument('--count', type=int, default=500_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    video_files = make_video_files(rng, args.count)
+
+    print(f'{args.count} records')
+    search_index = timed('index', lambda: LibrarySearchIndex(video_files))
+    for query in QUERIES:
+        slowest = 0.0
+        for length in range(1, len(query) + 1):
+            start_time = time.perf_counter()
+            positions = search_index.search(query[:length])
+            elapsed = time.perf_counter() - start_time
+            slowest = max(slowest, elapsed)
+            print(f'  {query[:length]!r:<46} {elapsed * 1000:8.1f}ms {len(positions or []):>8} records')
+        print(f'{"slowest keystroke of " + repr(query):<48} {slowest * 1000:8.1f}ms')
+        timed(f'test every record for {query!r}', lambda: naive_search(video_files, query))
+
+    sort_order = LibrarySortOrder(video_files, operator.attrgetter('scrubbed_file_name'))
+    timed('row of every list position, once per sort', sort_order.rows_by_position)
+    for query in ('s', 'matrix'):
+        positions = search_index.search(query)
+        timed(f'sort {len(positions)} matches into view order', lambda: sort_order.view_positions(positions))
+
+    removed_indices = sorted(rng.sample(range(len(video_files)), 10))
+    removed_index_set = set(removed_indices)
+    video_files[:] = [video_file for index, video_file in enumerate(video_files) if index not in removed_index_set]
+    renamed_indices = sorted(rng.sample(range(len(video_files)), 10))
+    for index in renamed_indices:
+        video_files[index] = dataclasses.replace(video_files[index], scrubbed_file_name=video_files[index].scrubbed_file_name + ' redux')
+    added = make_video_files(rng, 20, first_index=len(video_files))
+    video_files.extend(added)
+    timed('rescan: 10 removed, 10 renamed, 20 added', lambda: search_index.apply_library_edit(LibraryEdit(removed_indices=removed_indices, renamed_indices=renamed_indices, added=added)))
+    timed('search after the rescan', lambda: search_index.search('redux'))
+
+
+if __name__ == '__main__':
+    main()
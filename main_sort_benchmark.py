@@ -0,0 +1,102 @@
+# Library sort benchmark: LibrarySortOrder's cached natural-order keys vs. sorting with a Python comparison.
+#
+# Times sorting --count records by title the first time (making every key), again with the keys cached (what
+# clicking a column that was sorted before, or re-sorting after a reload, costs), and by year; flipping to
+# descending; then folding new scan results into the sorted order, a few records and a full scan batch, and a
+# rescan that removed and renamed a few records. A sort through functools.cmp_to_key() with a comparison that
+# works out natural order on every call is timed for reference on --naive-count records.
+#
+#   python main_sort_benchmark.py --count 500000
+
+from typing import List, Text
+import argparse
+import dataclasses
+import functools
+import json
+import operator
+import random
+import re
+import time
+
+from main_video_file_memory_benchmark import CHUNK_SIZE, make_video_file_json_chunk
+from mmm.core.library_sort import LibrarySortOrder
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+
+
+def make_video_files(rng: random.Random, count: int, first_index: int = 0) -> List[VideoFile]:
+    video_files = list()
+    for chunk_index in range(first_index, first_index + count, CHUNK_SIZE):
+        video_file_dicts = json.loads(make_video_file_json_chunk(rng, chunk_index, min(CHUNK_SIZE, first_index + count - chunk_index), plot_chars=0))
+        # Sequel numbers, so there is natural order to get right
+        for video_file_dict in video_file_dicts:
+            if rng.random() < 0.2:
+                video_file_dict['scrubbed_file_name'] += f' {rng.randint(2, 12)}'
+        video_files.extend(VideoFile(**video_file_dict) for video_file_dict in video_file_dicts)
+    return video_files
+
+
+def naive_compare(text_a: Text, text_b: Text) -> int:
+    parts_a = [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', text_a.casefold())]
+    parts_b = [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', text_b.casefold())]
+    for part_a, part_b in zip(parts_a, parts_b):
+        if part_a != part_b:
+            if type(part_a) is not type(part_b):
+                return -1 if isinstance(part_a, int) else 1
+            return -1 if part_a < part_b else 1
+    return len(parts_a) - len(parts_b)
+
+
+def timed(label: Text, function):
+    start_time = time.perf_counter()
+    result = function()
+    print(f'{label:<48} {(time.perf_counter() - start_time) * 1000:8.1f}ms')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time sorting a library and keeping it sorted as it changes')
+    parser.add_argument('--count', type=int, default=500_000)
+    parser.add_argument('--naive-count', type=int, default=50_000, help='Records to sort with a Python comparison function')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    video_files = make_video_files(rng, args.count)
+    title_key_cache = dict()
+    year_key_cache = dict()
+    title = operator.attrgetter('scrubbed_file_name')
+    year = operator.attrgetter('scrubbed_file_year')
+
+    print(f'{args.count} records')
+    timed('sort by title, making keys', lambda: LibrarySortOrder(video_files, title, key_cache=title_key_cache))
+    sort_order = timed('sort by title, keys cached', lambda: LibrarySortOrder(video_files, title, key_cache=title_key_cache))
+    timed('sort by year, making keys', lambda: LibrarySortOrder(video_files, year, key_cache=year_key_cache))
+    timed('sort by year, keys cached', lambda: LibrarySortOrder(video_files, year, key_cache=year_key_cache))
+    sort_order.descending = True
+    timed('flip to descending', lambda: [sort_order.position(row) for row in range(60)])
+    sort_order.descending = False
+
+    for added_count in (20, 5000):
+        added = make_video_files(rng, added_count, first_index=len(video_files))
+        video_files.extend(added)
+        row_edit = timed(f'insert {added_count} scanned records', lambda: sort_order.apply_library_edit(LibraryEdit(removed_indices=[], renamed_indices=[], added=added)))
+        assert len(row_edit.inserted_rows) == added_count
+
+    removed_indices = sorted(rng.sample(range(len(video_files)), 10))
+    removed_index_set = set(removed_indices)
+    video_files[:] = [video_file for index, video_file in enumerate(video_files) if index not in removed_index_set]
+    renamed_indices = sorted(rng.sample(range(len(video_files)), 10))
+    for index in renamed_indices:
+        video_files[index] = dataclasses.replace(video_files[index], scrubbed_file_name=video_files[index].scrubbed_file_name + ' redux')
+    row_edit = timed('rescan: 10 removed, 10 renamed', lambda: sort_order.apply_library_edit(LibraryEdit(removed_indices=removed_indices, renamed_indices=renamed_indices, added=[])))
+    assert len(row_edit.removed_rows) == 20 and len(row_edit.inserted_rows) == 10
+
+    naive_video_files = video_files[:args.naive_count]
+    print(f'{len(naive_video_files)} records')
+    timed('sort by title, Python comparison', lambda: sorted(naive_video_files, key=functools.cmp_to_key(lambda a, b: naive_compare(a.scrubbed_file_name, b.scrubbed_file_name))))
+    timed('sort by title, keys cached', lambda: LibrarySortOrder(naive_video_files, title, key_cache=title_key_cache))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# Qt library table benchmark: the virtualized VideoFileTableModel behind a QTableView vs. filling a QTableWidget.
+#
+# Populate is showing a freshly loaded library and painting its first screenful; refresh is telling the view that
+# every record may have changed in place and painting again. The QTableWidget rows repeat what MainWindow used to
+# do, one QTableWidgetItem per cell, for both; it is skipped above --widget-max-count, where it would take minutes.
+# Runs on the offscreen platform unless QT_QPA_PLATFORM says otherwise.
+#
+#   python main_table_model_benchmark.py --counts 10000,100000,1000000
+
+from typing import List
+import argparse
+import json
+import os
+import random
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PySide6.QtWidgets import QApplication
+from PySide6.QtWidgets import QTableView
+from PySide6.QtWidgets import QTableWidget
+from PySide6.QtWidgets import QTableWidgetItem
+
+from main_qt import VideoFileTableModel
+from main_video_file_memory_benchmark import CHUNK_SIZE, make_video_file_json_chunk
+from mmm.core.video_file import VideoFile
+
+
+def make_video_files(count: int, seed: int) -> List[VideoFile]:
+    rng = random.Random(seed)
+    video_files = list()
+    for first_index in range(0, count, CHUNK_SIZE):
+        video_file_dicts = json.loads(make_video_file_json_chunk(rng, first_index, min(CHUNK_SIZE, count - first_index), plot_chars=0))
+        video_files.extend(VideoFile(**video_file_dict) for video_file_dict in video_file_dicts)
+    return video_files
+
+
+def time_model(app: QApplication, video_files: List[VideoFile]):
+    table_model = VideoFileTableModel()
+    table_view = QTableView()
+    table_view.setModel(table_model)
+    table_view.resize(1200, 800)
+    table_view.show()
+    app.processEvents()
+
+    start_time = time.perf_counter()
+    table_model.set_video_files(video_files)
+    table_view.viewport().repaint()
+    app.processEvents()
+    populate_elapsed = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    table_model.refresh()
+    table_view.viewport().repaint()
+    app.processEvents()
+    refresh_elapsed = time.perf_counter() - start_time
+
+    table_view.close()
+    return populate_elapsed, refresh_elapsed
+
+
+def fill_table_widget(table_widget: QTableWidget, video_files: List[VideoFile]):
+    table_widget.setUpdatesEnabled(False)
+    try:
+        table_widget.setRowCount(0)
+        table_widget.setRowCount(len(video_files))
+        for row_index, video_file in enumerate(video_files):
+            table_widget.setItem(row_index, 0, QTableWidgetItem(video_file.scrubbed_file_name))
+            table_widget.setItem(row_index, 1, QTableWidgetItem(video_file.scrubbed_file_year))
+            table_widget.setItem(row_index, 2, QTableWidgetItem(video_file.imdb_rating))
+            table_widget.setItem(row_index, 3, QTableWidgetItem(video_file.imdb_tt))
+    finally:
+        table_widget.setUpdatesEnabled(True)
+
+
+def time_table_widget(app: QApplication, video_files: List[VideoFile]):
+    table_widget = QTableWidget()
+    table_widget.setColumnCount(len(VideoFileTableModel.column_headers))
+    table_widget.setHorizontalHeaderLabels(VideoFileTableModel.column_headers)
+    table_widget.resize(1200, 800)
+    table_widget.show()
+    app.processEvents()
+
+    elapsed = list()
+    for _pass in range(2):
+        start_time = time.perf_counter()
+        fill_table_widget(table_widget, video_files)
+        table_widget.viewport().repaint()
+        app.processEvents()
+        elapsed.append(time.perf_counter() - start_time)
+
+    table_widget.setRowCount(0)
+    table_widget.close()
+    return elapsed[0], elapsed[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time populating and refreshing the Qt library table')
+    parser.add_argument('--counts', default='10000,100000,1000000', help='Comma-separated record counts')
+    parser.add_argument('--widget-max-count', type=int, default=100_000, help='Largest count to also time a QTableWidget for')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    for count in (int(count) for count in args.counts.split(',')):
+        video_files = make_video_files(count, args.seed)
+
+        populate_elapsed, refresh_elapsed = time_model(app, video_files)
+        print(f'{count:>9} rows  VideoFileTableModel  populate {populate_elapsed * 1000:8.1f}ms  refresh {refresh_elapsed * 1000:8.1f}ms')
+
+        if count <= args.widget_max_count:
+            populate_elapsed, refresh_elapsed = time_table_widget(app, video_files)
+            print(f'{count:>9} rows  QTableWidget         populate {populate_elapsed * 1000:8.1f}ms  refresh {refresh_elapsed * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# VideoFile memory benchmark: bytes per record for the original dict-based dataclass vs. the compact slots-based one.
+#
+# Records are built from parsed JSON dicts, as the library loader does, so every record starts out with its own
+# copies of repeated strings (years, ratings, genres) just as it would when loading a library. Memory retained by
+# the records is measured with tracemalloc.
+#
+#   python main_video_file_memory_benchmark.py --counts 100000,1000000 --plot-chars 0
+#   python main_video_file_memory_benchmark.py --counts 100000 --plot-chars 300
+
+from typing import List, Text
+import argparse
+import dataclasses
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from mmm.core.video_file import VideoFile
+
+
+# The original VideoFile, kept verbatim as the reference implementation
+@dataclasses.dataclass
+class ReferenceVideoFile:
+    file_path: Text = ''
+    scrubbed_file_name: Text = ''
+    scrubbed_file_year: Text = ''
+    imdb_tt: Text = ''
+    imdb_name: Text = ''
+    imdb_year: Text = ''
+    imdb_rating: Text = ''
+    imdb_genres: List[Text] = None
+    imdb_plot: Text = None
+    is_dirty: bool = False
+
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family', 'Fantasy', 'History',
+          'Horror', 'Music', 'Mystery', 'Romance', 'Sci-Fi', 'Sport', 'Thriller', 'War', 'Western']
+TITLE_WORDS = ['the', 'a', 'of', 'night', 'return', 'king', 'star', 'wars', 'alien', 'matrix', 'lost', 'city', 'blade', 'runner', 'tiger']
+CHUNK_SIZE = 10_000
+
+
+def make_video_file_json_chunk(rng: random.Random, first_index: int, count: int, plot_chars: int) -> Text:
+    video_file_dicts = list()
+    for index in range(first_index, first_index + count):
+        title = ' '.join(rng.choice(TITLE_WORDS) for _i in range(rng.randint(1, 4)))
+        year = str(rng.randint(1920, 2025))
+        video_file_dicts.append({
+            'file_path': f'/library/Movies/{index // 50:05d}/{title.title().replace(" ", ".")}.{year}.1080p.BluRay.x264-{index}.mkv',
+            'scrubbed_file_name': title,
+            'scrubbed_file_year': year,
+            'imdb_tt': f'tt{rng.randint(100000, 9999999):07d}',
+            'imdb_name': title.title(),
+            'imdb_year': year,
+            'imdb_rating': f'{rng.randint(10, 95) / 10:.1f}',
+            'imdb_genres': rng.sample(GENRES, rng.randint(1, 3)),
+            'imdb_plot': ''.join(rng.choice('abcdefghij klmnop') for _i in range(plot_chars)) if plot_chars else None,
+            'is_dirty': False,
+        })
+    return json.dumps(video_file_dicts)
+
+
+def measure(video_file_class, count: int, plot_chars: int, seed: int):
+    rng = random.Random(seed)
+    json_chunks = [make_video_file_json_chunk(rng, first_index, min(CHUNK_SIZE, count - first_index), plot_chars) for first_index in range(0, count, CHUNK_SIZE)]
+
+    gc.collect()
+    tracemalloc.start()
+    start_time = time.perf_counter()
+
+    video_files = list()
+    for json_chunk in json_chunks:
+        video_files.extend(video_file_class(**video_file_dict) for video_file_dict in json.loads(json_chunk))
+
+    elapsed = time.perf_counter() - start_time
+    gc.collect()
+    retained_bytes, _peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The list itself costs the same 8 bytes per record either way; leave it out of the per-record figure
+    record_bytes = retained_bytes - len(video_files) * 8
+    del video_files
+    return record_bytes / count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory per VideoFile record before and after the slots/interning change')
+    parser.add_argument('--counts', default='100000,1000000')
+    parser.add_argument('--plot-chars', type=int, default=0, help='Length of a unique plot string per record (0 = no plot)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    for count in [int(count) for count in args.counts.split(',')]:
+        reference_bytes, reference_elapsed = measure(ReferenceVideoFile, count, args.plot_chars, args.seed)
+        compact_bytes, compact_elapsed = measure(VideoFile, count, args.plot_chars, args.seed)
+        print(f'{count:>9} records:  before {reference_bytes:6.0f} bytes/record ({reference_elapsed:5.2f}s)   '
+              f'after {compact_bytes:6.0f} bytes/record ({compact_elapsed:5.2f}s)   {reference_bytes / compact_bytes:4.2f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
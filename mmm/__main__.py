@@ -0,0 +1,6 @@
+import sys
+
+from mmm.cli import main
+
+
+sys.exit(main())
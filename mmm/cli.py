@@ -0,0 +1,195 @@
+# Headless command line front end. Imports nothing from gi or PySide6, so it starts quickly and runs on servers
+# without a display:
+#
+#   python -m mmm scan /mnt/movies /mnt/tv -o library.ndjson
+#   python -m mmm scan /mnt/movies /mnt/tv /mnt/archive --catalog ~/Videos/catalog
+#   python -m mmm catalog ~/Videos/catalog
+#   python -m mmm duplicates /mnt/movies /mnt/backup/movies
+#
+# scan writes each video file as one JSON object per line (NDJSON) as soon as its directory has been scrubbed, and
+# nothing is accumulated, so memory use stays flat however large the library is. With --catalog, each root is
+# merged into its own shard of a LibraryCatalog instead, and roots that are offline are skipped. catalog lists a
+# catalog's shards. duplicates fingerprints every video file under the roots (see FingerprintCache) and writes one
+# line per set of copies of the same content.
+#
+# Each command imports the parts of mmm.core it uses when it runs, so starting up (and --help) only costs argparse.
+
+from typing import TYPE_CHECKING, List, Text, TextIO
+import argparse
+import contextlib
+import json
+import sys
+
+from mmm.core.scan_progress import ScanProgress
+
+if TYPE_CHECKING:
+    from mmm.core.video_file import VideoFile
+
+
+class NdjsonResultWriter:
+    def __init__(self, output_file: TextIO):
+        self.output_file = output_file
+        self.video_file_count = 0
+
+    def write_video_files(self, video_files: List['VideoFile']):
+        from mmm.core.video_file import video_file_as_dict
+
+        self.output_file.write(''.join(json.dumps(video_file_as_dict(video_file), ensure_ascii=False) + '\n' for video_file in video_files))
+        self.output_file.flush()
+        self.video_file_count += len(video_files)
+
+
+class StderrProgressLine:
+    def __init__(self, prefix: Text = ''):
+        self.prefix = prefix
+        self.last_line_length = 0
+
+    def show_progress(self, progress: ScanProgress):
+        line = f'{self.prefix}{progress.summary()}'
+        padding = ' ' * max(0, self.last_line_length - len(line))
+        self.last_line_length = len(line)
+        sys.stderr.write(f'\r{line}{padding}' + ('\n' if progress.is_complete else ''))
+        sys.stderr.flush()
+
+
+def make_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='python -m mmm', description='MiniMediaManager command line tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan_parser = subparsers.add_parser('scan', help='Scan folders for video files and write them as NDJSON')
+    scan_parser.add_argument('roots', nargs='+', help='Folders to scan')
+    scan_parser.add_argument('-o', '--output', help='Write NDJSON here instead of stdout')
+    scan_parser.add_argument('--sqlite', help='Upsert results into this SQLite library (keeping IMDB details) and remove files no longer found; NDJSON is then only written with -o')
+    scan_parser.add_argument('--catalog', help='Merge each root into its own shard of this catalog directory (keeping IMDB details, following renamed files with the scan cache); NDJSON is then only written with -o')
+    scan_parser.add_argument('--probe-timeout', type=float, default=2.0, help='With --catalog, seconds to wait for a root to respond before skipping it as offline (default 2)')
+    scan_parser.add_argument('--ignore-extensions', default=None, help='Comma-separated file extensions to skip (default: ScanEngine\'s, "png,jpg,nfo,srt")')
+    scan_parser.add_argument('--metadata-tokens', default=None, help='Comma-separated release tokens that end a title')
+    scan_parser.add_argument('--threads', type=int, default=8, help='Directory listing threads (default 8)')
+    scan_parser.add_argument('--process-pool', action='store_true', help='Scrub file names in a process pool')
+    scan_parser.add_argument('--workers', type=int, default=None, help='Process pool size (default: CPU count)')
+    scan_parser.add_argument('--batch-size', type=int, default=2000, help='File names per process pool batch (default 2000)')
+    scan_parser.add_argument('--scan-cache', action='store_true', help='Skip directories unchanged since the last scan; the cache is held in memory, so memory use grows with the library')
+    scan_parser.add_argument('--checkpoint', action='store_true', help='Save progress periodically so an interrupted scan of the same root resumes where it stopped')
+    scan_parser.add_argument('--no-progress', action='store_true', help='Do not show a progress line on stderr')
+
+    catalog_parser = subparsers.add_parser('catalog', help='List the shards of a catalog: one line per root with its record count, last scan time and whether it is online')
+    catalog_parser.add_argument('catalog', help='Catalog directory')
+    catalog_parser.add_argument('-o', '--output', help='Write NDJSON here instead of stdout')
+    catalog_parser.add_argument('--probe-timeout', type=float, default=2.0, help='Seconds to wait for a root to respond before reporting it offline (default 2)')
+
+    duplicates_parser = subparsers.add_parser('duplicates', help='Find copies of the same video file, within and across folders')
+    duplicates_parser.add_argument('roots', nargs='+', help='Folders to search')
+    duplicates_parser.add_argument('-o', '--output', help='Write NDJSON here instead of stdout')
+    duplicates_parser.add_argument('--ignore-extensions', default=None, help='Comma-separated file extensions to skip (default: ScanEngine\'s, "png,jpg,nfo,srt")')
+    duplicates_parser.add_argument('--threads', type=int, default=8, help='Directory listing and fingerprinting threads (default 8)')
+    duplicates_parser.add_argument('--fingerprint-cache', default=None, help='Fingerprint cache file (default: in ~/.cache/MiniMediaManager)')
+    duplicates_parser.add_argument('--no-progress', action='store_true', help='Do not show a progress line on stderr')
+
+    return parser
+
+
+def duplicates_command(args: argparse.Namespace, output_file: TextIO) -> int:
+    from mmm.core.fingerprint import FingerprintCache
+    from mmm.core.scan_engine import ScanEngine
+
+    fingerprint_cache_path = args.fingerprint_cache or FingerprintCache.default_path()
+    fingerprinted_paths = list()
+
+    for root in args.roots:
+        progress_line = None if args.no_progress else StderrProgressLine(prefix=f'{root}: ' if len(args.roots) > 1 else '')
+        scan_engine = ScanEngine(root, ignore_extensions=args.ignore_extensions, progress_sink=progress_line.show_progress if progress_line else None,
+                                 max_workers=args.threads, use_fingerprints=True, fingerprint_cache_path=fingerprint_cache_path)
+        scan_engine.run()
+        fingerprinted_paths.extend(scan_engine.fingerprints or ())
+
+    fingerprint_cache = FingerprintCache.load(fingerprint_cache_path)
+    duplicate_groups = fingerprint_cache.find_duplicate_groups(fingerprinted_paths)
+    for file_paths in duplicate_groups:
+        file_size = fingerprint_cache.files[file_paths[0]][0][2]
+        output_file.write(json.dumps({'size': file_size, 'file_paths': file_paths}, ensure_ascii=False) + '\n')
+    print(f'Found {len(duplicate_groups)} sets of duplicates')
+
+    return 0
+
+
+def catalog_command(args: argparse.Namespace, output_file: TextIO) -> int:
+    from mmm.core.library_catalog import LibraryCatalog
+
+    catalog = LibraryCatalog.load(args.catalog)
+    online_roots = catalog.online_roots(timeout=args.probe_timeout)
+    for root_path, shard in catalog.shards.items():
+        shard_json = {'root_path': root_path, 'video_file_count': shard.video_file_count, 'last_scan_time': shard.last_scan_time, 'online': online_roots[root_path], 'shard_path': catalog.shard_path(shard)}
+        output_file.write(json.dumps(shard_json, ensure_ascii=False) + '\n')
+    return 0
+
+
+def scan_command(args: argparse.Namespace, output_file: TextIO) -> int:
+    from mmm.core.library_catalog import LibraryCatalog, normalize_root_path, probe_online_roots
+    from mmm.core.scan_engine import ScanEngine
+    from mmm.core.sqlite_store import SqliteLibraryStore, SqliteScanWriter
+    from mmm.core.video_file import VideoFile
+
+    result_writer = NdjsonResultWriter(output_file) if output_file else None
+    library_store = SqliteLibraryStore(args.sqlite) if args.sqlite else None
+    catalog = LibraryCatalog.load(args.catalog) if args.catalog else None
+
+    roots = args.roots
+    if catalog:
+        # Catalog shards are keyed by absolute root path; an offline root keeps its shard as it was
+        roots = [normalize_root_path(root) for root in roots]
+        online_roots = probe_online_roots(roots, timeout=args.probe_timeout)
+        for root in roots:
+            if not online_roots[root]:
+                print(f'Skipping "{root}": not reachable (offline, unmounted or empty)')
+        roots = [root for root in roots if online_roots[root]]
+
+    for root in roots:
+        progress_line = None if args.no_progress else StderrProgressLine(prefix=f'{root}: ' if len(args.roots) > 1 else '')
+        scan_writer = SqliteScanWriter(library_store, prune_folder_path=root) if library_store else None
+        result_sinks = [sink for sink in (result_writer and result_writer.write_video_files, scan_writer and scan_writer.write_video_files) if sink]
+
+        def write_video_files(video_files: List[VideoFile]):
+            for result_sink in result_sinks:
+                result_sink(video_files)
+
+        scan_engine = ScanEngine(root, ignore_extensions=args.ignore_extensions, filename_metadata_tokens=args.metadata_tokens,
+                                 progress_sink=progress_line.show_progress if progress_line else None, result_sink=write_video_files,
+                                 max_workers=args.threads, use_scan_cache=args.scan_cache or catalog is not None, use_process_pool=args.process_pool,
+                                 process_pool_workers=args.workers, process_pool_batch_size=args.batch_size, keep_results=catalog is not None,
+                                 use_checkpoint=args.checkpoint)
+        completed = scan_engine.run()
+
+        if catalog and completed:
+            catalog.merge_scan(root, scan_engine.folder_data, recorded_identity=scan_engine.recorded_file_identity)
+
+        if scan_writer:
+            # Only prune after a complete scan; a partial one hasn't seen everything that is still there
+            if completed:
+                pruned_count = scan_writer.finish()
+                print(f'Removed {pruned_count} files no longer under "{root}" from "{args.sqlite}"')
+            else:
+                scan_writer.flush()
+
+    return 0
+
+
+def main(argv: List[Text] = None) -> int:
+    args = make_argument_parser().parse_args(argv)
+
+    output_file = open(args.output, 'w', encoding='utf8') if args.output else (None if getattr(args, 'sqlite', None) or (args.command == 'scan' and args.catalog) else sys.stdout)
+    try:
+        # ScanEngine logs to stdout, which would corrupt NDJSON written there
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.command == 'scan':
+                return scan_command(args, output_file)
+            if args.command == 'catalog':
+                return catalog_command(args, output_file)
+            if args.command == 'duplicates':
+                return duplicates_command(args, output_file)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        if output_file is not None and output_file is not sys.stdout:
+            output_file.close()
+
+    return 0
@@ -0,0 +1,57 @@
+# Toolkit-independent library and scanning code. Nothing under mmm.core may import gi or PySide6.
+#
+# The names below are imported from their modules when first used rather than here, so importing one module of
+# the package (as the command line does) doesn't import all of them.
+
+import importlib
+
+EXPORTED_MODULES = {
+    'FilenameScrubber': 'filename_scrubber',
+    'scrub_video_file_name': 'filename_scrubber',
+    'FingerprintCache': 'fingerprint',
+    'compute_fingerprint': 'fingerprint',
+    'CatalogShard': 'library_catalog',
+    'LibraryCatalog': 'library_catalog',
+    'LibraryJournal': 'library_journal',
+    'LibraryLoader': 'library_loader',
+    'LibraryChangeSet': 'library_reconcile',
+    'apply_library_diff': 'library_reconcile',
+    'reconcile_scan': 'library_reconcile',
+    'LibrarySaveResult': 'library_saver',
+    'LibrarySaver': 'library_saver',
+    'LibrarySearchIndex': 'library_search',
+    'search_tokens': 'library_search',
+    'LibrarySnapshot': 'library_snapshot',
+    'LibrarySortOrder': 'library_sort',
+    'natural_sort_key': 'library_sort',
+    'open_library': 'library_store',
+    'LibraryChange': 'library_watch',
+    'LibraryWatch': 'library_watch',
+    'apply_library_change': 'library_watch',
+    'ScanDiff': 'scan_cache',
+    'ScanEngine': 'scan_engine',
+    'ScanProgress': 'scan_progress',
+    'ScanProgressReporter': 'scan_progress',
+    'VideoFileBatchQueue': 'scan_stream',
+    'LibraryQuery': 'sqlite_store',
+    'SqliteLibraryStore': 'sqlite_store',
+    'LoadProgress': 'video_file',
+    'VideoFile': 'video_file',
+    'iter_video_file_batches': 'video_file',
+    'load_video_file_data': 'video_file',
+}
+
+__all__ = list(EXPORTED_MODULES)
+
+
+def __getattr__(name):
+    module_name = EXPORTED_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'{__name__}.{module_name}'), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(EXPORTED_MODULES))
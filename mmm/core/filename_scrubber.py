@@ -0,0 +1,57 @@
+from typing import Iterable, List, Text, Tuple
+import functools
+import re
+
+
+DEFAULT_FILENAME_METADATA_TOKENS = '480p,720p,1080p,bluray,hevc,x265,x264,web,webrip,web-dl,repack,proper,extended,remastered,dvdrip,dvd,hdtv,xvid,hdrip,brrip,dvdscr,pdtv'
+
+PARENTHESIZED_YEAR_PATTERN = re.compile(r'((.*)\((\d{4})\))')
+TRAILING_YEAR_PATTERN = re.compile(r'\(?(\d{4})\)?')
+
+
+class FilenameScrubber:
+    # Turns a release name (no extension) into a (title, year) pair. Built once from the comma-separated
+    # metadata token config: tokens live in a set, patterns are compiled up front, and results are memoized
+    # so repeated names (rescans, the same title in several folders) cost a dict lookup.
+
+    def __init__(self, filename_metadata_tokens: Text = None, memo_size: int = 100_000):
+        if filename_metadata_tokens is None:
+            filename_metadata_tokens = DEFAULT_FILENAME_METADATA_TOKENS
+        self.metadata_tokens = frozenset(token.lower().strip() for token in filename_metadata_tokens.split(','))
+        self.scrub = functools.lru_cache(maxsize=memo_size)(self.scrub_uncached)
+
+    def scrub_uncached(self, file_name: Text) -> Tuple[Text, Text]:
+        # Most release names have no parenthesis at all, and the backtracking pattern is the costliest step
+        match = PARENTHESIZED_YEAR_PATTERN.match(file_name) if '(' in file_name else None
+        if match:
+            return ' '.join(match.group(2).replace('.', ' ').split()), match.group(3)
+
+        metadata_tokens = self.metadata_tokens
+        scrubbed_file_name_list = list()
+        for file_name_part in file_name.lower().replace('.', ' ').split():
+            if file_name_part in metadata_tokens:
+                break
+            scrubbed_file_name_list.append(file_name_part)
+
+        year = ''
+        if scrubbed_file_name_list:
+            match = TRAILING_YEAR_PATTERN.match(scrubbed_file_name_list[-1])
+            if match:
+                year = match.group(1)
+                del scrubbed_file_name_list[-1]
+
+        # str.split() leaves no empty or whitespace-bearing parts, so the join needs no further strip/collapse
+        return ' '.join(scrubbed_file_name_list), year
+
+    def scrub_many(self, file_names: Iterable[Text]) -> List[Tuple[Text, Text]]:
+        scrub = self.scrub
+        return [scrub(file_name) for file_name in file_names]
+
+
+@functools.lru_cache(maxsize=8)
+def get_filename_scrubber(filename_metadata_tokens: Text = None) -> FilenameScrubber:
+    return FilenameScrubber(filename_metadata_tokens)
+
+
+def scrub_video_file_name(file_name: Text, filename_metadata_tokens: Text = None) -> Tuple[Text, Text]:
+    return get_filename_scrubber(filename_metadata_tokens).scrub(file_name)
@@ -0,0 +1,205 @@
+from typing import Dict, Iterable, List, Optional, Text, Tuple
+import collections
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import os.path
+import tempfile
+
+from mmm.core.video_file import VideoFile
+
+
+FINGERPRINT_CACHE_VERSION = 1
+FINGERPRINT_CHUNK_SIZE = 64 * 1024
+FINGERPRINT_CHUNK_COUNT = 3
+FINGERPRINT_BATCH_SIZE = 256
+
+FileIdentity = Tuple[int, int, int, int]  # st_dev, st_ino, st_size, st_mtime_ns
+
+
+def file_identity(stat_result: os.stat_result) -> FileIdentity:
+    return stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns
+
+
+def chunk_offsets(file_size: int) -> List[int]:
+    # The start, middle and end of a file; all of it if it is no bigger than the chunks would be
+    if file_size <= FINGERPRINT_CHUNK_SIZE * FINGERPRINT_CHUNK_COUNT:
+        return list(range(0, file_size, FINGERPRINT_CHUNK_SIZE))
+    last_offset = file_size - FINGERPRINT_CHUNK_SIZE
+    return [last_offset * chunk_index // (FINGERPRINT_CHUNK_COUNT - 1) for chunk_index in range(FINGERPRINT_CHUNK_COUNT)]
+
+
+def compute_fingerprint(file_path: Text) -> Text:
+    # The size plus a hash of a few fixed-size chunks, so a multi-GB video costs a handful of page reads. The chunks
+    # are hashed straight out of the page cache through mmap; hashlib releases the GIL while it reads them, so page
+    # faults on one thread don't hold up the others.
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                file_size = len(mm)
+                with memoryview(mm) as view:
+                    for offset in chunk_offsets(file_size):
+                        with view[offset:offset + FINGERPRINT_CHUNK_SIZE] as chunk:
+                            digest.update(chunk)
+    return f'{file_size:x}:{digest.hexdigest()}'
+
+
+class FingerprintCache:
+    # Persistent file_path -> (identity, fingerprint), shared by every scanned folder so duplicates can be found
+    # across them. A file whose (st_dev, st_ino, size, mtime) is unchanged isn't read again, wherever it has moved
+    # to on the same filesystem; the fingerprint last recorded for a path that has disappeared is what lets a scan
+    # recognize the file at its new location, even after a move across filesystems.
+
+    def __init__(self, cache_path: Text):
+        self.cache_path = cache_path
+        self.files: Dict[Text, Tuple[FileIdentity, Text]] = dict()
+        self.fingerprints_by_identity: Dict[FileIdentity, Text] = dict()
+        self.updated_paths: Dict[Text, None] = dict()
+        self.forgotten_paths: Dict[Text, None] = dict()
+
+    @staticmethod
+    def default_path() -> Text:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        return os.path.join(cache_home, 'MiniMediaManager', 'fingerprints.json')
+
+    @classmethod
+    def load(cls, cache_path: Text) -> 'FingerprintCache':
+        fingerprint_cache = cls(cache_path)
+        fingerprint_cache.files = cls.read_files(cache_path)
+        for identity, fingerprint in fingerprint_cache.files.values():
+            fingerprint_cache.fingerprints_by_identity[identity] = fingerprint
+        return fingerprint_cache
+
+    @staticmethod
+    def read_files(cache_path: Text) -> Dict[Text, Tuple[FileIdentity, Text]]:
+        try:
+            with open(cache_path, encoding='utf8') as f:
+                cache_json = json.load(f)
+        except FileNotFoundError:
+            return dict()
+        except (OSError, ValueError) as e:
+            print(f'FingerprintCache: Ignoring unreadable cache "{cache_path}": {e}')
+            return dict()
+
+        if cache_json.get('version') != FINGERPRINT_CACHE_VERSION:
+            print(f'FingerprintCache: Discarding cache "{cache_path}" written by a different version')
+            return dict()
+        return {file_path: (tuple(identity_and_fingerprint[:4]), identity_and_fingerprint[4]) for file_path, identity_and_fingerprint in cache_json['files'].items()}
+
+    def save(self):
+        # Other folders may have been scanned since this cache was loaded: merge into what is on disk now
+        files = self.read_files(self.cache_path)
+        for file_path in self.forgotten_paths:
+            files.pop(file_path, None)
+        for file_path in self.updated_paths:
+            files[file_path] = self.files[file_path]
+
+        cache_json = {
+            'version': FINGERPRINT_CACHE_VERSION,
+            'files': {file_path: [*identity, fingerprint] for file_path, (identity, fingerprint) in files.items()},
+        }
+
+        cache_dir = os.path.dirname(self.cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix='.fingerprints_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf8') as f:
+                f.write(json.dumps(cache_json, separators=(',', ':'), ensure_ascii=False))
+            os.replace(temp_path, self.cache_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.updated_paths.clear()
+        self.forgotten_paths.clear()
+
+    def recorded_fingerprint(self, file_path: Text) -> Optional[Text]:
+        # The fingerprint the file at file_path had when it was last fingerprinted, whether or not it still exists
+        identity_and_fingerprint = self.files.get(file_path)
+        return identity_and_fingerprint[1] if identity_and_fingerprint else None
+
+    def forget_paths(self, file_paths: Iterable[Text]):
+        for file_path in file_paths:
+            if self.files.pop(file_path, None) is not None:
+                self.updated_paths.pop(file_path, None)
+                self.forgotten_paths[file_path] = None
+
+    def fingerprint_file(self, file_path: Text) -> Tuple[Text, Optional[FileIdentity], Optional[Text]]:
+        # Runs on a worker thread; only reads the cache
+        try:
+            identity = file_identity(os.stat(file_path))
+            cached = self.files.get(file_path)
+            if cached is not None and cached[0] == identity:
+                return file_path, identity, cached[1]
+            fingerprint = self.fingerprints_by_identity.get(identity)
+            if fingerprint is None:
+                fingerprint = compute_fingerprint(file_path)
+            return file_path, identity, fingerprint
+        except (OSError, ValueError) as e:
+            print(f'FingerprintCache: Unable to fingerprint "{file_path}": {e}')
+            return file_path, None, None
+
+    def fingerprint_files(self, file_paths: List[Text], max_workers: int = 8, keep_going=lambda: True) -> Dict[Text, Text]:
+        # file_path -> fingerprint for every file that could be read. Files are stat'd and, if new or changed,
+        # hashed on max_workers threads; a batch at a time, so keep_going() can cut a long first run short.
+        fingerprints: Dict[Text, Text] = dict()
+        computed_count = 0
+
+        def fingerprint_batch(batch_file_paths):
+            return [self.fingerprint_file(file_path) for file_path in batch_file_paths]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            batch_futures = [executor.submit(fingerprint_batch, file_paths[first_index:first_index + FINGERPRINT_BATCH_SIZE]) for first_index in range(0, len(file_paths), FINGERPRINT_BATCH_SIZE)]
+            for batch_future in batch_futures:
+                if not keep_going():
+                    for pending_future in batch_futures:
+                        pending_future.cancel()
+                    break
+                for file_path, identity, fingerprint in batch_future.result():
+                    if fingerprint is None:
+                        continue
+                    fingerprints[file_path] = fingerprint
+                    if self.files.get(file_path) != (identity, fingerprint):
+                        if identity not in self.fingerprints_by_identity:
+                            computed_count += 1
+                        self.files[file_path] = (identity, fingerprint)
+                        self.fingerprints_by_identity[identity] = fingerprint
+                        self.updated_paths[file_path] = None
+                        self.forgotten_paths.pop(file_path, None)
+
+        print(f'FingerprintCache: {len(fingerprints)} files fingerprinted, {computed_count} of them read')
+        return fingerprints
+
+    def find_duplicate_groups(self, file_paths: Iterable[Text]) -> List[List[Text]]:
+        # Fingerprinted paths with the same content, each group sorted, biggest files first. Hard links to one file
+        # aren't copies of it, so only the first path per (st_dev, st_ino) counts.
+        paths_by_fingerprint: Dict[Text, Dict[Tuple[int, int], Text]] = collections.defaultdict(dict)
+        for file_path in sorted(file_paths):
+            identity_and_fingerprint = self.files.get(file_path)
+            if identity_and_fingerprint is not None:
+                identity, fingerprint = identity_and_fingerprint
+                paths_by_fingerprint[fingerprint].setdefault(identity[:2], file_path)
+
+        duplicate_groups = [(fingerprint, list(paths_by_inode.values())) for fingerprint, paths_by_inode in paths_by_fingerprint.items() if len(paths_by_inode) > 1]
+        duplicate_groups.sort(key=lambda group: (-int(group[0].partition(':')[0], 16), group[1]))
+        return [file_paths for _fingerprint, file_paths in duplicate_groups]
+
+
+def match_moved_files(removed: List[VideoFile], added: List[VideoFile], fingerprint_cache: FingerprintCache, fingerprints: Dict[Text, Text]) -> List[Tuple[VideoFile, VideoFile]]:
+    # Pairs each removed file with an added file that has the same content, in order, one to one
+    removed_by_fingerprint: Dict[Text, collections.deque] = collections.defaultdict(collections.deque)
+    for video_file in removed:
+        fingerprint = fingerprint_cache.recorded_fingerprint(video_file.file_path)
+        if fingerprint is not None:
+            removed_by_fingerprint[fingerprint].append(video_file)
+
+    moved = list()
+    for video_file in added:
+        candidates = removed_by_fingerprint.get(fingerprints.get(video_file.file_path))
+        if candidates:
+            moved.append((candidates.popleft(), video_file))
+    return moved
+
@@ -0,0 +1,127 @@
+from typing import Dict, Iterable, List, Optional, Text, Tuple
+import dataclasses
+import os
+import os.path
+import time
+
+
+@dataclasses.dataclass
+class FileSystemEvent:
+    kind: Text  # 'created', 'deleted', 'moved', or 'overflow' when events were lost and the tree must be rescanned
+    path: Text
+    is_dir: bool = False
+    new_path: Optional[Text] = None
+
+
+@dataclasses.dataclass
+class PolledDirectory:
+    mtime_ns: int
+    entries: Dict[Text, Tuple[bool, int]]  # name -> (is_dir, st_ino)
+
+
+class PollingWatcher:
+    # Fallback for when inotify is unavailable (not Linux, network filesystems, watch limit reached). Each poll costs
+    # one stat per directory; only directories whose mtime moved are listed again. Entries that disappear from one
+    # place and appear in another with the same inode within a poll are reported as moves, so renames keep their
+    # library metadata just as they do with inotify.
+
+    def __init__(self, poll_interval: float = 2.0):
+        self.poll_interval = poll_interval
+        self.directories: Dict[Text, PolledDirectory] = dict()
+        self.next_poll_time = time.monotonic() + poll_interval
+
+    def add_tree(self, top: Text, dir_paths: Iterable[Text] = None):
+        pending_dir_paths = list(dir_paths) if dir_paths is not None else [top]
+        walk_subdirs = dir_paths is None
+        while pending_dir_paths:
+            dir_path = pending_dir_paths.pop()
+            polled_directory = self.list_directory(dir_path)
+            if polled_directory is None:
+                continue
+            self.directories[dir_path] = polled_directory
+            if walk_subdirs:
+                pending_dir_paths.extend(os.path.join(dir_path, name) for name, (is_dir, _ino) in polled_directory.entries.items() if is_dir)
+
+    @staticmethod
+    def list_directory(dir_path: Text) -> Optional[PolledDirectory]:
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            entries = dict()
+            with os.scandir(dir_path) as dir_entries:
+                for dir_entry in dir_entries:
+                    is_dir = dir_entry.is_dir(follow_symlinks=False)
+                    entries[dir_entry.name] = (is_dir, dir_entry.inode())
+        except OSError:
+            return None
+        return PolledDirectory(mtime_ns=mtime_ns, entries=entries)
+
+    def read_events(self, timeout: float) -> List[FileSystemEvent]:
+        wait_time = self.next_poll_time - time.monotonic()
+        if wait_time > 0:
+            time.sleep(min(wait_time, timeout))
+            if time.monotonic() < self.next_poll_time:
+                return list()
+        self.next_poll_time = time.monotonic() + self.poll_interval
+
+        created: Dict[int, Tuple[Text, bool]] = dict()
+        deleted: Dict[int, Tuple[Text, bool]] = dict()
+
+        for dir_path, polled_directory in list(self.directories.items()):
+            if dir_path not in self.directories:
+                # Dropped as part of a deleted or moved parent earlier in this poll
+                continue
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns == polled_directory.mtime_ns:
+                continue
+
+            new_polled_directory = self.list_directory(dir_path) if mtime_ns is not None else None
+            if new_polled_directory is None:
+                # The directory itself went away; its parent reports it
+                self.drop_tree(dir_path)
+                continue
+            self.directories[dir_path] = new_polled_directory
+
+            old_entries, new_entries = polled_directory.entries, new_polled_directory.entries
+            for name, (is_dir, ino) in old_entries.items():
+                if new_entries.get(name) != (is_dir, ino):
+                    deleted[ino] = (os.path.join(dir_path, name), is_dir)
+            for name, (is_dir, ino) in new_entries.items():
+                if old_entries.get(name) != (is_dir, ino):
+                    created[ino] = (os.path.join(dir_path, name), is_dir)
+
+        events = list()
+        for ino, (old_path, is_dir) in deleted.items():
+            new_path_and_is_dir = created.pop(ino, None)
+            if new_path_and_is_dir is not None and new_path_and_is_dir[1] == is_dir:
+                if is_dir:
+                    self.rename_tree(old_path, new_path_and_is_dir[0])
+                    if new_path_and_is_dir[0] not in self.directories:
+                        # Its old path was polled, found missing and dropped before the move was matched up
+                        self.add_tree(new_path_and_is_dir[0])
+                events.append(FileSystemEvent('moved', old_path, is_dir, new_path=new_path_and_is_dir[0]))
+            else:
+                if is_dir:
+                    self.drop_tree(old_path)
+                events.append(FileSystemEvent('deleted', old_path, is_dir))
+        for new_path, is_dir in created.values():
+            if is_dir:
+                self.add_tree(new_path)
+            events.append(FileSystemEvent('created', new_path, is_dir))
+
+        return events
+
+    def drop_tree(self, top: Text):
+        top_prefix = top + os.sep
+        for dir_path in [dir_path for dir_path in self.directories if dir_path == top or dir_path.startswith(top_prefix)]:
+            del self.directories[dir_path]
+
+    def rename_tree(self, old_top: Text, new_top: Text):
+        old_prefix = old_top + os.sep
+        for dir_path in [dir_path for dir_path in self.directories if dir_path == old_top or dir_path.startswith(old_prefix)]:
+            self.directories[new_top + dir_path[len(old_top):]] = self.directories.pop(dir_path)
+
+    def close(self):
+        self.directories.clear()
@@ -0,0 +1,171 @@
+from typing import Dict, Iterable, List, Text, Tuple
+import ctypes
+import ctypes.util
+import errno
+import os
+import os.path
+import select
+import struct
+
+from mmm.core.fs_events import FileSystemEvent
+
+
+# From <sys/inotify.h>
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR | IN_EXCL_UNLINK
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class InotifyUnavailableError(OSError):
+    # inotify can't be used here: not Linux, no libc symbol, or the per-user watch/instance limit has been reached
+    pass
+
+
+_libc = None
+
+
+def get_libc() -> ctypes.CDLL:
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError) as e:
+            raise InotifyUnavailableError(f'inotify is not available: {e}')
+        _libc = libc
+    return _libc
+
+
+class InotifyWatcher:
+    # Watches every directory under the given roots with one inotify instance, via ctypes so there is no extra
+    # dependency. inotify is not recursive: new subdirectories get their own watch as they appear, and directory
+    # moves rewrite the paths of the watches beneath them.
+
+    def __init__(self):
+        libc = get_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            error_number = ctypes.get_errno()
+            raise InotifyUnavailableError(error_number, f'inotify_init1 failed: {os.strerror(error_number)}')
+        self.libc = libc
+        self.fd = fd
+        self.watch_paths: Dict[int, Text] = dict()
+
+    def add_watch(self, dir_path: Text):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            error_number = ctypes.get_errno()
+            if error_number == errno.ENOSPC:
+                raise InotifyUnavailableError(error_number, f'inotify watch limit reached at "{dir_path}"; see /proc/sys/fs/inotify/max_user_watches')
+            if error_number in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                # Gone already or unreadable; a later event covers the first case, the scanner skips the second
+                return
+            raise OSError(error_number, f'inotify_add_watch failed for "{dir_path}": {os.strerror(error_number)}')
+        self.watch_paths[wd] = dir_path
+
+    def add_tree(self, top: Text, dir_paths: Iterable[Text] = None):
+        # dir_paths, when known (e.g. from the scan cache), saves walking the tree just to find its directories
+        if dir_paths is None:
+            dir_paths = (dir_path for dir_path, _dir_names, _file_names in os.walk(top))
+        for dir_path in dir_paths:
+            self.add_watch(dir_path)
+
+    def read_events(self, timeout: float) -> List[FileSystemEvent]:
+        readable, _writable, _exceptional = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return list()
+
+        events = list()
+        moved_from: Dict[int, Tuple[Text, bool]] = dict()
+
+        # Drain everything queued so MOVED_FROM/MOVED_TO pairs that straddle a read still get matched
+        while True:
+            try:
+                buffer = os.read(self.fd, READ_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+                offset += INOTIFY_EVENT_HEADER.size
+                name = os.fsdecode(buffer[offset:offset + name_length].rstrip(b'\0'))
+                offset += name_length
+
+                if mask & IN_Q_OVERFLOW:
+                    events.append(FileSystemEvent('overflow', ''))
+                    continue
+                if mask & IN_IGNORED:
+                    self.watch_paths.pop(wd, None)
+                    continue
+
+                dir_path = self.watch_paths.get(wd)
+                if dir_path is None:
+                    continue
+
+                path = os.path.join(dir_path, name)
+                is_dir = bool(mask & IN_ISDIR)
+
+                if mask & IN_CREATE:
+                    if is_dir:
+                        self.add_tree(path)
+                    events.append(FileSystemEvent('created', path, is_dir))
+                elif mask & IN_DELETE:
+                    events.append(FileSystemEvent('deleted', path, is_dir))
+                elif mask & IN_MOVED_FROM:
+                    moved_from[cookie] = (path, is_dir)
+                elif mask & IN_MOVED_TO:
+                    from_path, _from_is_dir = moved_from.pop(cookie, (None, is_dir))
+                    if from_path is None:
+                        # Moved in from outside the watched tree
+                        if is_dir:
+                            self.add_tree(path)
+                        events.append(FileSystemEvent('created', path, is_dir))
+                    else:
+                        if is_dir:
+                            self.rename_watches(from_path, path)
+                        events.append(FileSystemEvent('moved', from_path, is_dir, new_path=path))
+
+        # Moved out of the watched tree
+        for from_path, is_dir in moved_from.values():
+            if is_dir:
+                self.remove_watches(from_path)
+            events.append(FileSystemEvent('deleted', from_path, is_dir))
+
+        return events
+
+    def rename_watches(self, old_dir_path: Text, new_dir_path: Text):
+        old_prefix = old_dir_path + os.sep
+        for wd, dir_path in self.watch_paths.items():
+            if dir_path == old_dir_path:
+                self.watch_paths[wd] = new_dir_path
+            elif dir_path.startswith(old_prefix):
+                self.watch_paths[wd] = new_dir_path + dir_path[len(old_dir_path):]
+
+    def remove_watches(self, old_dir_path: Text):
+        old_prefix = old_dir_path + os.sep
+        for wd, dir_path in list(self.watch_paths.items()):
+            if dir_path == old_dir_path or dir_path.startswith(old_prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watch_paths[wd]
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
@@ -0,0 +1,175 @@
+from typing import Callable, Dict, Iterable, List, Optional, Text
+import dataclasses
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+import threading
+import time
+
+from mmm.core.fingerprint import FileIdentity
+from mmm.core.library_journal import LibraryJournal
+from mmm.core.library_reconcile import LibraryChangeSet, reconcile_scan
+from mmm.core.video_file import VideoFile
+
+
+CATALOG_VERSION = 1
+CATALOG_MANIFEST_NAME = 'catalog.json'
+
+
+@dataclasses.dataclass
+class CatalogShard:
+    root_path: Text
+    shard_file_name: Text  # in the catalog directory
+    video_file_count: int = 0
+    last_scan_time: float = 0.0  # time.time() of the last completed scan, 0 if never scanned
+
+
+def normalize_root_path(root_path: Text) -> Text:
+    return os.path.normpath(os.path.abspath(root_path))
+
+
+def is_catalog_manifest(library_path: Text) -> bool:
+    return os.path.basename(library_path) == CATALOG_MANIFEST_NAME
+
+
+def probe_online_roots(root_paths: Iterable[Text], timeout: float = 1.0) -> Dict[Text, bool]:
+    # A root on an unplugged drive is simply missing (or an empty mount point), but one on a dead network mount can
+    # block a stat for minutes. Each root is probed on its own daemon thread, and whatever hasn't answered within
+    # timeout seconds counts as offline: a probe stuck in the kernel is abandoned, never waited for.
+    root_paths = list(root_paths)
+    online_roots: Dict[Text, bool] = dict()
+
+    def probe_root(root_path: Text):
+        try:
+            with os.scandir(root_path) as dir_entries:
+                # An empty directory is most likely the mount point of a drive that isn't mounted
+                online_roots[root_path] = next(dir_entries, None) is not None
+        except OSError:
+            online_roots[root_path] = False
+
+    probe_threads = [threading.Thread(target=probe_root, args=(root_path,), daemon=True, name='CatalogRootProbe') for root_path in root_paths]
+    for probe_thread in probe_threads:
+        probe_thread.start()
+    deadline = time.monotonic() + timeout
+    for probe_thread in probe_threads:
+        probe_thread.join(max(0.0, deadline - time.monotonic()))
+    return {root_path: online_roots.get(root_path, False) for root_path in root_paths}
+
+
+class LibraryCatalog:
+    # A library split into one shard per scan root (movies, TV, archive drives, ...). Each shard is an ordinary
+    # library file in the catalog directory, with its own journal and snapshot, and catalog.json is a small
+    # manifest listing the shards with their record counts and last scan times. Opening a catalog reads only the
+    # manifest; a shard is loaded when it is browsed, so startup time and memory follow what is on screen rather
+    # than the size of the whole collection. Shards live with the catalog rather than on their roots, so a drive
+    # that is offline can still be browsed; it just isn't scanned.
+    #
+    # The manifest may be updated by several processes (the command line scanning one root while a front end
+    # browses another), so save() merges this catalog's changes into what is on disk instead of overwriting it.
+
+    def __init__(self, catalog_dir: Text):
+        self.catalog_dir = catalog_dir
+        self.manifest_path = os.path.join(catalog_dir, CATALOG_MANIFEST_NAME)
+        self.shards: Dict[Text, CatalogShard] = dict()  # root_path -> shard, in the order roots were added
+        self.updated_roots: Dict[Text, None] = dict()
+        self.lock = threading.RLock()
+
+    @classmethod
+    def load(cls, catalog_path: Text) -> 'LibraryCatalog':
+        # catalog_path is the catalog directory or its catalog.json
+        catalog = cls(os.path.dirname(catalog_path) if is_catalog_manifest(catalog_path) else catalog_path)
+        catalog.shards = cls.read_shards(catalog.manifest_path)
+        return catalog
+
+    @staticmethod
+    def read_shards(manifest_path: Text) -> Dict[Text, CatalogShard]:
+        try:
+            with open(manifest_path, encoding='utf8') as f:
+                manifest_json = json.load(f)
+        except FileNotFoundError:
+            return dict()
+
+        if manifest_json.get('version') != CATALOG_VERSION:
+            raise ValueError(f'"{manifest_path}" is not a version {CATALOG_VERSION} library catalog')
+        return {shard_dict['root_path']: CatalogShard(**shard_dict) for shard_dict in manifest_json['shards']}
+
+    def save(self):
+        with self.lock:
+            os.makedirs(self.catalog_dir, exist_ok=True)
+            shards = self.read_shards(self.manifest_path)
+            for root_path in self.updated_roots:
+                shards[root_path] = self.shards[root_path]
+            manifest_json = {
+                'version': CATALOG_VERSION,
+                'shards': [dataclasses.asdict(shard) for shard in shards.values()],
+            }
+
+            fd, temp_path = tempfile.mkstemp(dir=self.catalog_dir, prefix='.catalog_', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf8') as f:
+                    f.write(json.dumps(manifest_json, indent=1, ensure_ascii=False))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.manifest_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+            self.shards = shards
+            self.updated_roots.clear()
+
+    def add_root(self, root_path: Text) -> CatalogShard:
+        with self.lock:
+            root_path = normalize_root_path(root_path)
+            shard = self.shards.get(root_path)
+            if shard is None:
+                root_hash = hashlib.sha1(root_path.encode('utf8')).hexdigest()[:12]
+                root_name = ''.join(c if c.isalnum() else '_' for c in os.path.basename(root_path))[:40]
+                shard = CatalogShard(root_path=root_path, shard_file_name=f'shard_{root_name}_{root_hash}.json')
+                self.shards[root_path] = shard
+                self.updated_roots[root_path] = None
+            return shard
+
+    def shard_for_path(self, path: Text) -> Optional[CatalogShard]:
+        # The shard whose root holds path (the innermost one, if roots are nested)
+        path = normalize_root_path(path)
+        matching_shards = [shard for root_path, shard in self.shards.items() if path == root_path or path.startswith(os.path.join(root_path, ''))]
+        return max(matching_shards, key=lambda shard: len(shard.root_path), default=None)
+
+    def shard_path(self, shard: CatalogShard) -> Text:
+        return os.path.join(self.catalog_dir, shard.shard_file_name)
+
+    def open_shard(self, shard: CatalogShard) -> LibraryJournal:
+        os.makedirs(self.catalog_dir, exist_ok=True)
+        return LibraryJournal(self.shard_path(shard))
+
+    def record_scan(self, root_path: Text, video_file_count: int, scan_time: float = None):
+        with self.lock:
+            shard = self.add_root(root_path)
+            shard.video_file_count = video_file_count
+            shard.last_scan_time = scan_time if scan_time is not None else time.time()
+            self.updated_roots[shard.root_path] = None
+
+    def online_roots(self, timeout: float = 1.0) -> Dict[Text, bool]:
+        return probe_online_roots(list(self.shards), timeout=timeout)
+
+    def merge_scan(self, root_path: Text, scanned_video_files: List[VideoFile], recorded_identity: Callable[[Text], Optional[FileIdentity]] = None) -> LibraryChangeSet:
+        # Folds a completed scan of root_path into its shard, keeping IMDB details, and saves the shard and the
+        # manifest. Only that shard is loaded; for one that is on screen, reconcile in memory and use record_scan().
+        shard = self.add_root(root_path)
+        shard_store = self.open_shard(shard)
+        is_new_shard = not os.path.exists(shard_store.library_path)
+
+        video_files = shard_store.load()
+        change_set = reconcile_scan(video_files, scanned_video_files, root_path, recorded_identity=recorded_identity)
+        if is_new_shard:
+            shard_store.write_full(video_files)
+        else:
+            shard_store.save_dirty(video_files, change_set.removed_file_paths)
+            shard_store.wait_for_compaction()
+
+        self.record_scan(shard.root_path, len(video_files))
+        self.save()
+        print(f'LibraryCatalog: Merged scan of "{shard.root_path}" into "{shard.shard_file_name}": {change_set.summary()}')
+        return change_set
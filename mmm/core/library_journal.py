@@ -0,0 +1,329 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Text, Tuple
+import json
+import os
+import os.path
+import secrets
+import threading
+
+from mmm.core.library_snapshot import LibrarySnapshot, journal_offset_for, library_source_state, write_snapshot
+from mmm.core.video_file import LoadProgress, VideoFile, iter_video_file_batches, iter_video_file_dicts, video_file_as_dict
+
+
+class LibraryJournal:
+    # Saves edits to a library file without rewriting it. The library file (a JSON array, or NDJSON) is the base;
+    # saving appends only the dirty records to "<library>.journal", one JSON object per line, written with a single
+    # write() and fsync'd, so a save costs about as much as the records that changed. A removed record is a line
+    # {"file_path": ..., "removed": true}. Loading streams the base and replays the journal over it, by file_path.
+    #
+    # Compaction folds the journal back into the base on a background thread: the journal is first renamed to
+    # "<library>.compacting" so saves carry on into a fresh journal, then base + compacting journal are written to a
+    # temp file that replaces the base. Replaying a record twice is harmless, so a crash at any point leaves
+    # base + compacting journal + journal describing the same library.
+    #
+    # A load also leaves a LibrarySnapshot at "<library>.snapshot", and the next load reads that instead of parsing
+    # the base, or doesn't read it at all if nothing has been saved since (open_rows()). It records which base and
+    # journals it was taken from: saves since then are replayed from the journal on top of it, and once the base has
+    # been replaced (by a compaction or a full save) it is deleted and rebuilt.
+
+    def __init__(self, library_path: Text, compact_threshold_bytes: int = 4 * 1024 * 1024):
+        self.library_path = library_path
+        self.journal_path = library_path + '.journal'
+        self.compacting_path = library_path + '.compacting'
+        self.snapshot_path = library_path + '.snapshot'
+        self.compact_threshold_bytes = compact_threshold_bytes
+        self.append_lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
+        self.compaction_thread: threading.Thread = None
+        self.journal_tail_checked = False
+
+    def read_journal_records(self, journal_offset: int = None) -> Dict[Text, Optional[dict]]:
+        # file_path -> latest video file dict, or None if removed; the compacting journal (if a compaction was
+        # interrupted) is older than the live one, so it is replayed first. With journal_offset, only what was
+        # appended to the live journal after that offset is read (the rest is already in a snapshot).
+        journal_records: Dict[Text, Optional[dict]] = dict()
+        if journal_offset is None:
+            self.replay_journal_file(self.compacting_path, journal_records)
+        self.replay_journal_file(self.journal_path, journal_records, journal_offset or 0)
+        return journal_records
+
+    @staticmethod
+    def replay_journal_file(journal_path: Text, journal_records: Dict[Text, Optional[dict]], start_offset: int = 0):
+        try:
+            with open(journal_path, 'rb') as f:
+                f.seek(start_offset)
+                for journal_line in f:
+                    try:
+                        video_file_dict = json.loads(journal_line)
+                    except ValueError:
+                        # A save torn by a crash can only leave a partial last line
+                        print(f'LibraryJournal: Ignoring incomplete record at the end of "{journal_path}"')
+                        break
+                    # Re-insert so records added since the last compaction keep the order they were saved in
+                    file_path = video_file_dict['file_path']
+                    journal_records.pop(file_path, None)
+                    journal_records[file_path] = None if video_file_dict.get('removed') else video_file_dict
+        except FileNotFoundError:
+            pass
+
+    def library_source_state(self) -> dict:
+        return library_source_state(self.library_path, self.journal_path, self.compacting_path)
+
+    def open_snapshot(self, source_state: dict) -> Optional[LibrarySnapshot]:
+        # The snapshot, if there is one and it was taken from the library as it still is; a stale or unreadable
+        # snapshot is deleted
+        try:
+            snapshot = LibrarySnapshot(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f'LibraryJournal: Discarding snapshot: {e}')
+            self.discard_snapshot()
+            return None
+
+        if journal_offset_for(snapshot.source, source_state) is None:
+            print(f'LibraryJournal: Discarding stale snapshot "{self.snapshot_path}"')
+            snapshot.close()
+            self.discard_snapshot()
+            return None
+        return snapshot
+
+    def discard_snapshot(self):
+        try:
+            os.remove(self.snapshot_path)
+        except FileNotFoundError:
+            pass
+
+    def save_snapshot(self, video_files: Sequence[VideoFile], source_state: dict):
+        # A snapshot is a cache; failing to write one (read-only folder, disk full) must not fail a load or a save
+        try:
+            write_snapshot(self.snapshot_path, video_files, source_state)
+        except OSError as e:
+            print(f'LibraryJournal: Unable to write snapshot "{self.snapshot_path}": {e}')
+
+    def open_rows(self) -> Optional[LibrarySnapshot]:
+        # The library as its snapshot, read row by row as a view asks for rows rather than loaded, if the snapshot
+        # holds all of it. None if there is no snapshot yet or saves since need replaying: iter_batches() then loads
+        # the library and brings the snapshot up to date, so the next load can use it.
+        source_state = self.library_source_state()
+        snapshot = self.open_snapshot(source_state)
+        if snapshot is None:
+            return None
+        journal_size = source_state['journal'][2] if source_state['journal'] else 0
+        if journal_size > journal_offset_for(snapshot.source, source_state):
+            snapshot.close()
+            return None
+        return snapshot
+
+    def iter_batches(self, batch_size: int = 5000, first_batch_size: int = 200, use_snapshot: bool = True, load_progress: LoadProgress = None) -> Iterator[List[VideoFile]]:
+        # The library as of the last save: base records in their order, edited ones replaced in place, removed ones
+        # dropped, and records added since the last compaction at the end. Journal records are read before the base
+        # is opened, so a concurrent compaction can only make the base newer, never lose an edit. The state of the
+        # files is taken before either, so a snapshot written afterwards can only claim less than it holds, and
+        # replaying a journal record it already holds is harmless.
+        source_state = self.library_source_state()
+        snapshot = self.open_snapshot(source_state) if use_snapshot else None
+
+        if snapshot is not None:
+            journal_records = self.read_journal_records(journal_offset_for(snapshot.source, source_state))
+            base_batches = snapshot.iter_batches(batch_size=batch_size, first_batch_size=first_batch_size, load_progress=load_progress)
+        else:
+            journal_records = self.read_journal_records()
+            base_batches = iter_video_file_batches(self.library_path, batch_size=batch_size, first_batch_size=first_batch_size, load_progress=load_progress) if os.path.exists(self.library_path) else iter(())
+        # A new snapshot if there was none or saves were replayed on top of it, so the next load can use open_rows()
+        loaded_video_files = list() if use_snapshot and (snapshot is None or journal_records) else None
+
+        try:
+            for video_files in base_batches:
+                if journal_records:
+                    replayed_video_files = list()
+                    for video_file in video_files:
+                        if video_file.file_path in journal_records:
+                            video_file_dict = journal_records.pop(video_file.file_path)
+                            if video_file_dict is None:
+                                continue
+                            video_file = VideoFile(**video_file_dict)
+                        replayed_video_files.append(video_file)
+                    video_files = replayed_video_files
+                if loaded_video_files is not None:
+                    loaded_video_files.extend(video_files)
+                if video_files:
+                    yield video_files
+        finally:
+            if snapshot is not None:
+                snapshot.close()
+
+        added_video_files = [VideoFile(**video_file_dict) for video_file_dict in journal_records.values() if video_file_dict is not None]
+        for first_index in range(0, len(added_video_files), batch_size):
+            yield added_video_files[first_index:first_index + batch_size]
+
+        if loaded_video_files is not None and source_state['library'] is not None:
+            # Once everything has been handed out, so the snapshot never delays the rows being shown
+            loaded_video_files.extend(added_video_files)
+            self.save_snapshot(loaded_video_files, source_state)
+
+    def load(self) -> List[VideoFile]:
+        video_files_data = list()
+        for video_files in self.iter_batches():
+            video_files_data.extend(video_files)
+        return video_files_data
+
+    def save_dirty(self, video_files: Iterable[VideoFile], removed_file_paths: Iterable[Text] = ()) -> int:
+        # Journals every record with is_dirty set, plus removals, and clears is_dirty once they are on disk
+        dirty_video_files = [video_file for video_file in video_files if video_file.is_dirty]
+        removed_file_paths = list(removed_file_paths)
+        if not dirty_video_files and not removed_file_paths:
+            return 0
+
+        journal_lines = [json.dumps({'file_path': file_path, 'removed': True}, ensure_ascii=False) for file_path in removed_file_paths]
+        for video_file in dirty_video_files:
+            video_file_dict = video_file_as_dict(video_file)
+            video_file_dict['is_dirty'] = False
+            journal_lines.append(json.dumps(video_file_dict, ensure_ascii=False))
+        self.append(''.join(journal_line + '\n' for journal_line in journal_lines).encode('utf8'))
+
+        for video_file in dirty_video_files:
+            video_file.is_dirty = False
+
+        if self.journal_size() >= self.compact_threshold_bytes:
+            self.compact_in_background()
+
+        return len(dirty_video_files) + len(removed_file_paths)
+
+    def append(self, journal_bytes: bytes):
+        with self.append_lock:
+            if not self.journal_tail_checked:
+                self.truncate_torn_tail()
+                self.journal_tail_checked = True
+
+            created = not os.path.exists(self.journal_path)
+            fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                written = 0
+                while written < len(journal_bytes):
+                    written += os.write(fd, journal_bytes[written:])
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+            if created:
+                fsync_directory(os.path.dirname(os.path.abspath(self.journal_path)))
+
+    def truncate_torn_tail(self):
+        # Drop a partial last line left by a crash mid-save, so the next record starts on a line of its own
+        try:
+            with open(self.journal_path, 'rb+') as f:
+                journal_size = f.seek(0, os.SEEK_END)
+                tail_size = min(journal_size, 64 * 1024)
+                f.seek(journal_size - tail_size)
+                tail = f.read(tail_size)
+                if tail and not tail.endswith(b'\n'):
+                    f.truncate(journal_size - tail_size + tail.rfind(b'\n') + 1)
+        except FileNotFoundError:
+            pass
+
+    def journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def write_full(self, video_files: Iterable[VideoFile]):
+        # Writes the whole library as a new base and drops the journals, e.g. for a new library or "Save As"
+        with self.compaction_lock, self.append_lock:
+            write_library_file(self.library_path, (video_file_as_dict(video_file) for video_file in video_files))
+            for journal_path in (self.compacting_path, self.journal_path):
+                try:
+                    os.remove(journal_path)
+                except FileNotFoundError:
+                    pass
+            self.journal_tail_checked = False
+
+            if isinstance(video_files, Sequence):
+                self.save_snapshot(video_files, self.library_source_state())
+            else:
+                self.discard_snapshot()
+
+    def compact(self):
+        with self.compaction_lock:
+            if not os.path.exists(self.compacting_path):
+                with self.append_lock:
+                    if self.journal_size() == 0:
+                        return
+                    os.replace(self.journal_path, self.compacting_path)
+                    self.journal_tail_checked = False
+
+            compacting_records: Dict[Text, Optional[dict]] = dict()
+            self.replay_journal_file(self.compacting_path, compacting_records)
+
+            def iter_compacted_dicts():
+                if os.path.exists(self.library_path):
+                    for video_file_dict in iter_video_file_dicts(self.library_path):
+                        file_path = video_file_dict['file_path']
+                        if file_path in compacting_records:
+                            video_file_dict = compacting_records.pop(file_path)
+                            if video_file_dict is None:
+                                continue
+                        yield video_file_dict
+                yield from (video_file_dict for video_file_dict in compacting_records.values() if video_file_dict is not None)
+
+            write_library_file(self.library_path, iter_compacted_dicts())
+            os.remove(self.compacting_path)
+            print(f'LibraryJournal: Compacted journal into "{self.library_path}"')
+
+    def compact_in_background(self):
+        if self.compaction_thread is not None and self.compaction_thread.is_alive():
+            return
+        self.compaction_thread = threading.Thread(target=self.compact, daemon=True, name='LibraryJournalCompaction')
+        self.compaction_thread.start()
+
+    def wait_for_compaction(self):
+        if self.compaction_thread is not None:
+            self.compaction_thread.join()
+
+
+def fsync_directory(dir_path: Text):
+    # Makes a rename or a newly created file in dir_path durable
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def create_temp_file(path_prefix: Text) -> Tuple[int, Text]:
+    # Like tempfile.mkstemp(), but created with mode 0o666 rather than 0o600, so the kernel applies the umask just as
+    # it does for a file opened with open()
+    while True:
+        temp_path = f'{path_prefix}{secrets.token_hex(4)}.tmp'
+        try:
+            return os.open(temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666), temp_path
+        except FileExistsError:
+            continue
+
+
+def write_library_file(library_path: Text, video_file_dicts: Iterable[dict]):
+    # A JSON array with one record per line: loadable by json.load and by the streaming loader alike, and written
+    # record by record so memory stays flat. Replaces library_path atomically once it is safely on disk.
+    library_dir = os.path.dirname(os.path.abspath(library_path))
+    fd, temp_path = create_temp_file(os.path.join(library_dir, '.' + os.path.basename(library_path) + '.'))
+    try:
+        # Keep the mode the library file had; a new one gets the mode open() would have given it
+        try:
+            os.fchmod(fd, os.stat(library_path).st_mode & 0o777)
+        except FileNotFoundError:
+            pass
+
+        with os.fdopen(fd, 'w', encoding='utf8') as f:
+            separator = '[\n'
+            for video_file_dict in video_file_dicts:
+                # json.dumps() uses the C encoder; json.dump() streams through the pure-Python one
+                f.write(separator + json.dumps(video_file_dict, ensure_ascii=False))
+                separator = ',\n'
+            f.write('[]\n' if separator == '[\n' else '\n]\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, library_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    fsync_directory(library_dir)
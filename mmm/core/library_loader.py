@@ -0,0 +1,59 @@
+from typing import Callable, List, Sequence, Text
+import os.path
+import sqlite3
+
+from mmm.core.library_store import open_library
+from mmm.core.video_file import LoadProgress, VideoFile
+
+
+class LibraryLoader:
+    # Loads a library (any format open_library() reads) on whatever thread calls load(); front ends run it on their
+    # own worker thread, as they do a ScanEngine. Each batch of VideoFiles goes to batch_sink on that thread
+    # (a VideoFileBatchQueue.put_many the main loop polls, or a Qt Signal.emit). load_progress tells the UI how far
+    # it has got, and cancel() stops the load at the next batch.
+    #
+    # A library whose store can hand out read-only rows (a LibrarySnapshot that is up to date, or SqliteLibraryRows)
+    # isn't loaded at all: video_file_rows is set instead and no batch is sent. Front ends show it as it is, so only
+    # the rows on screen are ever decoded, and copy it into a list of their own when they first edit it.
+
+    def __init__(self, library_path: Text, batch_sink: Callable[[List[VideoFile]], object]):
+        self.library_path = library_path
+        self.batch_sink = batch_sink
+        self.library_store = None
+        self.load_progress = LoadProgress()
+        self.keep_loading = True
+        self.error: Text = None
+        self.video_file_rows: Sequence[VideoFile] = None
+
+    @property
+    def is_cancelled(self) -> bool:
+        return not self.keep_loading
+
+    def cancel(self):
+        self.keep_loading = False
+
+    def load(self) -> bool:
+        # True if the whole library was loaded; otherwise it was cancelled, or error says why it failed
+        try:
+            # Opening a library that doesn't exist would start an empty one; loading one is a mistake
+            if not os.path.exists(self.library_path):
+                raise FileNotFoundError(f'No such library: "{self.library_path}"')
+            self.library_store = open_library(self.library_path)
+
+            self.video_file_rows = self.library_store.open_rows()
+            if self.video_file_rows is not None:
+                self.load_progress.total = self.load_progress.done = len(self.video_file_rows)
+                return self.keep_loading
+
+            # The library file plus any edits journaled since it was last compacted
+            for video_files in self.library_store.iter_batches(load_progress=self.load_progress):
+                if not self.keep_loading:
+                    print(f'LibraryLoader: Cancelled loading "{self.library_path}"')
+                    return False
+                self.batch_sink(video_files)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f'LibraryLoader: Unable to load "{self.library_path}": {e}')
+            self.error = str(e)
+            return False
+
+        return self.keep_loading
@@ -0,0 +1,169 @@
+from typing import Callable, Dict, Iterable, List, Optional, Text, Tuple
+import dataclasses
+import os
+import os.path
+
+from mmm.core.fingerprint import FileIdentity, file_identity
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+
+
+@dataclasses.dataclass
+class LibraryChangeSet:
+    # What reconcile_scan() did to a library. Renamed and rescrubbed records keep their IMDB metadata; they, and
+    # the added records, are marked dirty, so a dirty save writes exactly them plus removed_file_paths.
+    added: List[VideoFile] = dataclasses.field(default_factory=list)  # appended to the end of the library
+    removed: List[VideoFile] = dataclasses.field(default_factory=list)
+    renamed: List[Tuple[Text, VideoFile]] = dataclasses.field(default_factory=list)  # (old file_path, the record at its new path)
+    rescrubbed: List[VideoFile] = dataclasses.field(default_factory=list)  # same path, new scrubbed name or year
+    unchanged_count: int = 0
+    removed_indices: List[int] = dataclasses.field(default_factory=list)  # ascending, into the library as it was before
+    changed_indices: List[int] = dataclasses.field(default_factory=list)  # renamed and rescrubbed, into the library after removals
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.renamed or self.rescrubbed)
+
+    @property
+    def removed_file_paths(self) -> List[Text]:
+        # Paths a saved library should no longer have a record under
+        return [video_file.file_path for video_file in self.removed] + [old_file_path for old_file_path, _video_file in self.renamed]
+
+    def library_edit(self) -> LibraryEdit:
+        # The same edit in the form view models already mirror for LibraryWatch changes
+        return LibraryEdit(removed_indices=self.removed_indices, renamed_indices=self.changed_indices, added=self.added)
+
+    def summary(self) -> Text:
+        return f'{len(self.added)} added, {len(self.removed)} removed, {len(self.renamed)} renamed, {len(self.rescrubbed)} rescrubbed, {self.unchanged_count} unchanged'
+
+
+def stat_file_identity(file_path: Text) -> Optional[FileIdentity]:
+    try:
+        return file_identity(os.stat(file_path))
+    except OSError:
+        return None
+
+
+def reconcile_scan(video_files: List[VideoFile], scanned_video_files: Iterable[VideoFile], folder_path: Text,
+                   recorded_identity: Callable[[Text], Optional[FileIdentity]] = None, current_identity: Callable[[Text], Optional[FileIdentity]] = stat_file_identity) -> LibraryChangeSet:
+    # Merges a completed scan of folder_path into the library video_files, in place and in O(n): records under
+    # folder_path are indexed by file_path, each scanned file is looked up once, and only what is left unmatched on
+    # both sides is looked at again. Records outside folder_path are left alone.
+    #
+    # A record whose path is gone is matched to a new path with the same (st_dev, st_ino): recorded_identity() gives
+    # the old path's file as last scanned (ScanEngine.recorded_file_identity), current_identity() a new path's file
+    # now. A rename keeps size and mtime as well, which is what tells it apart from a new file that was handed the
+    # inode of one just deleted. Only unmatched paths are ever asked about, so a scan with few changes costs next
+    # to nothing; moves across filesystems change st_dev and show up as removed plus added.
+    #
+    # Changed records are replaced by updated copies rather than modified, so a save already running on another
+    # thread writes each record either as it was or as it is now, never half of each.
+    change_set = LibraryChangeSet()
+    folder_prefix = os.path.join(folder_path, '')
+
+    positions: Dict[Text, int] = {video_file.file_path: position for position, video_file in enumerate(video_files) if video_file.file_path.startswith(folder_prefix)}
+    unseen_positions = positions.copy()
+    replacements: Dict[int, VideoFile] = dict()
+
+    added: List[VideoFile] = list()
+    matched_count = 0
+    pop_unseen_position = unseen_positions.pop
+    for scanned_video_file in scanned_video_files:
+        file_path = scanned_video_file.file_path
+        position = pop_unseen_position(file_path, None)
+        if position is None:
+            if file_path not in positions:
+                added.append(scanned_video_file)
+            continue
+
+        matched_count += 1
+        video_file = video_files[position]
+        if video_file.scrubbed_file_name != scanned_video_file.scrubbed_file_name or video_file.scrubbed_file_year != scanned_video_file.scrubbed_file_year:
+            # Scrubbed with different settings since the record was made
+            video_file = dataclasses.replace(video_file, scrubbed_file_name=scanned_video_file.scrubbed_file_name, scrubbed_file_year=scanned_video_file.scrubbed_file_year, is_dirty=True)
+            replacements[position] = video_file
+            change_set.rescrubbed.append(video_file)
+    change_set.unchanged_count = matched_count - len(change_set.rescrubbed)
+
+    if unseen_positions and added and recorded_identity is not None:
+        missing_positions: Dict[FileIdentity, int] = dict()
+        for file_path, position in unseen_positions.items():
+            identity = recorded_identity(file_path)
+            if identity is not None:
+                missing_positions.setdefault(identity, position)
+
+        if missing_positions:
+            still_added = list()
+            for scanned_video_file in added:
+                identity = current_identity(scanned_video_file.file_path)
+                position = missing_positions.pop(identity, None) if identity is not None else None
+                if position is None:
+                    still_added.append(scanned_video_file)
+                    continue
+
+                video_file = video_files[position]
+                del unseen_positions[video_file.file_path]
+                renamed_video_file = dataclasses.replace(video_file, file_path=scanned_video_file.file_path, scrubbed_file_name=scanned_video_file.scrubbed_file_name, scrubbed_file_year=scanned_video_file.scrubbed_file_year, is_dirty=True)
+                replacements[position] = renamed_video_file
+                change_set.renamed.append((video_file.file_path, renamed_video_file))
+            added = still_added
+
+    change_set.removed_indices = sorted(unseen_positions.values())
+    change_set.removed = [video_files[position] for position in change_set.removed_indices]
+
+    if change_set.removed_indices:
+        removed_positions = set(change_set.removed_indices)
+        kept_video_files = list()
+        for position, video_file in enumerate(video_files):
+            if position in removed_positions:
+                continue
+            replacement = replacements.get(position)
+            if replacement is not None:
+                change_set.changed_indices.append(len(kept_video_files))
+                video_file = replacement
+            kept_video_files.append(video_file)
+        video_files[:] = kept_video_files
+    else:
+        for position in sorted(replacements):
+            video_files[position] = replacements[position]
+            change_set.changed_indices.append(position)
+
+    for video_file in added:
+        video_file.is_dirty = True
+    video_files.extend(added)
+    change_set.added = added
+    return change_set
+
+
+def apply_library_diff(video_files: List[VideoFile], new_video_files: Iterable[VideoFile]) -> LibraryEdit:
+    # Makes video_files hold the same records as new_video_files (the same library loaded again, say), in place,
+    # and returns the smallest edit that does it, so a view updates just the rows that differ instead of being
+    # reset and losing its scroll position and selection. Records are matched by file_path: ones whose fields all
+    # match are left where they are, differing ones are replaced in place, missing ones removed and new ones
+    # appended. Records keep their current order; only new ones go at the end.
+    new_by_path: Dict[Text, VideoFile] = dict()
+    for new_video_file in new_video_files:
+        new_by_path.setdefault(new_video_file.file_path, new_video_file)
+
+    removed_indices: List[int] = list()
+    changed_indices: List[int] = list()
+    kept_video_files: List[VideoFile] = list()
+    seen_paths = set()
+    for position, video_file in enumerate(video_files):
+        new_video_file = new_by_path.get(video_file.file_path)
+        if new_video_file is None or video_file.file_path in seen_paths:
+            removed_indices.append(position)
+            continue
+        seen_paths.add(video_file.file_path)
+        if new_video_file != video_file:
+            changed_indices.append(len(kept_video_files))
+            video_file = new_video_file
+        kept_video_files.append(video_file)
+
+    added = [new_video_file for file_path, new_video_file in new_by_path.items() if file_path not in seen_paths]
+    if removed_indices:
+        video_files[:] = kept_video_files
+    else:
+        for position in changed_indices:
+            video_files[position] = kept_video_files[position]
+    video_files.extend(added)
+    return LibraryEdit(removed_indices=removed_indices, renamed_indices=changed_indices, added=added)
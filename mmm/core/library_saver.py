@@ -0,0 +1,120 @@
+from typing import Callable, Iterable, List, Optional, Sequence, Text
+import collections.abc
+import dataclasses
+import queue
+import threading
+import time
+
+from mmm.core.video_file import VideoFile
+
+
+@dataclasses.dataclass
+class LibrarySaveResult:
+    library_path: Text
+    is_full_save: bool
+    saved_count: int = 0
+    elapsed: float = 0.0
+    error: Optional[Text] = None
+    unsaved_video_files: List[VideoFile] = dataclasses.field(default_factory=list)  # if the save failed: mark these dirty again
+    unsaved_removed_file_paths: List[Text] = dataclasses.field(default_factory=list)  # ... and pass these to the next save
+
+
+@dataclasses.dataclass
+class LibrarySaveRequest:
+    library_store: object  # LibraryJournal or SqliteLibraryStore
+    is_full_save: bool
+    video_files: Sequence[VideoFile]
+    removed_file_paths: List[Text]
+    unsaved_video_files: List[VideoFile]
+
+
+class LibrarySaver(threading.Thread):
+    # Saves libraries on a worker thread so the UI never waits for serializing or writing. The save_* methods are
+    # called on the UI thread and only take a snapshot there:
+    #
+    #   save_dirty()   copies the dirty records (usually a handful) and clears their is_dirty flags
+    #   save_full()    copies the list itself, not the records: VideoFile fields hold immutable values that edits
+    #                  replace rather than mutate, so each field is written as it was either before or after an edit
+    #
+    # Either way, a record edited while a save is running is dirty again afterwards and goes into the next save. A
+    # library still shown as the read-only rows it was loaded as (see is_read_only_rows()) hasn't been edited: it has
+    # nothing dirty to save, and a full save writes the rows as they are, on the saver thread.
+    # Saves run one at a time in the order requested; each reports a LibrarySaveResult through completion_sink, on
+    # the saver thread (front ends wrap it in GLib.idle_add or a Qt Signal.emit). If a save fails, the records and
+    # removals it held are listed in the result so the UI can put them back into the next save.
+
+    def __init__(self, completion_sink: Callable[[LibrarySaveResult], object]):
+        super().__init__(daemon=True, name='LibrarySaver')
+        self.completion_sink = completion_sink
+        self.save_requests: queue.Queue = queue.Queue()
+        self.pending_count = 0
+        self.pending_lock = threading.Condition()
+
+    @property
+    def is_saving(self) -> bool:
+        return self.pending_count > 0
+
+    def save_dirty(self, library_store, video_files: Iterable[VideoFile], removed_file_paths: Iterable[Text] = ()) -> bool:
+        # Returns False if there was nothing to save
+        dirty_video_files = [video_file for video_file in video_files if video_file.is_dirty] if not is_read_only_rows(video_files) else list()
+        removed_file_paths = list(removed_file_paths)
+        if not dirty_video_files and not removed_file_paths:
+            return False
+
+        video_file_copies = [dataclasses.replace(video_file) for video_file in dirty_video_files]
+        for video_file in dirty_video_files:
+            video_file.is_dirty = False
+        self.submit(LibrarySaveRequest(library_store, False, video_file_copies, removed_file_paths, dirty_video_files))
+        return True
+
+    def save_full(self, library_store, video_files: Iterable[VideoFile]):
+        if is_read_only_rows(video_files):
+            self.submit(LibrarySaveRequest(library_store, True, video_files, list(), list()))
+            return
+        video_files = list(video_files)
+        dirty_video_files = [video_file for video_file in video_files if video_file.is_dirty]
+        for video_file in dirty_video_files:
+            video_file.is_dirty = False
+        self.submit(LibrarySaveRequest(library_store, True, video_files, list(), dirty_video_files))
+
+    def submit(self, save_request: LibrarySaveRequest):
+        with self.pending_lock:
+            self.pending_count += 1
+        self.save_requests.put(save_request)
+
+    def wait_until_idle(self, timeout: float = None) -> bool:
+        # For shutdown: returns False if saves were still running after timeout seconds
+        with self.pending_lock:
+            return self.pending_lock.wait_for(lambda: self.pending_count == 0, timeout=timeout)
+
+    def stop_saving(self):
+        # Saves already requested are still written
+        self.save_requests.put(None)
+
+    def run(self):
+        while (save_request := self.save_requests.get()) is not None:
+            save_result = LibrarySaveResult(library_path=save_request.library_store.library_path, is_full_save=save_request.is_full_save)
+            start_time = time.perf_counter()
+            try:
+                if save_request.is_full_save:
+                    save_request.library_store.write_full(save_request.video_files)
+                    save_result.saved_count = len(save_request.video_files)
+                else:
+                    save_result.saved_count = save_request.library_store.save_dirty(save_request.video_files, save_request.removed_file_paths)
+            except Exception as e:
+                print(f'LibrarySaver: Unable to save "{save_result.library_path}": {e}')
+                save_result.error = str(e)
+                save_result.unsaved_video_files = save_request.unsaved_video_files
+                save_result.unsaved_removed_file_paths = save_request.removed_file_paths
+            save_result.elapsed = time.perf_counter() - start_time
+
+            with self.pending_lock:
+                self.pending_count -= 1
+                self.pending_lock.notify_all()
+            self.completion_sink(save_result)
+
+
+def is_read_only_rows(video_files: Iterable[VideoFile]) -> bool:
+    # A Sequence that can't be edited (a LibrarySnapshot or SqliteLibraryRows) rather than a list: a library shown as
+    # it was loaded
+    return isinstance(video_files, collections.abc.Sequence) and not isinstance(video_files, collections.abc.MutableSequence)
@@ -0,0 +1,301 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Text, Tuple
+from array import array
+import bisect
+import collections
+import itertools
+import operator
+import re
+
+from mmm.core.library_sort import MAX_BISECT_INSERTS, fold_text
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+NONZERO_BYTE_PATTERN = re.compile(rb'[^\x00]')
+
+# A token in more than one record in this many keeps the bitset of its records; the records of rarer tokens are
+# set bit by bit when a query asks for them. So does a prefix of up to SHORT_PREFIX_LENGTH characters when the rare
+# tokens it starts would be that many records: the first keystrokes of a search would otherwise go through
+# thousands of them.
+DENSE_TOKEN_FRACTION = 64
+SHORT_PREFIX_LENGTH = 2
+
+# A result of at most one record in this many is read off its bitset a byte at a time; a larger one is unpacked
+# and read in a single pass in C
+SPARSE_RESULT_FRACTION = 128
+
+# Front ends index an edit that adds or replaces up to this many records on the GUI thread, as are the edits made
+# while a search index was being made on a worker thread once it is done; more would hold the GUI thread up, so the
+# index is made again on a worker thread instead (unless a search is being shown, which needs it straight away)
+MAX_INDEX_CATCH_UP_RECORDS = 1000
+
+# The bits set in each byte value, for reading a sparse bitset
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def search_tokens(text: Text) -> List[Text]:
+    # Case and accent folded runs of letters and digits: "Amélie.2001.1080p" is ["amelie", "2001", "1080p"]
+    return TOKEN_PATTERN.findall(fold_text(text)) if text else list()
+
+
+def record_search_text(video_file: VideoFile) -> Text:
+    return f'{video_file.imdb_name or ""} {video_file.scrubbed_file_name or ""} {video_file.file_path or ""}'
+
+
+def bits_from_mask(mask: bytes) -> int:
+    # A byte per id (0 or 1) packed into a bitset. The bytes at each offset in eight make one int, shifted to that
+    # offset: eight passes in C over the mask rather than a Python step per id.
+    bits = 0
+    for bit in range(8):
+        bits |= int.from_bytes(mask[bit::8], 'little') << bit
+    return bits
+
+
+def mask_from_bits(bits: int, count: int) -> bytearray:
+    # The reverse of bits_from_mask()
+    mask = bytearray(count)
+    for bit in range(8):
+        lane_count = len(range(bit, count, 8))
+        mask[bit::8] = ((bits >> bit) & int.from_bytes(b'\x01' * lane_count, 'little')).to_bytes(lane_count, 'little')
+    return mask
+
+
+def bits_of(ids: Iterable[int], count: int, first_id: int = 0) -> int:
+    # The bitset of these ids, all of them at least first_id and less than count
+    mask = bytearray(count - first_id)
+    if first_id:
+        ids = map(operator.sub, ids, itertools.repeat(first_id))
+    collections.deque(map(mask.__setitem__, ids, itertools.repeat(1)), maxlen=0)
+    return bits_from_mask(mask) << first_id
+
+
+def index_library(video_files: Sequence[VideoFile]) -> 'LibrarySearchIndex':
+    # For a worker thread: indexes a copy of a library's list, or rows that can't change (a LibrarySnapshot), which
+    # are read into a list first since indexing reads every record and they are quickest read in batches. The
+    # front end then sets the index's video_files to its own list.
+    return LibrarySearchIndex(video_files if isinstance(video_files, list) else list(video_files))
+
+
+class LibrarySearchIndex:
+    # An inverted index over the text a record is searched by (its IMDB name, scrubbed name and file path), for
+    # filtering a library as the user types. Text is folded like sort keys and split into tokens at anything that
+    # isn't a letter or a digit. Each word of a query matches the records with a token that starts with it or, for a
+    # word of three or more characters that aren't all digits, has it inside ("wars" finds "StarWars"); a record
+    # matches the query when it matches every word.
+    #
+    # Records are known by an id rather than their list position, so removing one doesn't renumber the rest of the
+    # index: postings holds the ascending ids of each token's records and ids the id of each list position. A
+    # record that is replaced gets a new id, and the ids left behind just stop being live until they outnumber the
+    # records and everything is indexed again. Prefixes come from a binary search of the sorted tokens and infixes
+    # from the tokens that have all of the word's trigrams, so neither is stored per record.
+    #
+    # The records of a word are a bitset in a Python int, so intersecting words is an & in C however many records
+    # they match. Common tokens and short prefixes keep their bitsets; the rarer tokens a word matches are set a
+    # byte per id and packed. The words of the last query are kept, so a keystroke only works out the word being
+    # typed.
+
+    def __init__(self, video_files: Sequence[VideoFile]):
+        self.video_files = video_files
+        self.index_records()
+
+    def index_records(self):
+        # Everything from scratch, with each record's id its list position
+        self.postings: Dict[Text, array] = dict()
+        self.dense_bits: Dict[Text, int] = dict()  # common token -> bitset
+        self.prefix_bits: Dict[Text, int] = dict()  # short prefix -> bitset
+        self.trigram_tokens: Dict[Text, Set[Text]] = dict()
+        self.ids: List[int] = list(range(len(self.video_files)))
+        self.id_positions: array = None  # id -> list position; None while every id is its list position
+        self.id_count = 0
+        self.term_bits: Dict[Text, int] = dict()
+
+        new_tokens, _record_tokens = self.add_records(range(len(self.video_files)))
+        self.tokens: List[Text] = sorted(new_tokens)
+        self.add_trigrams(new_tokens)
+        self.live_bits = (1 << self.id_count) - 1
+
+        dense_count = self.id_count // DENSE_TOKEN_FRACTION
+        for token, token_postings in self.postings.items():
+            if len(token_postings) > dense_count:
+                self.dense_bits[token] = bits_of(token_postings, self.id_count)
+        for length in range(1, SHORT_PREFIX_LENGTH + 1):
+            for prefix, first_index, last_index in self.token_prefixes(length):
+                self.add_prefix_bits(prefix, first_index, last_index)
+
+    def add_records(self, positions: Iterable[int]) -> Tuple[List[Text], Set[Text]]:
+        # Gives the records at these positions the next ids and adds them to the postings; returns the tokens no
+        # record had before, and every token the records have
+        new_tokens = list()
+        record_tokens = set()
+        postings = self.postings
+        for position in positions:
+            record_id = self.id_count
+            self.id_count += 1
+            self.ids[position] = record_id
+            tokens = set(search_tokens(record_search_text(self.video_files[position])))
+            record_tokens |= tokens
+            for token in tokens:
+                token_postings = postings.get(token)
+                if token_postings is None:
+                    token_postings = postings[token] = array('I')
+                    new_tokens.append(token)
+                token_postings.append(record_id)
+        return new_tokens, record_tokens
+
+    def add_trigrams(self, tokens: Iterable[Text]):
+        # Only tokens longer than three can have a trigram inside them that isn't also their prefix; numbers are
+        # only matched from the start
+        for token in tokens:
+            if len(token) > 3 and not token.isdigit():
+                for start in range(len(token) - 2):
+                    self.trigram_tokens.setdefault(token[start:start + 3], set()).add(token)
+
+    def token_range(self, prefix: Text, first_index: int = 0) -> Tuple[int, int]:
+        # The tokens starting with prefix are tokens[first_index:last_index]
+        first_index = bisect.bisect_left(self.tokens, prefix, first_index)
+        return first_index, bisect.bisect_left(self.tokens, prefix[:-1] + chr(ord(prefix[-1]) + 1), first_index)
+
+    def token_prefixes(self, length: int) -> Iterator[Tuple[Text, int, int]]:
+        # Each prefix of this length the tokens have, with its token_range()
+        index = 0
+        while index < len(self.tokens):
+            prefix = self.tokens[index][:length]
+            if len(prefix) < length:
+                index += 1
+                continue
+            first_index, index = self.token_range(prefix, index)
+            yield prefix, first_index, index
+
+    def add_prefix_bits(self, prefix: Text, first_index: int, last_index: int):
+        # Keeps the bitset of a short prefix if the rare tokens it starts have more records than a common token
+        sparse_tokens = list(itertools.filterfalse(self.dense_bits.__contains__, self.tokens[first_index:last_index]))
+        if sum(map(len, map(self.postings.__getitem__, sparse_tokens))) > self.id_count // DENSE_TOKEN_FRACTION:
+            self.prefix_bits[prefix] = self.tokens_bits(self.tokens[first_index:last_index])
+
+    def update_bits(self, tokens: Iterable[Text], first_new_id: int):
+        # Brings the bitsets kept for these tokens and their short prefixes up to date with the ids from first_new_id
+        # on, and starts one for each that has become common enough
+        dense_count = self.id_count // DENSE_TOKEN_FRACTION
+        prefix_new_ids: Dict[Text, List[array]] = collections.defaultdict(list)
+        for token in tokens:
+            token_postings = self.postings[token]
+            new_ids = token_postings[bisect.bisect_left(token_postings, first_new_id):]
+            token_bits = self.dense_bits.get(token)
+            if token_bits is not None:
+                self.dense_bits[token] = token_bits | bits_of(new_ids, self.id_count, first_new_id)
+            elif len(token_postings) > dense_count:
+                self.dense_bits[token] = bits_of(token_postings, self.id_count)
+            for length in range(1, min(len(token), SHORT_PREFIX_LENGTH) + 1):
+                prefix_new_ids[token[:length]].append(new_ids)
+
+        for prefix, new_id_arrays in prefix_new_ids.items():
+            prefix_bits = self.prefix_bits.get(prefix)
+            if prefix_bits is not None:
+                self.prefix_bits[prefix] = prefix_bits | bits_of(itertools.chain.from_iterable(new_id_arrays), self.id_count, first_new_id)
+            else:
+                self.add_prefix_bits(prefix, *self.token_range(prefix))
+
+    def apply_library_edit(self, library_edit: LibraryEdit):
+        # The list has already been edited as library_edit says; bring the index up to date with it
+        dead_ids = [self.ids[index] for index in library_edit.removed_indices]
+        if library_edit.removed_indices:
+            kept = bytearray(b'\x01') * len(self.ids)
+            for index in library_edit.removed_indices:
+                kept[index] = 0
+            self.ids = list(itertools.compress(self.ids, kept))
+        dead_ids += [self.ids[index] for index in library_edit.renamed_indices]
+        first_added_position = len(self.ids)
+        self.ids += [0] * (len(self.video_files) - first_added_position)
+
+        first_new_id = self.id_count
+        new_positions = list(itertools.chain(library_edit.renamed_indices, range(first_added_position, len(self.video_files))))
+        if self.id_count + len(new_positions) > 2 * len(self.ids):
+            # More ids left behind than there are records
+            self.index_records()
+            return
+        new_tokens, record_tokens = self.add_records(new_positions)
+
+        if len(new_tokens) <= MAX_BISECT_INSERTS:
+            for token in new_tokens:
+                bisect.insort(self.tokens, token)
+        else:
+            self.tokens += new_tokens
+            self.tokens.sort()
+        self.add_trigrams(new_tokens)
+        self.update_bits(record_tokens, first_new_id)
+
+        if dead_ids:
+            self.live_bits &= ~bits_of(dead_ids, first_new_id)
+        self.live_bits |= ((1 << (self.id_count - first_new_id)) - 1) << first_new_id
+
+        if self.id_positions is None and not dead_ids:
+            pass  # still every id at its own position
+        elif self.id_positions is None or library_edit.removed_indices:
+            self.id_positions = array('I', bytes(4 * self.id_count))
+            collections.deque(map(self.id_positions.__setitem__, self.ids, range(len(self.ids))), maxlen=0)
+        else:
+            self.id_positions.frombytes(bytes(4 * (self.id_count - len(self.id_positions))))
+            for position in new_positions:
+                self.id_positions[self.ids[position]] = position
+        self.term_bits = dict()
+
+    def search(self, query: Text) -> Optional[List[int]]:
+        # The ascending list positions of the records that match every word of query, or None if it has no words
+        terms = list(dict.fromkeys(search_tokens(query)))
+        if not terms:
+            return None
+        bits = self.live_bits
+        term_bits = dict()
+        for term in terms:
+            term_bits[term] = self.term_bits[term] if term in self.term_bits else self.match_term(term)
+            bits &= term_bits[term]
+        self.term_bits = term_bits
+        return self.positions_of(bits)
+
+    def match_term(self, term: Text) -> int:
+        # The bitset of the records with a token that starts with term or, for a longer term, has it inside
+        prefix_bits = self.prefix_bits.get(term)
+        if prefix_bits is not None:
+            return prefix_bits
+        first_index, last_index = self.token_range(term)
+        tokens = self.tokens[first_index:last_index]
+        if len(term) >= 3 and not term.isdigit():
+            tokens += [token for token in self.infix_tokens(term) if not token.startswith(term)]
+        return self.tokens_bits(tokens)
+
+    def tokens_bits(self, tokens: List[Text]) -> int:
+        # The bitset of the records with any of these tokens
+        bits = 0
+        for token in self.dense_bits.keys() & tokens:
+            bits |= self.dense_bits[token]
+        sparse_tokens = list(itertools.filterfalse(self.dense_bits.__contains__, tokens))
+        if sparse_tokens:
+            bits |= bits_of(itertools.chain.from_iterable(map(self.postings.__getitem__, sparse_tokens)), self.id_count)
+        return bits
+
+    def infix_tokens(self, term: Text) -> Set[Text]:
+        # The tokens with term somewhere inside them: those that have every trigram of term, checked
+        token_sets = sorted((self.trigram_tokens.get(term[start:start + 3], set()) for start in range(len(term) - 2)), key=len)
+        return {token for token in token_sets[0].intersection(*token_sets[1:]) if term in token}
+
+    def positions_of(self, bits: int) -> List[int]:
+        # The ascending list positions of the ids in a bitset
+        if bits.bit_count() * SPARSE_RESULT_FRACTION > self.id_count:
+            # Picked out of a list that already has every position in it: compress() over a range would make an int
+            # for every record, not just for the ones that match
+            mask = mask_from_bits(bits, self.id_count)
+            if self.id_positions is None:
+                return list(itertools.compress(self.ids, mask))
+            positions = list(itertools.compress(self.id_positions, mask))
+        else:
+            bit_bytes = bits.to_bytes((self.id_count + 7) // 8, 'little')
+            ids = list()
+            for match in NONZERO_BYTE_PATTERN.finditer(bit_bytes):
+                first_id = match.start() * 8
+                ids.extend(first_id + bit for bit in BYTE_BITS[bit_bytes[match.start()]])
+            if self.id_positions is None:
+                return ids
+            positions = list(map(self.id_positions.__getitem__, ids))
+        positions.sort()  # out of order only where a replaced record got a new id
+        return positions
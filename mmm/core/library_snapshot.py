@@ -0,0 +1,346 @@
+from typing import Dict, Iterator, List, Optional, Sequence, Text
+import array
+import json
+import math
+import mmap
+import os
+import os.path
+import struct
+import sys
+import tempfile
+
+from mmm.core.video_file import LoadProgress, VideoFile
+
+
+SNAPSHOT_MAGIC = b'MMMSNAP\x00'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PREAMBLE = struct.Struct('<8sIIQ')  # magic, version, reserved, header length
+SNAPSHOT_ALIGNMENT = 8
+
+STRING_COLUMNS = ('file_path', 'scrubbed_file_name', 'imdb_tt', 'imdb_name', 'imdb_plot')
+YEAR_COLUMNS = ('scrubbed_file_year', 'imdb_year')
+IRREGULAR_VALUE = 0xFFFF  # in a uint16 column: the value is in the header's irregular_values instead
+
+FLAG_IS_DIRTY = 1
+FLAG_PLOT_IS_NONE = 2
+
+# Year and rating columns are uint16, so stored values are turned back into the same shared strings
+_year_texts: Dict[int, Text] = dict()
+_rating_texts: Dict[int, Text] = dict()
+
+
+def encode_year(year: Text) -> int:
+    # 0 for no year, the year itself if it is a plain number, or IRREGULAR_VALUE. isdigit() alone would accept
+    # digits int() rejects, like '²'.
+    if not year:
+        return 0
+    if year.isascii() and year.isdecimal() and len(year) <= 4 and str(int(year)) == year and 0 < int(year):
+        return int(year)
+    return IRREGULAR_VALUE
+
+
+def decode_year(value: int) -> Text:
+    year_text = _year_texts.get(value)
+    if year_text is None:
+        year_text = _year_texts.setdefault(value, sys.intern(str(value) if value else ''))
+    return year_text
+
+
+def encode_rating(rating: Text) -> int:
+    # 0 for no rating, otherwise tenths + 1 as long as that gives back the same text ('7.5' -> 76)
+    if not rating:
+        return 0
+    try:
+        rating_value = float(rating)
+    except ValueError:
+        return IRREGULAR_VALUE
+    if not math.isfinite(rating_value):
+        # 'inf' and 'nan' parse, but round() can't take them
+        return IRREGULAR_VALUE
+    tenths = round(rating_value * 10)
+    if 0 <= tenths < IRREGULAR_VALUE - 1 and f'{tenths / 10:.1f}' == rating:
+        return tenths + 1
+    return IRREGULAR_VALUE
+
+
+def decode_rating(value: int) -> Text:
+    rating_text = _rating_texts.get(value)
+    if rating_text is None:
+        rating_text = _rating_texts.setdefault(value, sys.intern(f'{(value - 1) / 10:.1f}' if value else ''))
+    return rating_text
+
+
+def library_source_state(library_path: Text, journal_path: Text, compacting_path: Text) -> dict:
+    # What a snapshot of a library was taken from. The base and a compacting journal are only ever replaced, so
+    # their identity is enough; the live journal is only ever appended to, so a snapshot stays usable as long as the
+    # journal it saw is still there: whatever was appended since is replayed on top.
+    def file_state(path):
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return [stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+
+    journal_state = file_state(journal_path)
+    return {
+        'library': file_state(library_path),
+        'compacting': file_state(compacting_path),
+        'journal': journal_state[:3] if journal_state else None,
+    }
+
+
+def journal_offset_for(snapshot_source: dict, current_source: dict) -> Optional[int]:
+    # How far into the journal the snapshot already reflects, or None if the snapshot is stale
+    if snapshot_source['library'] != current_source['library'] or snapshot_source['compacting'] != current_source['compacting']:
+        return None
+    snapshot_journal, current_journal = snapshot_source['journal'], current_source['journal']
+    if snapshot_journal is None:
+        return 0
+    if current_journal is None or snapshot_journal[:2] != current_journal[:2] or current_journal[2] < snapshot_journal[2]:
+        # The journal was compacted away or replaced since the snapshot
+        return None
+    return snapshot_journal[2]
+
+
+class LibrarySnapshot(Sequence[VideoFile]):
+    # A read-only library snapshot opened with mmap. Opening one reads only the small JSON header; a row is decoded
+    # into a VideoFile when it is indexed, so a view can show the first screenful of a huge library straight away.
+    # Front ends show a snapshot as it is (see LibraryJournal.open_rows()) and copy it into a list when it is first
+    # edited.
+    #
+    # File layout: preamble, JSON header, then 8-byte aligned columns. Years and ratings are fixed-width uint16
+    # columns; the text columns are a uint64 offset table (row_count + 1 entries) into a block of UTF-8; genres are a
+    # uint32 index into the header's list of distinct genre lists; a uint8 column holds is_dirty and "plot is None".
+    # Values a uint16 can't represent exactly (a year like "2001-2003") are kept in the header.
+
+    def __init__(self, snapshot_path: Text):
+        self.snapshot_path = snapshot_path
+        with open(snapshot_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _reserved, header_length = SNAPSHOT_PREAMBLE.unpack_from(self.mm, 0)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f'"{snapshot_path}" is not a version {SNAPSHOT_VERSION} library snapshot')
+            self.header = json.loads(self.mm[SNAPSHOT_PREAMBLE.size:SNAPSHOT_PREAMBLE.size + header_length])
+
+            self.row_count: int = self.header['row_count']
+            self.source: dict = self.header['source']
+            # Left as parsed: VideoFile interns genres itself, so opening doesn't pay for lists no row is decoded with
+            self.genre_lists: List[Optional[List[Text]]] = self.header['genre_lists']
+            self.irregular_values: Dict[Text, Dict[int, Text]] = {column_name: {int(row): value for row, value in values.items()}
+                                                                   for column_name, values in self.header['irregular_values'].items()}
+
+            columns = self.header['columns']
+            self.string_offsets = {column_name: self.column_view(columns[column_name]['offsets'], 'Q', self.row_count + 1) for column_name in STRING_COLUMNS}
+            self.string_data_starts = {column_name: columns[column_name]['data'][0] for column_name in STRING_COLUMNS}
+            self.year_values = {column_name: self.column_view(columns[column_name], 'H', self.row_count) for column_name in YEAR_COLUMNS}
+            self.rating_values = self.column_view(columns['imdb_rating'], 'H', self.row_count)
+            self.genre_indices = self.column_view(columns['imdb_genres'], 'I', self.row_count)
+            self.flags = self.column_view(columns['flags'], 'B', self.row_count)
+        except (KeyError, TypeError, ValueError, struct.error):
+            self.close()
+            raise ValueError(f'"{snapshot_path}" is not a valid library snapshot')
+
+    def column_view(self, column: List[int], type_code: Text, count: int) -> memoryview:
+        offset, length = column
+        if length != count * array.array(type_code).itemsize or offset + length > len(self.mm):
+            raise ValueError('column size mismatch')
+        return memoryview(self.mm)[offset:offset + length].cast(type_code)
+
+    def close(self):
+        # Views must be released before the map can be closed
+        for views in (getattr(self, 'string_offsets', {}), getattr(self, 'year_values', {})):
+            for view in views.values():
+                view.release()
+        for name in ('rating_values', 'genre_indices', 'flags'):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def text(self, column_name: Text, index: int) -> Text:
+        offsets = self.string_offsets[column_name]
+        data_start = self.string_data_starts[column_name]
+        return self.mm[data_start + offsets[index]:data_start + offsets[index + 1]].decode('utf8')
+
+    def year(self, column_name: Text, index: int) -> Text:
+        value = self.year_values[column_name][index]
+        if value == IRREGULAR_VALUE:
+            return self.irregular_values[column_name][index]
+        return decode_year(value)
+
+    def rating(self, index: int) -> Text:
+        value = self.rating_values[index]
+        if value == IRREGULAR_VALUE:
+            return self.irregular_values['imdb_rating'][index]
+        return decode_rating(value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.row_count)
+            return self.rows(start, stop) if step == 1 else [self[i] for i in range(start, stop, step)]
+        if index < 0:
+            index += self.row_count
+        if not 0 <= index < self.row_count:
+            raise IndexError('snapshot row index out of range')
+
+        flags = self.flags[index]
+        return VideoFile(file_path=self.text('file_path', index),
+                         scrubbed_file_name=self.text('scrubbed_file_name', index),
+                         scrubbed_file_year=self.year('scrubbed_file_year', index),
+                         imdb_tt=self.text('imdb_tt', index),
+                         imdb_name=self.text('imdb_name', index),
+                         imdb_year=self.year('imdb_year', index),
+                         imdb_rating=self.rating(index),
+                         imdb_genres=self.genre_lists[self.genre_indices[index]],
+                         imdb_plot=None if flags & FLAG_PLOT_IS_NONE else self.text('imdb_plot', index),
+                         is_dirty=bool(flags & FLAG_IS_DIRTY))
+
+    def texts(self, column_name: Text, start: int, stop: int) -> List[Text]:
+        offsets = self.string_offsets[column_name][start:stop + 1].tolist()
+        data_start = self.string_data_starts[column_name]
+        block = self.mm[data_start + offsets[0]:data_start + offsets[-1]]
+        if block.isascii():
+            # Byte offsets are character offsets: decode the block once and slice it
+            block = block.decode('ascii')
+        else:
+            return [block[begin - offsets[0]:end - offsets[0]].decode('utf8') for begin, end in zip(offsets, offsets[1:])]
+        return [block[begin - offsets[0]:end - offsets[0]] for begin, end in zip(offsets, offsets[1:])]
+
+    def years(self, column_name: Text, start: int, stop: int) -> List[Text]:
+        irregular_values = self.irregular_values[column_name]
+        return [irregular_values[row] if value == IRREGULAR_VALUE else decode_year(value)
+                for row, value in enumerate(self.year_values[column_name][start:stop].tolist(), start)]
+
+    def rows(self, start: int, stop: int) -> List[VideoFile]:
+        # Decodes rows [start, stop) a column at a time, several times faster than indexing row by row
+        stop = min(stop, self.row_count)
+        if start >= stop:
+            return list()
+        irregular_ratings = self.irregular_values['imdb_rating']
+        ratings = [irregular_ratings[row] if value == IRREGULAR_VALUE else decode_rating(value)
+                   for row, value in enumerate(self.rating_values[start:stop].tolist(), start)]
+        genre_lists = self.genre_lists
+        genres = [genre_lists[genre_index] for genre_index in self.genre_indices[start:stop].tolist()]
+        flags = self.flags[start:stop].tolist()
+        plots = [None if row_flags & FLAG_PLOT_IS_NONE else plot for plot, row_flags in zip(self.texts('imdb_plot', start, stop), flags)]
+        is_dirty = [bool(row_flags & FLAG_IS_DIRTY) for row_flags in flags]
+        return list(map(VideoFile, self.texts('file_path', start, stop), self.texts('scrubbed_file_name', start, stop), self.years('scrubbed_file_year', start, stop),
+                        self.texts('imdb_tt', start, stop), self.texts('imdb_name', start, stop), self.years('imdb_year', start, stop),
+                        ratings, genres, plots, is_dirty))
+
+    def __iter__(self) -> Iterator[VideoFile]:
+        # A batch of rows at a time, so reading every record (to sort or search them) is as quick as loading them
+        for video_files in self.iter_batches(first_batch_size=5000):
+            yield from video_files
+
+    def iter_batches(self, batch_size: int = 5000, first_batch_size: int = 200, load_progress: LoadProgress = None) -> Iterator[List[VideoFile]]:
+        load_progress = load_progress or LoadProgress()
+        load_progress.total = self.row_count
+        first_index, current_batch_size = 0, first_batch_size
+        while first_index < self.row_count:
+            video_files = self.rows(first_index, first_index + current_batch_size)
+            load_progress.done += len(video_files)
+            yield video_files
+            first_index += current_batch_size
+            current_batch_size = batch_size
+
+
+def write_snapshot(snapshot_path: Text, video_files: Sequence[VideoFile], source: dict):
+    # Builds every column in memory (a fraction of the size of the VideoFiles themselves) and replaces snapshot_path
+    # atomically. A snapshot is only a cache, so unlike the library file it isn't fsync'd: a snapshot lost in a crash
+    # is rebuilt from the library on the next load.
+    row_count = len(video_files)
+    string_blocks = {column_name: bytearray() for column_name in STRING_COLUMNS}
+    string_offsets = {column_name: array.array('Q', [0]) for column_name in STRING_COLUMNS}
+    year_values = {column_name: array.array('H') for column_name in YEAR_COLUMNS}
+    rating_values = array.array('H')
+    genre_indices = array.array('I')
+    flags = array.array('B')
+    genre_list_indices: Dict[Optional[tuple], int] = {None: 0}
+    irregular_values: Dict[Text, Dict[int, Text]] = {column_name: dict() for column_name in (*YEAR_COLUMNS, 'imdb_rating')}
+
+    for row, video_file in enumerate(video_files):
+        for column_name in STRING_COLUMNS:
+            string_blocks[column_name] += (getattr(video_file, column_name) or '').encode('utf8')
+            string_offsets[column_name].append(len(string_blocks[column_name]))
+        for column_name in YEAR_COLUMNS:
+            year = getattr(video_file, column_name)
+            value = encode_year(year)
+            if value == IRREGULAR_VALUE:
+                irregular_values[column_name][row] = year
+            year_values[column_name].append(value)
+        value = encode_rating(video_file.imdb_rating)
+        if value == IRREGULAR_VALUE:
+            irregular_values['imdb_rating'][row] = video_file.imdb_rating
+        rating_values.append(value)
+
+        genres = tuple(video_file.imdb_genres) if video_file.imdb_genres is not None else None
+        genre_indices.append(genre_list_indices.setdefault(genres, len(genre_list_indices)))
+        flags.append((FLAG_IS_DIRTY if video_file.is_dirty else 0) | (FLAG_PLOT_IS_NONE if video_file.imdb_plot is None else 0))
+
+    blocks = list()
+    for column_name in STRING_COLUMNS:
+        blocks.append((column_name, 'offsets', string_offsets[column_name].tobytes()))
+        blocks.append((column_name, 'data', bytes(string_blocks[column_name])))
+    for column_name in YEAR_COLUMNS:
+        blocks.append((column_name, None, year_values[column_name].tobytes()))
+    blocks.append(('imdb_rating', None, rating_values.tobytes()))
+    blocks.append(('imdb_genres', None, genre_indices.tobytes()))
+    blocks.append(('flags', None, flags.tobytes()))
+
+    def encode_header(columns):
+        return json.dumps({
+            'row_count': row_count,
+            'source': source,
+            'columns': columns,
+            'genre_lists': list(genre_list_indices),
+            'irregular_values': irregular_values,
+        }, ensure_ascii=False).encode('utf8')
+
+    # Column offsets depend on the header length and the header holds the offsets: measure a header laid out as if
+    # it were empty, leave room for the real offsets having more digits, and pad the real header to that length
+    def lay_out(header_length):
+        columns = dict()
+        position = align(SNAPSHOT_PREAMBLE.size + header_length)
+        for column_name, part, block in blocks:
+            extent = [position, len(block)]
+            if part is None:
+                columns[column_name] = extent
+            else:
+                columns.setdefault(column_name, dict())[part] = extent
+            position = align(position + len(block))
+        return columns
+
+    header_length = len(encode_header(lay_out(0))) + 64
+    header = encode_header(lay_out(header_length))
+    if len(header) > header_length:
+        raise ValueError('snapshot header outgrew its reserved length')
+    header += b' ' * (header_length - len(header))
+
+    snapshot_dir = os.path.dirname(os.path.abspath(snapshot_path))
+    fd, temp_path = tempfile.mkstemp(dir=snapshot_dir, prefix='.' + os.path.basename(snapshot_path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, header_length))
+            f.write(header)
+            for _column_name, _part, block in blocks:
+                f.write(b'\0' * (align(f.tell()) - f.tell()))
+                f.write(block)
+        os.replace(temp_path, snapshot_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def align(position: int) -> int:
+    return (position + SNAPSHOT_ALIGNMENT - 1) // SNAPSHOT_ALIGNMENT * SNAPSHOT_ALIGNMENT
@@ -0,0 +1,245 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Text
+from array import array
+import bisect
+import collections
+import dataclasses
+import itertools
+import re
+import unicodedata
+
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+
+
+DIGIT_RUN_PATTERN = re.compile(r'[0-9]+')
+
+# Up to this many records are inserted into the sorted lists in place, each insert moving the rows after it; a
+# larger batch (scan results) rebuilds the lists once around them instead
+MAX_BISECT_INSERTS = 16
+
+
+def natural_sort_key_digits(match: re.Match) -> Text:
+    digits = match.group().lstrip('0') or '0'
+    return f'{len(digits):02d}{digits}'
+
+
+def fold_text(text: Text) -> Text:
+    # Lower case with accents taken off, so "Amélie" and "AMELIE" compare (and search) the same
+    if text.isascii():
+        return text.lower()
+    return ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c)).casefold()
+
+
+def natural_sort_key(text: Text) -> Text:
+    # Case and accent insensitive, with runs of digits compared by value ("Alien 2" before "Alien 10", "7.5" before
+    # "10.0"). The key is a plain string, so sorting compares keys in C rather than calling back into Python: each
+    # run of digits becomes its length as two digits followed by the digits without leading zeros.
+    if not text:
+        return ''
+    return DIGIT_RUN_PATTERN.sub(natural_sort_key_digits, fold_text(text))
+
+
+@dataclasses.dataclass
+class RowEdit:
+    # How the rows of a view change, in the order to tell the view: removed_rows (numbered as before, so announce
+    # the last run first), then inserted_rows (numbered as after, so announce the first run first), then
+    # changed_rows (numbered as after), whose records changed without moving. All three are ascending.
+    removed_rows: List[int] = dataclasses.field(default_factory=list)
+    inserted_rows: List[int] = dataclasses.field(default_factory=list)
+    changed_rows: List[int] = dataclasses.field(default_factory=list)
+
+    @classmethod
+    def from_library_edit(cls, library_edit: LibraryEdit, row_count: int) -> 'RowEdit':
+        # For a view showing the list in its own order, where the rows are the list positions; row_count is the
+        # length of the list after the edit
+        return cls(removed_rows=library_edit.removed_indices, inserted_rows=list(range(row_count - len(library_edit.added), row_count)), changed_rows=library_edit.renamed_indices)
+
+    @classmethod
+    def between(cls, old_positions: List[int], new_positions: List[int], replaced_positions: Iterable[int]) -> 'RowEdit':
+        # For a view showing some of the list's records (a search), from the list positions of its rows before an
+        # edit, renumbered to after it (-1 for a removed record), and after. Rows whose record went away are removed
+        # and rows whose record appeared are inserted; a replaced record may have moved, so its row is removed and
+        # inserted again. The records on both sides keep their order, so nothing else moves.
+        replaced_positions = set(replaced_positions)
+        kept_positions = set(new_positions).intersection(old_positions).difference(replaced_positions)
+        return cls(removed_rows=[row for row, position in enumerate(old_positions) if position not in kept_positions],
+                   inserted_rows=[row for row, position in enumerate(new_positions) if position not in kept_positions])
+
+
+class LibrarySortOrder:
+    # A sorted view of a list of VideoFiles (or of a LibrarySnapshot): positions holds the list position of each
+    # row in ascending order of sort key, and keys the key of each row. The list itself is never reordered, so the
+    # records a loader, a scan or a save works with keep their positions; views map their rows through position().
+    #
+    # Keys come from natural_sort_key() and are cached by the text they were made from, in a key_cache that
+    # outlives the order (front ends keep one per column), so sorting a column again, or after a reload, doesn't
+    # make them again. Descending is just the ascending order read backwards. Edits to the list are folded in by
+    # apply_library_edit(): records that were added or whose key changed are put in place with a binary search,
+    # nothing is sorted again, and the view is told only about the rows that moved.
+
+    def __init__(self, video_files: Sequence[VideoFile], sort_text: Callable[[VideoFile], Text], descending: bool = False, key_cache: Dict[Text, Text] = None):
+        self.video_files = video_files
+        self.sort_text = sort_text
+        self.descending = descending
+        self.key_cache: Dict[Text, Text] = key_cache if key_cache is not None else dict()
+
+        keys = self.sort_keys(video_files)
+        self.positions: List[int] = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys: List[Text] = [keys[position] for position in self.positions]
+        self.position_rows: array = None  # made by rows_by_position() when first wanted, dropped by any edit
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def sort_key(self, video_file: VideoFile) -> Text:
+        return self.text_sort_key(self.sort_text(video_file))
+
+    def text_sort_key(self, text: Text) -> Text:
+        text = text or ''
+        key = self.key_cache.get(text)
+        if key is None:
+            key = self.key_cache[text] = natural_sort_key(text)
+        return key
+
+    def sort_keys(self, video_files: Sequence[VideoFile]) -> List[Text]:
+        # Once every key is cached, a lookup per record with no Python call in between
+        texts = list(map(self.sort_text, video_files))
+        try:
+            return list(map(self.key_cache.__getitem__, texts))
+        except KeyError:
+            return [self.text_sort_key(text) for text in texts]
+
+    def position(self, row: int) -> int:
+        return self.positions[-1 - row] if self.descending else self.positions[row]
+
+    def rows_of(self, positions: Iterable[int]) -> Dict[int, int]:
+        # List position -> row, for a few positions (a selection to keep across a sort)
+        is_wanted_position = bytearray(len(self.video_files))
+        for position in positions:
+            is_wanted_position[position] = 1
+        last_row = len(self.positions) - 1
+        rows = itertools.compress(range(len(self.positions)), map(is_wanted_position.__getitem__, self.positions))
+        return {self.positions[row]: (last_row - row if self.descending else row) for row in rows}
+
+    def rows_by_position(self) -> array:
+        # The row (of the ascending order) of every list position, for ordering many positions at once: a search
+        # sorts its matches by it rather than passing over every row
+        if self.position_rows is None:
+            self.position_rows = array('I', bytes(4 * len(self.video_files)))
+            collections.deque(map(self.position_rows.__setitem__, self.positions, range(len(self.positions))), maxlen=0)
+        return self.position_rows
+
+    def view_positions(self, positions: Iterable[int]) -> List[int]:
+        # Some list positions (the records a search found) in the order of the view's rows
+        return sorted(positions, key=self.rows_by_position().__getitem__, reverse=self.descending)
+
+    def view_index(self, view_positions: Sequence[int], position: int) -> Optional[int]:
+        # Where a list position is among positions put in view order by view_positions(), found by a binary search
+        # over their rows rather than a pass over all of them; None if it isn't among them
+        rows = self.rows_by_position()
+        row = rows[position]
+        low, high = 0, len(view_positions)
+        while low < high:
+            middle = (low + high) // 2
+            middle_row = rows[view_positions[middle]]
+            if middle_row > row if self.descending else middle_row < row:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(view_positions) and view_positions[low] == position else None
+
+    def view_rows(self, rows: List[int], row_count: int) -> List[int]:
+        # Ascending rows of the ascending order as ascending rows of the view
+        return [row_count - 1 - row for row in reversed(rows)] if self.descending else rows
+
+    def apply_library_edit(self, library_edit: LibraryEdit) -> RowEdit:
+        # The list has already been edited as library_edit says; bring the order up to date with it
+        self.position_rows = None
+        old_row_count = len(self.positions)
+        changed_positions = set(library_edit.renamed_indices)
+        first_added_position = len(self.video_files) - len(library_edit.added)
+
+        removed_rows: List[int] = list()
+        moved_positions: List[int] = list()  # changed records whose key changed: taken out, then put back in place
+        unmoved_positions = set()
+        if library_edit.removed_indices or changed_positions:
+            # Comprehensions and compress() rather than one loop doing everything: a rescan touching a few records
+            # still passes over every row, so the passes are kept in C as far as they can be
+            positions = self.positions
+            if library_edit.removed_indices:
+                position_map = self.position_map(library_edit.removed_indices, old_row_count)
+                positions = list(map(position_map.__getitem__, positions))
+                row = -1
+                for _removed_index in library_edit.removed_indices:
+                    row = positions.index(-1, row + 1)
+                    removed_rows.append(row)
+            if changed_positions:
+                is_changed_position = bytearray(len(self.video_files) + 1)  # the extra one for the -1 of removed rows
+                for position in changed_positions:
+                    is_changed_position[position] = 1
+                for row in list(itertools.compress(range(old_row_count), map(is_changed_position.__getitem__, positions))):
+                    position = positions[row]
+                    if self.sort_key(self.video_files[position]) != self.keys[row]:
+                        removed_rows.append(row)
+                        moved_positions.append(position)
+                    else:
+                        unmoved_positions.add(position)
+                removed_rows.sort()
+
+            kept_rows = bytearray(b'\x01') * old_row_count
+            for row in removed_rows:
+                kept_rows[row] = 0
+            self.positions = list(itertools.compress(positions, kept_rows))
+            self.keys = list(itertools.compress(self.keys, kept_rows))
+
+        inserted_rows = self.insert(moved_positions + list(range(first_added_position, len(self.video_files))))
+        changed_rows = sorted(self.rows_of(unmoved_positions).values()) if unmoved_positions else list()
+        return RowEdit(removed_rows=self.view_rows(removed_rows, old_row_count), inserted_rows=self.view_rows(inserted_rows, len(self.positions)), changed_rows=changed_rows)
+
+    @staticmethod
+    def position_map(removed_indices: List[int], old_count: int) -> Optional[List[int]]:
+        # Old list position -> position after the removals, or -1 for a removed one
+        if not removed_indices:
+            return None
+        position_map = [-1] * old_count
+        for removed_count, (removed_index, next_removed_index) in enumerate(zip(removed_indices, removed_indices[1:] + [old_count]), 1):
+            position_map[removed_index + 1:next_removed_index] = range(removed_index + 1 - removed_count, next_removed_index - removed_count)
+        position_map[:removed_indices[0]] = range(removed_indices[0])
+        return position_map
+
+    def insert(self, positions: List[int]) -> List[int]:
+        # Puts these list positions in sorted order and returns the rows they ended up at, ascending
+        if not positions:
+            return list()
+        self.position_rows = None
+        new_keys = sorted((self.sort_key(self.video_files[position]), position) for position in positions)
+
+        if len(new_keys) <= MAX_BISECT_INSERTS:
+            # A few records (a rescan, a folder watch event): insert each one in place. Ascending keys, each after
+            # any equal one, so every insert lands past the rows already inserted.
+            inserted_rows = list()
+            for key, position in new_keys:
+                row = bisect.bisect_right(self.keys, key)
+                self.keys.insert(row, key)
+                self.positions.insert(row, position)
+                inserted_rows.append(row)
+            return inserted_rows
+
+        # Each new key's row comes from a binary search of the old keys; the new lists are then the old ones cut at
+        # those rows with the new records spliced in, a single pass of slice copies however many records there are
+        keys: List[Text] = list()
+        positions: List[int] = list()
+        inserted_rows: List[int] = list()
+        previous_row = 0
+        for key, position in new_keys:
+            row = bisect.bisect_right(self.keys, key, previous_row)
+            keys += self.keys[previous_row:row]
+            positions += self.positions[previous_row:row]
+            inserted_rows.append(len(keys))
+            keys.append(key)
+            positions.append(position)
+            previous_row = row
+        keys += self.keys[previous_row:]
+        positions += self.positions[previous_row:]
+        self.keys, self.positions = keys, positions
+        return inserted_rows
@@ -0,0 +1,20 @@
+from typing import Text, Union
+import os.path
+
+from mmm.core.library_journal import LibraryJournal
+from mmm.core.sqlite_store import SqliteLibraryStore
+
+
+SQLITE_LIBRARY_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+
+def is_sqlite_library(library_path: Text) -> bool:
+    return os.path.splitext(library_path)[1].lower() in SQLITE_LIBRARY_EXTENSIONS
+
+
+def open_library(library_path: Text) -> Union[LibraryJournal, SqliteLibraryStore]:
+    # Both backends load with iter_batches() (unless open_rows() gives rows to show as they are), save edits with
+    # save_dirty() and rewrite everything with write_full()
+    if is_sqlite_library(library_path):
+        return SqliteLibraryStore(library_path)
+    return LibraryJournal(library_path)
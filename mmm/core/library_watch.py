@@ -0,0 +1,319 @@
+from typing import Callable, Dict, List, Sequence, Set, Text, Tuple
+import dataclasses
+import itertools
+import operator
+import os
+import os.path
+import threading
+import time
+
+from mmm.core.filename_scrubber import DEFAULT_FILENAME_METADATA_TOKENS, get_filename_scrubber
+from mmm.core.fs_events import FileSystemEvent, PollingWatcher
+from mmm.core.scan_engine import DEFAULT_IGNORE_EXTENSIONS, ScanEngine
+from mmm.core.scan_pipeline import make_video_files, parse_ignore_extensions, scrub_file_names
+from mmm.core.video_file import VideoFile
+
+
+@dataclasses.dataclass
+class LibraryChange:
+    # One debounced batch of changes under a watched folder, applied in this order: removals, renames, additions.
+    # Removed and renamed paths may be directories, in which case they cover every file beneath them.
+    removed_paths: List[Text] = dataclasses.field(default_factory=list)
+    renamed_paths: List[Tuple[Text, Text]] = dataclasses.field(default_factory=list)
+    rescrubbed_names: Dict[Text, Tuple[Text, Text]] = dataclasses.field(default_factory=dict)  # renamed file's new path -> (scrubbed_file_name, scrubbed_file_year)
+    added: List[VideoFile] = dataclasses.field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.removed_paths or self.renamed_paths or self.added)
+
+
+@dataclasses.dataclass
+class LibraryEdit:
+    # What apply_library_change() did to a list of VideoFiles, so a view model can mirror it without a reset
+    removed_indices: List[int]  # ascending, into the list as it was before the change
+    renamed_indices: List[int]  # into the list after removals; renamed (or otherwise changed) records replace entries in place
+    added: List[VideoFile]  # appended to the end of the list
+
+
+class LibraryEditLog:
+    # The LibraryEdits made to a list since it was copied, folded into the one LibraryEdit that takes the copy to the
+    # list as it is now, so a search index made from the copy on a worker thread can be brought up to date with the
+    # list in a single step once it is done. slots holds the position in the copy of each record of the list (-1
+    # for one added since, which are always at the end), and renamed_slots the ones replaced since.
+
+    def __init__(self, count: int):
+        self.count = count
+        self.slots: List[int] = list(range(count))
+        self.renamed_slots: Set[int] = set()
+
+    def add(self, library_edit: LibraryEdit):
+        if library_edit.removed_indices:
+            kept = bytearray(b'\x01') * len(self.slots)
+            for index in library_edit.removed_indices:
+                kept[index] = 0
+            self.slots = list(itertools.compress(self.slots, kept))
+        self.renamed_slots.update(self.slots[index] for index in library_edit.renamed_indices)
+        self.slots += [-1] * len(library_edit.added)
+
+    def library_edit(self, video_files: Sequence[VideoFile]) -> LibraryEdit:
+        # video_files is the list as it is now, with every logged edit made to it
+        is_kept_slot = bytearray(self.count)
+        for slot in self.slots:
+            if slot >= 0:
+                is_kept_slot[slot] = 1
+        first_added_index = len(self.slots) - self.slots.count(-1)
+        return LibraryEdit(removed_indices=list(itertools.compress(range(self.count), map(operator.not_, is_kept_slot))),
+                           renamed_indices=[index for index, slot in enumerate(self.slots[:first_added_index]) if slot in self.renamed_slots],
+                           added=list(video_files[first_added_index:]))
+
+
+def index_runs(indices: List[int]) -> List[Tuple[int, int]]:
+    # Ascending indices as (first, last) runs of consecutive indices, so a view can be told about each run at once
+    runs = list()
+    for index in indices:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1] = (runs[-1][0], index)
+        else:
+            runs.append((index, index))
+    return runs
+
+
+def is_same_or_under(path: Text, dir_path: Text) -> bool:
+    return path == dir_path or path.startswith(dir_path + os.sep)
+
+
+def replace_path_prefix(path: Text, old_dir_path: Text, new_dir_path: Text) -> Text:
+    return new_dir_path + path[len(old_dir_path):]
+
+
+class LibraryChangeBuilder:
+    # Folds a sequence of FileSystemEvents into a LibraryChange, cancelling out changes that undo each other within
+    # the debounce window (a download's temp file created then renamed, a file created then deleted, ...)
+
+    def __init__(self):
+        self.removed_paths: Dict[Text, None] = dict()
+        self.renamed_paths: Dict[Text, Text] = dict()  # original path -> current path
+        self.created_paths: Dict[Text, bool] = dict()  # path -> is_dir
+
+    def add_event(self, event: FileSystemEvent):
+        if event.kind == 'created':
+            self.created_paths[event.path] = event.is_dir
+        elif event.kind == 'deleted':
+            self.path_deleted(event.path)
+        elif event.kind == 'moved':
+            self.path_moved(event.path, event.new_path)
+
+    def path_deleted(self, path: Text):
+        if self.created_paths.pop(path, None) is not None:
+            return
+        for created_path in [created_path for created_path in self.created_paths if is_same_or_under(created_path, path)]:
+            del self.created_paths[created_path]
+
+        for original_path, current_path in list(self.renamed_paths.items()):
+            if is_same_or_under(current_path, path):
+                # Renamed and then deleted: the library entry under its original path is what goes
+                del self.renamed_paths[original_path]
+                self.removed_paths[original_path] = None
+        self.removed_paths[path] = None
+
+    def path_moved(self, old_path: Text, new_path: Text):
+        for created_path in [created_path for created_path in self.created_paths if is_same_or_under(created_path, old_path)]:
+            self.created_paths[replace_path_prefix(created_path, old_path, new_path)] = self.created_paths.pop(created_path)
+
+        for original_path, current_path in self.renamed_paths.items():
+            if current_path == old_path:
+                self.renamed_paths[original_path] = new_path
+                return
+
+        if old_path not in self.created_paths and new_path not in self.created_paths:
+            self.renamed_paths[old_path] = new_path
+
+    def build(self, ignore_extensions, filename_scrubber) -> LibraryChange:
+        library_change = LibraryChange(removed_paths=list(self.removed_paths))
+
+        for old_path, new_path in self.renamed_paths.items():
+            if old_path == new_path:
+                continue
+            if os.path.isdir(new_path):
+                library_change.renamed_paths.append((old_path, new_path))
+                continue
+
+            # A renamed file gets scrubbed again; a rename to or from an ignored extension is an add or a remove
+            scrubbed_rows, _ignored_file_count = scrub_file_names([os.path.basename(new_path)], ignore_extensions, filename_scrubber)
+            if scrubbed_rows:
+                library_change.renamed_paths.append((old_path, new_path))
+                library_change.rescrubbed_names[new_path] = scrubbed_rows[0][1:]
+                self.created_paths.setdefault(new_path, False)
+            else:
+                library_change.removed_paths.append(old_path)
+
+        created_dir_paths = [path for path, is_dir in self.created_paths.items() if is_dir]
+        for path, is_dir in self.created_paths.items():
+            if any(is_same_or_under(path, dir_path) and path != dir_path for dir_path in created_dir_paths):
+                # Picked up by walking its new parent directory below
+                continue
+            if path in library_change.rescrubbed_names:
+                # Renamed into place: added only if the library doesn't have its old path (apply_library_change checks)
+                library_change.added.extend(make_video_files(os.path.dirname(path), [(os.path.basename(path), *library_change.rescrubbed_names[path])]))
+                continue
+            if is_dir:
+                for dir_path, _dir_names, file_names in os.walk(path):
+                    scrubbed_rows, _ignored_file_count = scrub_file_names(sorted(file_names), ignore_extensions, filename_scrubber)
+                    library_change.added.extend(make_video_files(dir_path, scrubbed_rows))
+            else:
+                scrubbed_rows, _ignored_file_count = scrub_file_names([os.path.basename(path)], ignore_extensions, filename_scrubber)
+                library_change.added.extend(make_video_files(os.path.dirname(path), scrubbed_rows))
+
+        return library_change
+
+
+def apply_library_change(video_files: List[VideoFile], library_change: LibraryChange) -> LibraryEdit:
+    # Applies a LibraryChange to video_files in place: one pass over the library however many paths changed
+    removed_paths = set(library_change.removed_paths)
+    removed_prefixes = tuple(removed_path + os.sep for removed_path in library_change.removed_paths)
+    renamed_paths = dict(library_change.renamed_paths)
+    renamed_prefixes = tuple(old_path + os.sep for old_path in renamed_paths)
+
+    removed_indices = list()
+    renamed_indices = list()
+    kept_video_files = list()
+    for index, video_file in enumerate(video_files):
+        file_path = video_file.file_path
+        if file_path in removed_paths or (removed_prefixes and file_path.startswith(removed_prefixes)):
+            removed_indices.append(index)
+            continue
+
+        new_path = renamed_paths.get(file_path)
+        if new_path is None and renamed_prefixes and file_path.startswith(renamed_prefixes):
+            for old_path, new_dir_path in renamed_paths.items():
+                if file_path.startswith(old_path + os.sep):
+                    new_path = replace_path_prefix(file_path, old_path, new_dir_path)
+                    break
+
+        if new_path is not None:
+            # Keep IMDB metadata and dirty state across the move; only the path and the scrubbed name change
+            scrubbed_file_name, scrubbed_file_year = library_change.rescrubbed_names.get(new_path, (video_file.scrubbed_file_name, video_file.scrubbed_file_year))
+            video_file = dataclasses.replace(video_file, file_path=new_path, scrubbed_file_name=scrubbed_file_name, scrubbed_file_year=scrubbed_file_year)
+            renamed_indices.append(len(kept_video_files))
+        kept_video_files.append(video_file)
+
+    known_paths = {video_file.file_path for video_file in kept_video_files}
+    added = [video_file for video_file in library_change.added if video_file.file_path not in known_paths]
+
+    video_files[:] = kept_video_files
+    video_files.extend(added)
+
+    return LibraryEdit(removed_indices=removed_indices, renamed_indices=renamed_indices, added=added)
+
+
+class LibraryWatch(threading.Thread):
+    # Keeps a loaded library in step with a folder without rescanning it. File system events come from inotify when
+    # it can be used and from mtime polling otherwise; they are debounced and delivered as LibraryChanges through
+    # change_sink, on this thread (front ends wrap it in GLib.idle_add or a Qt Signal.emit).
+    #
+    # A change is delivered once debounce_seconds pass without another event, and never more than max_delay_seconds
+    # after the first event of a batch, so a steady stream of events still shows up in the library within a second.
+    # If the kernel drops events (inotify queue overflow), the folder is rescanned with the scan cache and the
+    # result delivered as a change. So it is if a new directory can't be watched, and polling takes over from inotify.
+
+    def __init__(self, folder_path: Text, change_sink: Callable[[LibraryChange], object], ignore_extensions: Text = None, filename_metadata_tokens: Text = None,
+                 use_inotify: bool = True, poll_interval: float = 2.0, debounce_seconds: float = 0.25, max_delay_seconds: float = 0.75):
+        super().__init__(daemon=True, name='LibraryWatch')
+        self.folder_path = folder_path
+        self.change_sink = change_sink
+        self.ignore_extensions = ignore_extensions or DEFAULT_IGNORE_EXTENSIONS
+        self.filename_metadata_tokens = filename_metadata_tokens or DEFAULT_FILENAME_METADATA_TOKENS
+        self.use_inotify = use_inotify
+        self.poll_interval = poll_interval
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.keep_watching = True
+        self.watcher = None
+
+    def stop_watching(self):
+        self.keep_watching = False
+
+    def start_watcher(self):
+        if self.use_inotify:
+            # Imported here so platforms without inotify never load the ctypes binding
+            from mmm.core.inotify import InotifyWatcher
+            watcher = None
+            try:
+                watcher = InotifyWatcher()
+                watcher.add_tree(self.folder_path)
+                self.watcher = watcher
+                print(f'LibraryWatch: Watching "{self.folder_path}" with inotify ({len(watcher.watch_paths)} directories)')
+                return
+            except OSError as e:
+                print(f'LibraryWatch: {e}; falling back to polling every {self.poll_interval}s')
+                if watcher is not None:
+                    watcher.close()
+
+        self.watcher = PollingWatcher(poll_interval=self.poll_interval)
+        self.watcher.add_tree(self.folder_path)
+        print(f'LibraryWatch: Polling "{self.folder_path}" every {self.poll_interval}s ({len(self.watcher.directories)} directories)')
+
+    def rescan(self) -> LibraryChange:
+        # Events were lost: let a cached scan work out what changed (only modified directories are listed)
+        # Fingerprints turn files moved while events were being lost into renames, so they keep their metadata
+        scan_engine = ScanEngine(self.folder_path, ignore_extensions=self.ignore_extensions, filename_metadata_tokens=self.filename_metadata_tokens, use_fingerprints=True)
+        scan_engine.run()
+        scan_diff = scan_engine.scan_diff
+        return LibraryChange(removed_paths=[video_file.file_path for video_file in scan_diff.removed],
+                             renamed_paths=[(old_video_file.file_path, new_video_file.file_path) for old_video_file, new_video_file in scan_diff.moved],
+                             rescrubbed_names={new_video_file.file_path: (new_video_file.scrubbed_file_name, new_video_file.scrubbed_file_year) for _old_video_file, new_video_file in scan_diff.moved},
+                             added=scan_diff.added)
+
+    def run(self):
+        ignore_extensions = parse_ignore_extensions(self.ignore_extensions)
+        filename_scrubber = get_filename_scrubber(self.filename_metadata_tokens)
+
+        self.start_watcher()
+        try:
+            change_builder = LibraryChangeBuilder()
+            first_event_time = last_event_time = 0.0
+            needs_rescan = False
+
+            while self.keep_watching:
+                try:
+                    events = self.watcher.read_events(timeout=0.1)
+                except OSError as e:
+                    if not self.use_inotify:
+                        raise
+                    # A directory that appeared couldn't be watched, usually because the inotify watch limit was
+                    # reached. Poll from now on, and rescan for whatever the events read with it covered.
+                    print(f'LibraryWatch: {e}; falling back to polling every {self.poll_interval}s')
+                    self.watcher.close()
+                    self.use_inotify = False
+                    self.start_watcher()
+                    events = [FileSystemEvent('overflow', '')]
+                now = time.monotonic()
+
+                for event in events:
+                    if event.kind == 'overflow':
+                        needs_rescan = True
+                    else:
+                        change_builder.add_event(event)
+                if events:
+                    if not first_event_time:
+                        first_event_time = now
+                    last_event_time = now
+
+                if not first_event_time or (now - last_event_time < self.debounce_seconds and now - first_event_time < self.max_delay_seconds):
+                    continue
+
+                if needs_rescan:
+                    self.watcher.close()
+                    self.start_watcher()
+                    library_change = self.rescan()
+                else:
+                    library_change = change_builder.build(ignore_extensions, filename_scrubber)
+
+                change_builder = LibraryChangeBuilder()
+                first_event_time = last_event_time = 0.0
+                needs_rescan = False
+
+                if library_change:
+                    self.change_sink(library_change)
+        finally:
+            self.watcher.close()
@@ -0,0 +1,147 @@
+from typing import Dict, List, Optional, Text, Tuple
+import dataclasses
+import hashlib
+import json
+import os
+import os.path
+import tempfile
+import time
+
+from mmm.core.fingerprint import FileIdentity
+from mmm.core.video_file import VideoFile
+
+
+SCAN_CACHE_VERSION = 2
+
+# Directory mtimes can be as coarse as 2 seconds (FAT, some SMB servers), so a directory modified this recently
+# could change again without its mtime moving. Such listings are recorded but never trusted on the next scan.
+MTIME_GRANULARITY_NS = 2 * 1_000_000_000
+
+
+@dataclasses.dataclass
+class CachedDirectory:
+    mtime_ns: int
+    subdir_names: List[Text]
+    video_file_names: List[List[Text]]  # [file_name, scrubbed_file_name, scrubbed_file_year]
+    ignored_file_count: int = 0
+    st_dev: int = 0
+    file_identities: List[List[int]] = dataclasses.field(default_factory=list)  # [st_ino, st_size, st_mtime_ns] per video_file_names row
+
+    def subdir_paths(self, dir_path: Text) -> List[Text]:
+        return [os.path.join(dir_path, subdir_name) for subdir_name in self.subdir_names]
+
+    def video_files(self, dir_path: Text) -> List[VideoFile]:
+        return [VideoFile(file_path=os.path.join(dir_path, file_name), scrubbed_file_name=scrubbed_file_name, scrubbed_file_year=scrubbed_file_year) for file_name, scrubbed_file_name, scrubbed_file_year in self.video_file_names]
+
+
+@dataclasses.dataclass
+class ScanDiff:
+    added: List[VideoFile] = dataclasses.field(default_factory=list)
+    removed: List[VideoFile] = dataclasses.field(default_factory=list)
+    unchanged: List[VideoFile] = dataclasses.field(default_factory=list)
+    moved: List[Tuple[VideoFile, VideoFile]] = dataclasses.field(default_factory=list)  # (as it was, as it is now); only with fingerprints
+
+
+class ScanCache:
+    # Persistent record of each scanned directory's mtime, subdirectories and scrubbed video files. Adding,
+    # removing or renaming an entry updates its directory's mtime, so a directory whose mtime is unchanged since
+    # the last scan can be reused without listing it or scrubbing its filenames again. Each file's identity (inode,
+    # size and mtime, already stat'd by the walker) is kept too, so a library can tell a renamed file from a new one.
+
+    def __init__(self, cache_path: Text, config_key: Text):
+        self.cache_path = cache_path
+        self.config_key = config_key
+        self.directories: Dict[Text, CachedDirectory] = dict()
+        self.identities_by_directory: Dict[Text, Dict[Text, List[int]]] = dict()
+
+    @staticmethod
+    def default_path(folder_path: Text) -> Text:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        folder_hash = hashlib.sha1(os.path.abspath(folder_path).encode('utf8')).hexdigest()[:16]
+        return os.path.join(cache_home, 'MiniMediaManager', f'scan_cache_{folder_hash}.json')
+
+    @staticmethod
+    def make_config_key(ignore_extensions: Text, filename_metadata_tokens: Text) -> Text:
+        # Cached scrub results are only valid for the settings that produced them
+        return f'{ignore_extensions}|{filename_metadata_tokens}'
+
+    @classmethod
+    def load(cls, cache_path: Text, config_key: Text) -> 'ScanCache':
+        scan_cache = cls(cache_path, config_key)
+
+        try:
+            with open(cache_path, encoding='utf8') as f:
+                cache_json = json.load(f)
+        except FileNotFoundError:
+            return scan_cache
+        except (OSError, ValueError) as e:
+            print(f'ScanCache: Ignoring unreadable cache "{cache_path}": {e}')
+            return scan_cache
+
+        if cache_json.get('version') != SCAN_CACHE_VERSION or cache_json.get('config_key') != config_key:
+            print(f'ScanCache: Discarding cache "{cache_path}" written with different settings')
+            return scan_cache
+
+        for dir_path, cached_directory_dict in cache_json['directories'].items():
+            scan_cache.directories[dir_path] = CachedDirectory(**cached_directory_dict)
+
+        return scan_cache
+
+    def save(self):
+        cache_json = {
+            'version': SCAN_CACHE_VERSION,
+            'config_key': self.config_key,
+            # Spelled out rather than dataclasses.asdict(), which deep-copies every nested list
+            'directories': {dir_path: {'mtime_ns': cached_directory.mtime_ns, 'subdir_names': cached_directory.subdir_names, 'video_file_names': cached_directory.video_file_names, 'ignored_file_count': cached_directory.ignored_file_count, 'st_dev': cached_directory.st_dev, 'file_identities': cached_directory.file_identities} for dir_path, cached_directory in self.directories.items()},
+        }
+
+        cache_dir = os.path.dirname(self.cache_path)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix='.scan_cache_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf8') as f:
+                # json.dumps() uses the C encoder; json.dump() streams through the pure-Python one
+                f.write(json.dumps(cache_json, separators=(',', ':')))
+            os.replace(temp_path, self.cache_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def lookup(self, dir_path: Text, mtime_ns: int) -> Optional[CachedDirectory]:
+        cached_directory = self.directories.get(dir_path)
+        if cached_directory is not None and cached_directory.mtime_ns == mtime_ns:
+            return cached_directory
+        return None
+
+    def file_identity(self, file_path: Text) -> Optional[FileIdentity]:
+        # (st_dev, st_ino, st_size, st_mtime_ns) of file_path when its directory was listed, whether or not the file
+        # is still there. A directory's name -> identity index is only built the first time one of its files is asked about.
+        dir_path, file_name = os.path.split(file_path)
+        if dir_path not in self.directories and dir_path + os.sep in self.directories:
+            # Files directly under a scanned folder given with a trailing separator
+            dir_path += os.sep
+        cached_directory = self.directories.get(dir_path)
+        if cached_directory is None or not cached_directory.file_identities:
+            return None
+
+        identities_by_name = self.identities_by_directory.get(dir_path)
+        if identities_by_name is None:
+            identities_by_name = {row[0]: identity for row, identity in zip(cached_directory.video_file_names, cached_directory.file_identities)}
+            self.identities_by_directory[dir_path] = identities_by_name
+        identity = identities_by_name.get(file_name)
+        return (cached_directory.st_dev, *identity) if identity else None
+
+    def record(self, dir_path: Text, mtime_ns: int, subdir_paths: List[Text], video_files: List[VideoFile], ignored_file_count: int, st_dev: int = 0, identities_by_name: Dict[Text, List[int]] = None) -> CachedDirectory:
+        cached_directory = self.make_cached_directory(mtime_ns, subdir_paths, video_files, ignored_file_count, st_dev, identities_by_name)
+        self.directories[dir_path] = cached_directory
+        return cached_directory
+
+    @staticmethod
+    def make_cached_directory(mtime_ns: int, subdir_paths: List[Text], video_files: List[VideoFile], ignored_file_count: int, st_dev: int = 0, identities_by_name: Dict[Text, List[int]] = None) -> CachedDirectory:
+        if mtime_ns >= time.time_ns() - MTIME_GRANULARITY_NS:
+            mtime_ns = -1
+
+        subdir_names = [os.path.basename(subdir_path) for subdir_path in subdir_paths]
+        video_file_names = [[os.path.basename(video_file.file_path), video_file.scrubbed_file_name, video_file.scrubbed_file_year] for video_file in video_files]
+        file_identities = [identities_by_name.get(row[0]) for row in video_file_names] if identities_by_name else []
+        return CachedDirectory(mtime_ns=mtime_ns, subdir_names=subdir_names, video_file_names=video_file_names, ignored_file_count=ignored_file_count, st_dev=st_dev, file_identities=file_identities)
@@ -0,0 +1,125 @@
+from typing import List, Optional, Text, Tuple
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import tempfile
+
+from mmm.core.scan_cache import CachedDirectory
+
+
+SCAN_CHECKPOINT_VERSION = 2
+
+
+class ScanCheckpoint:
+    # On-disk progress of an unfinished scan, so a cancelled, paused-then-closed or crashed scan can pick up where it
+    # stopped instead of starting over. A checkpoint is a directory holding two files:
+    #
+    #   results.ndjson   one line per finished directory, in walk order, in the ScanCache CachedDirectory layout
+    #   frontier.json    the stack of directories not yet listed, and how many bytes of results.ndjson they follow
+    #
+    # Results are appended as directories finish; frontier.json is replaced atomically (after the results it refers
+    # to have been fsync'd) whenever save_frontier() is called. Anything appended after the last frontier was saved
+    # is truncated on resume, so the two files always describe the same point in the walk.
+
+    def __init__(self, checkpoint_dir: Text, folder_path: Text, config_key: Text):
+        self.checkpoint_dir = checkpoint_dir
+        self.folder_path = folder_path
+        self.config_key = config_key
+        self.results_path = os.path.join(checkpoint_dir, 'results.ndjson')
+        self.frontier_path = os.path.join(checkpoint_dir, 'frontier.json')
+        self.results_file = None
+
+    @staticmethod
+    def default_dir(folder_path: Text) -> Text:
+        cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        folder_hash = hashlib.sha1(os.path.abspath(folder_path).encode('utf8')).hexdigest()[:16]
+        return os.path.join(cache_home, 'MiniMediaManager', f'scan_checkpoint_{folder_hash}')
+
+    def load(self) -> Optional[Tuple[List[Text], List[Tuple[Text, CachedDirectory]]]]:
+        # Returns (frontier, finished directories), or None when there is no usable checkpoint to resume from
+        try:
+            with open(self.frontier_path, encoding='utf8') as f:
+                frontier_json = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f'ScanCheckpoint: Ignoring unreadable checkpoint "{self.frontier_path}": {e}')
+            return None
+
+        if frontier_json.get('version') != SCAN_CHECKPOINT_VERSION or frontier_json.get('folder_path') != self.folder_path or frontier_json.get('config_key') != self.config_key:
+            print(f'ScanCheckpoint: Discarding checkpoint "{self.checkpoint_dir}" written with different settings')
+            return None
+
+        results_size = frontier_json['results_size']
+        finished_directories = list()
+        try:
+            with open(self.results_path, 'r+b') as f:
+                # Drop results appended after the frontier was saved; they will be scanned again
+                f.truncate(results_size)
+                for result_line in f:
+                    finished_directories.append(self.parse_result_line(result_line))
+        except (OSError, ValueError) as e:
+            print(f'ScanCheckpoint: Ignoring unreadable checkpoint results "{self.results_path}": {e}')
+            return None
+
+        return frontier_json['frontier'], finished_directories
+
+    @staticmethod
+    def parse_result_line(result_line: bytes) -> Tuple[Text, CachedDirectory]:
+        dir_path, mtime_ns, subdir_names, video_file_names, ignored_file_count, st_dev, file_identities = json.loads(result_line)
+        return dir_path, CachedDirectory(mtime_ns=mtime_ns, subdir_names=subdir_names, video_file_names=video_file_names, ignored_file_count=ignored_file_count, st_dev=st_dev, file_identities=file_identities)
+
+    def open_results(self, resuming: bool):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.results_file = open(self.results_path, 'ab' if resuming else 'wb')
+
+    def append_result(self, dir_path: Text, cached_directory: CachedDirectory):
+        result_row = [dir_path, cached_directory.mtime_ns, cached_directory.subdir_names, cached_directory.video_file_names, cached_directory.ignored_file_count, cached_directory.st_dev, cached_directory.file_identities]
+        self.results_file.write(json.dumps(result_row, separators=(',', ':')).encode('utf8') + b'\n')
+
+    def save_frontier(self, frontier: List[Text]):
+        self.results_file.flush()
+        os.fsync(self.results_file.fileno())
+
+        frontier_json = {
+            'version': SCAN_CHECKPOINT_VERSION,
+            'folder_path': self.folder_path,
+            'config_key': self.config_key,
+            'results_size': self.results_file.tell(),
+            'frontier': frontier,
+        }
+
+        fd, temp_path = tempfile.mkstemp(dir=self.checkpoint_dir, prefix='.frontier_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf8') as f:
+                f.write(json.dumps(frontier_json))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.frontier_path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def close(self):
+        if self.results_file is not None:
+            self.results_file.close()
+            self.results_file = None
+
+    def discard(self):
+        self.close()
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+
+class WalkFrontier:
+    # Mirrors ParallelDirectoryWalker's stack of unvisited directories on the consuming side of the pipeline, so it
+    # reflects what has actually been processed rather than what the walker has already prefetched.
+
+    def __init__(self, pending_dir_paths: List[Text]):
+        self.pending_dir_paths = list(pending_dir_paths)
+
+    def directory_finished(self, dir_path: Text, subdir_paths: List[Text]):
+        finished_dir_path = self.pending_dir_paths.pop()
+        assert finished_dir_path == dir_path, f'Walk order mismatch: expected "{finished_dir_path}", got "{dir_path}"'
+        self.pending_dir_paths.extend(reversed(subdir_paths))
@@ -0,0 +1,256 @@
+from typing import Callable, Dict, List, Optional, Text
+import threading
+import time
+
+from mmm.core.filename_scrubber import DEFAULT_FILENAME_METADATA_TOKENS
+from mmm.core.fingerprint import FileIdentity, FingerprintCache, match_moved_files
+from mmm.core.scan_cache import CachedDirectory, ScanCache, ScanDiff
+from mmm.core.scan_checkpoint import ScanCheckpoint, WalkFrontier
+from mmm.core.scan_pipeline import InlineScrubStage, ProcessPoolScrubStage
+from mmm.core.scan_progress import ScanProgress, ScanProgressReporter
+from mmm.core.scan_traversal import DirectoryListing, ParallelDirectoryWalker
+from mmm.core.video_file import VideoFile
+
+
+DEFAULT_IGNORE_EXTENSIONS = 'png,jpg,nfo,srt'
+
+
+class ScanEngine:
+    # The toolkit-independent folder scan shared by the GTK and Qt front ends and the command line. run() scans
+    # synchronously on the calling thread; front ends run it on their own worker thread and plug in sinks:
+    #
+    #   progress_sink(ScanProgress)       rate-limited summaries, e.g. wrapped in GLib.idle_add or a Qt Signal.emit
+    #   result_sink(List[VideoFile])      each directory's video files, in walk order, as soon as they are known
+    #
+    # Both sinks are called on the scanning thread. With keep_results=False the engine holds on to nothing per file
+    # (folder_data and scan_diff stay None), so a sink that streams results elsewhere scans in constant memory.
+    #
+    # With use_checkpoint=True the engine saves a ScanCheckpoint every checkpoint_interval seconds, when paused and
+    # when stopped. The next run() for the same folder and settings replays the finished directories through the
+    # sinks and carries on from the saved frontier; the checkpoint is deleted once a scan completes.
+    #
+    # With use_fingerprints=True (and keep_results) a completed scan also fingerprints every video file, reading
+    # only the new or changed ones, and reports removed files that reappeared elsewhere as scan_diff.moved rather
+    # than as removed plus added; fingerprints holds file_path -> fingerprint for duplicate detection.
+    #
+    # After a completed scan (with keep_results), recorded_file_identity() gives the identity each file had when the
+    # previous scan saw it, which is what lets reconcile_scan() follow a library record to its file's new name.
+
+    def __init__(self, folder_path: Text, ignore_extensions: Text = None, filename_metadata_tokens: Text = None, progress_sink: Callable[[ScanProgress], object] = None, result_sink: Callable[[List[VideoFile]], object] = None,
+                 progress_rate_hz: float = 10.0, max_workers: int = 8, use_scan_cache: bool = True, scan_cache_path: Text = None, use_process_pool: bool = False, process_pool_workers: int = None, process_pool_batch_size: int = 2000, keep_results: bool = True,
+                 use_checkpoint: bool = False, checkpoint_dir: Text = None, checkpoint_interval: float = 10.0, use_fingerprints: bool = False, fingerprint_cache_path: Text = None):
+        self.folder_data: List[VideoFile] = None
+        self.scan_diff: ScanDiff = None
+        self.fingerprints: Dict[Text, Text] = None
+        self.previous_scan_cache: ScanCache = None
+        self.ignore_extensions = ignore_extensions or DEFAULT_IGNORE_EXTENSIONS
+        self.filename_metadata_tokens = filename_metadata_tokens or DEFAULT_FILENAME_METADATA_TOKENS
+        self.folder_path = folder_path
+        self.keep_scanning = True
+        self.not_paused = threading.Event()
+        self.not_paused.set()
+        self.progress_sink = progress_sink
+        self.result_sink = result_sink
+        self.progress_rate_hz = progress_rate_hz
+        self.max_workers = max_workers
+        self.use_scan_cache = use_scan_cache
+        self.scan_cache_path = scan_cache_path or ScanCache.default_path(folder_path)
+        self.use_process_pool = use_process_pool
+        self.process_pool_workers = process_pool_workers
+        self.process_pool_batch_size = process_pool_batch_size
+        self.keep_results = keep_results
+        self.use_checkpoint = use_checkpoint
+        self.checkpoint_dir = checkpoint_dir or ScanCheckpoint.default_dir(folder_path)
+        self.checkpoint_interval = checkpoint_interval
+        self.use_fingerprints = use_fingerprints
+        self.fingerprint_cache_path = fingerprint_cache_path or FingerprintCache.default_path()
+
+    def stop_scanning(self):
+        self.keep_scanning = False
+        self.not_paused.set()
+
+    def pause_scanning(self):
+        self.not_paused.clear()
+
+    def resume_scanning(self):
+        self.not_paused.set()
+
+    @property
+    def is_paused(self) -> bool:
+        return not self.not_paused.is_set()
+
+    def run(self) -> bool:
+        print(f'ScanEngine: Begin processing directory "{self.folder_path}"')
+
+        progress_reporter = ScanProgressReporter(self.progress_sink or (lambda _progress: None), max_rate_hz=self.progress_rate_hz)
+
+        config_key = ScanCache.make_config_key(self.ignore_extensions, self.filename_metadata_tokens)
+        previous_scan_cache = ScanCache.load(self.scan_cache_path, config_key) if self.use_scan_cache else ScanCache(self.scan_cache_path, config_key)
+        scan_cache = ScanCache(self.scan_cache_path, config_key)
+
+        directory_walker = ParallelDirectoryWalker(max_workers=self.max_workers, directory_cache=previous_scan_cache)
+        if self.use_process_pool:
+            scrub_stage = ProcessPoolScrubStage(self.ignore_extensions, self.filename_metadata_tokens, max_workers=self.process_pool_workers, batch_size=self.process_pool_batch_size)
+        else:
+            scrub_stage = InlineScrubStage(self.ignore_extensions, self.filename_metadata_tokens)
+
+        self.folder_data = None
+        self.scan_diff = None
+        self.fingerprints = None
+        self.previous_scan_cache = None
+        folder_data = list()
+        scan_diff = ScanDiff()
+        file_count = 0
+
+        def finish_directory(dir_path: Text, directory_video_files: List[VideoFile], cached_directory: CachedDirectory, is_unchanged: bool):
+            nonlocal file_count
+
+            if self.use_scan_cache:
+                scan_cache.directories[dir_path] = cached_directory
+
+            if self.keep_results:
+                if is_unchanged:
+                    scan_diff.unchanged.extend(directory_video_files)
+                else:
+                    self.diff_directory(directory_video_files, previous_scan_cache.directories.get(dir_path), dir_path, scan_diff)
+                folder_data.extend(directory_video_files)
+            file_count += len(directory_video_files)
+
+            progress_reporter.files_seen_batch(len(directory_video_files) + cached_directory.ignored_file_count, len(directory_video_files))
+
+            if self.result_sink and directory_video_files:
+                self.result_sink(directory_video_files)
+
+        scan_checkpoint = ScanCheckpoint(self.checkpoint_dir, self.folder_path, config_key) if self.use_checkpoint else None
+        saved_checkpoint = scan_checkpoint.load() if scan_checkpoint else None
+        if saved_checkpoint:
+            frontier_dir_paths, finished_directories = saved_checkpoint
+            print(f'ScanEngine: Resuming from checkpoint "{self.checkpoint_dir}": {len(finished_directories)} directories done, {len(frontier_dir_paths)} pending')
+            for dir_path, cached_directory in finished_directories:
+                progress_reporter.enter_directory(dir_path)
+                finish_directory(dir_path, cached_directory.video_files(dir_path), cached_directory, is_unchanged=False)
+        else:
+            frontier_dir_paths = [self.folder_path]
+
+        walk_frontier = WalkFrontier(frontier_dir_paths)
+        if scan_checkpoint:
+            scan_checkpoint.open_results(resuming=saved_checkpoint is not None)
+        last_checkpoint_time = time.monotonic()
+
+        try:
+            for directory_listing, directory_video_files, ignored_file_count in scrub_stage.process(directory_walker.walk_frontier(frontier_dir_paths)):
+                if self.is_paused and self.keep_scanning:
+                    if scan_checkpoint:
+                        scan_checkpoint.save_frontier(walk_frontier.pending_dir_paths)
+                    print(f'ScanEngine: Paused')
+                    self.not_paused.wait()
+                    print(f'ScanEngine: Resumed')
+
+                if self.keep_scanning is False:
+                    print(f'ScanEngine: Stopping scanning')
+                    if scan_checkpoint:
+                        scan_checkpoint.save_frontier(walk_frontier.pending_dir_paths)
+                    return False
+
+                dir_path = directory_listing.dir_path
+                progress_reporter.enter_directory(dir_path)
+
+                if directory_listing.cached is not None:
+                    # Directory unchanged since the last scan: reuse its scrubbed files without listing or scrubbing
+                    cached_directory = directory_listing.cached
+                    finish_directory(dir_path, cached_directory.video_files(dir_path), cached_directory, is_unchanged=True)
+                else:
+                    cached_directory = ScanCache.make_cached_directory(directory_listing.mtime_ns, directory_listing.subdir_paths, directory_video_files, ignored_file_count, directory_listing.st_dev, self.file_identities(directory_listing))
+                    finish_directory(dir_path, directory_video_files, cached_directory, is_unchanged=False)
+
+                walk_frontier.directory_finished(dir_path, directory_listing.subdir_paths)
+                if scan_checkpoint:
+                    scan_checkpoint.append_result(dir_path, cached_directory)
+                    if time.monotonic() - last_checkpoint_time >= self.checkpoint_interval:
+                        scan_checkpoint.save_frontier(walk_frontier.pending_dir_paths)
+                        last_checkpoint_time = time.monotonic()
+        finally:
+            if scan_checkpoint:
+                scan_checkpoint.close()
+
+        if self.keep_results:
+            # Directories that were cached last time but not reached this time have been deleted or moved away
+            for dir_path, previous_cached_directory in previous_scan_cache.directories.items():
+                if dir_path not in scan_cache.directories:
+                    scan_diff.removed.extend(previous_cached_directory.video_files(dir_path))
+
+            if self.use_fingerprints:
+                self.fingerprints = self.match_moved_files(folder_data, scan_diff)
+
+            self.folder_data = folder_data
+            self.scan_diff = scan_diff
+            self.previous_scan_cache = previous_scan_cache
+
+        if self.use_scan_cache:
+            try:
+                scan_cache.save()
+            except OSError as e:
+                print(f'ScanEngine: Unable to save scan cache "{self.scan_cache_path}": {e}')
+
+        if scan_checkpoint:
+            scan_checkpoint.discard()
+
+        progress_reporter.complete()
+
+        if self.keep_results:
+            print(f'ScanEngine: End processing directory "{self.folder_path}": {len(scan_diff.added)} added, {len(scan_diff.removed)} removed, {len(scan_diff.moved)} moved, {len(scan_diff.unchanged)} unchanged')
+        else:
+            print(f'ScanEngine: End processing directory "{self.folder_path}": {file_count} video files')
+
+        return True
+
+    def recorded_file_identity(self, file_path: Text) -> Optional[FileIdentity]:
+        # (st_dev, st_ino, st_size, st_mtime_ns) of file_path as of the previous scan; None if that scan didn't see it
+        if self.previous_scan_cache is None:
+            return None
+        return self.previous_scan_cache.file_identity(file_path)
+
+    @staticmethod
+    def file_identities(directory_listing: DirectoryListing) -> Dict[Text, List[int]]:
+        # The walker has already stat'd every entry and DirEntry caches the result, so this costs no system calls
+        identities_by_name = dict()
+        for file_entry in directory_listing.file_entries:
+            try:
+                stat_result = file_entry.stat()
+            except OSError:
+                continue
+            identities_by_name[file_entry.name] = [stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+        return identities_by_name
+
+    def match_moved_files(self, folder_data: List[VideoFile], scan_diff: ScanDiff) -> Dict[Text, Text]:
+        fingerprint_cache = FingerprintCache.load(self.fingerprint_cache_path)
+        fingerprints = fingerprint_cache.fingerprint_files([video_file.file_path for video_file in folder_data], max_workers=self.max_workers, keep_going=lambda: self.keep_scanning)
+
+        scan_diff.moved = match_moved_files(scan_diff.removed, scan_diff.added, fingerprint_cache, fingerprints)
+        if scan_diff.moved:
+            moved_from_paths = {old_video_file.file_path for old_video_file, _new_video_file in scan_diff.moved}
+            moved_to_paths = {new_video_file.file_path for _old_video_file, new_video_file in scan_diff.moved}
+            scan_diff.removed = [video_file for video_file in scan_diff.removed if video_file.file_path not in moved_from_paths]
+            scan_diff.added = [video_file for video_file in scan_diff.added if video_file.file_path not in moved_to_paths]
+
+        # Files that are gone for good, and the old paths of moved files, aren't needed any more
+        fingerprint_cache.forget_paths(video_file.file_path for video_file in scan_diff.removed)
+        fingerprint_cache.forget_paths(old_video_file.file_path for old_video_file, _new_video_file in scan_diff.moved)
+        try:
+            fingerprint_cache.save()
+        except OSError as e:
+            print(f'ScanEngine: Unable to save fingerprint cache "{self.fingerprint_cache_path}": {e}')
+
+        return fingerprints
+
+    @staticmethod
+    def diff_directory(directory_video_files: List[VideoFile], previous_cached_directory: CachedDirectory, dir_path: Text, scan_diff: ScanDiff):
+        previous_video_files: Dict[Text, VideoFile] = {video_file.file_path: video_file for video_file in previous_cached_directory.video_files(dir_path)} if previous_cached_directory else dict()
+
+        for video_file in directory_video_files:
+            if previous_video_files.pop(video_file.file_path, None) is None:
+                scan_diff.added.append(video_file)
+            else:
+                scan_diff.unchanged.append(video_file)
+
+        scan_diff.removed.extend(previous_video_files.values())
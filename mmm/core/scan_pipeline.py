@@ -0,0 +1,150 @@
+from concurrent.futures import Future
+from typing import Collection, Deque, FrozenSet, Iterable, Iterator, List, Text, Tuple
+import collections
+import os
+import os.path
+
+from mmm.core.filename_scrubber import FilenameScrubber, get_filename_scrubber
+from mmm.core.scan_traversal import DirectoryListing
+from mmm.core.video_file import VideoFile
+
+
+def parse_ignore_extensions(ignore_extensions: Text) -> FrozenSet[Text]:
+    return frozenset(ext.lower().strip() for ext in ignore_extensions.split(','))
+
+
+def scrub_file_names(file_names: Iterable[Text], ignore_extensions: Collection[Text], filename_scrubber: FilenameScrubber) -> Tuple[List[Tuple[Text, Text, Text]], int]:
+    # Returns [file_name, scrubbed_file_name, scrubbed_file_year] rows for the kept files, and the ignored file count
+    scrubbed_rows = list()
+    ignored_file_count = 0
+
+    for file_name in file_names:
+        file_name_no_extension, file_name_extension = os.path.splitext(file_name)
+        if file_name_extension.startswith('.'):
+            file_name_extension = file_name_extension[1:]
+
+        if file_name_extension.lower() in ignore_extensions:
+            ignored_file_count += 1
+            continue
+
+        scrubbed_file_name, year = filename_scrubber.scrub(file_name_no_extension)
+        scrubbed_rows.append((file_name, scrubbed_file_name, year))
+
+    return scrubbed_rows, ignored_file_count
+
+
+def make_video_files(dir_path: Text, scrubbed_rows: Iterable[Tuple[Text, Text, Text]]) -> List[VideoFile]:
+    return [VideoFile(file_path=os.path.join(dir_path, file_name), scrubbed_file_name=scrubbed_file_name, scrubbed_file_year=year) for file_name, scrubbed_file_name, year in scrubbed_rows]
+
+
+class InlineScrubStage:
+    # Scrubs each directory's files on the calling thread, as they come off the walker
+
+    def __init__(self, ignore_extensions: Text, filename_metadata_tokens: Text):
+        self.ignore_extensions = parse_ignore_extensions(ignore_extensions)
+        self.filename_scrubber = get_filename_scrubber(filename_metadata_tokens)
+
+    def process(self, directory_listings: Iterable[DirectoryListing]) -> Iterator[Tuple[DirectoryListing, List[VideoFile], int]]:
+        for directory_listing in directory_listings:
+            file_names = [file_entry.name for file_entry in directory_listing.file_entries]
+            scrubbed_rows, ignored_file_count = scrub_file_names(file_names, self.ignore_extensions, self.filename_scrubber)
+            yield directory_listing, make_video_files(directory_listing.dir_path, scrubbed_rows), ignored_file_count
+
+
+# Per-process state for ProcessPoolScrubStage workers, set up once by the pool initializer
+_worker_ignore_extensions: FrozenSet[Text] = frozenset()
+_worker_filename_scrubber: FilenameScrubber = None
+
+
+def _init_scrub_worker(ignore_extensions: Text, filename_metadata_tokens: Text):
+    global _worker_ignore_extensions, _worker_filename_scrubber
+    _worker_ignore_extensions = parse_ignore_extensions(ignore_extensions)
+    _worker_filename_scrubber = FilenameScrubber(filename_metadata_tokens)
+
+
+def _scrub_batch(file_name_lists: List[List[Text]]) -> List[Tuple[List[Tuple[Text, Text, Text]], int]]:
+    return [scrub_file_names(file_names, _worker_ignore_extensions, _worker_filename_scrubber) for file_names in file_name_lists]
+
+
+class _ScrubBatch:
+    def __init__(self):
+        self.file_name_lists: List[List[Text]] = list()
+        self.file_count = 0
+        self.future: Future = None
+
+
+class ProcessPoolScrubStage:
+    # Sends batches of directory file names from the walker to a process pool that filters and scrubs them, so the
+    # regex work is not serialized behind the scanner thread's GIL. Results come back in walker order: directories
+    # are queued in the order they were listed, and one is only released once its batch (and every batch before
+    # it) has finished. At most max_pending_batches batches are in flight at once.
+    #
+    # Workers return plain (file_name, scrubbed_file_name, year) tuples and the VideoFiles are built here: pickling
+    # a dataclass instance costs more than scrubbing the name, and would eat most of what the pool saves.
+    #
+    # Workers are started with the 'spawn' method, since forking a process that is running a GUI main loop and the
+    # walker's threads is not safe. As with any spawned pool, the launching script needs an __main__ guard.
+
+    def __init__(self, ignore_extensions: Text, filename_metadata_tokens: Text, max_workers: int = None, batch_size: int = 2000, max_pending_batches: int = None):
+        self.ignore_extensions = ignore_extensions
+        self.filename_metadata_tokens = filename_metadata_tokens
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_pending_batches = max_pending_batches or 2 * self.max_workers
+
+    def process(self, directory_listings: Iterable[DirectoryListing]) -> Iterator[Tuple[DirectoryListing, List[VideoFile], int]]:
+        # Imported here: multiprocessing is a noticeable part of startup time, and most scans never need it
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_scrub_worker, initargs=(self.ignore_extensions, self.filename_metadata_tokens))
+        pending_directories: Deque[Tuple[DirectoryListing, _ScrubBatch, int]] = collections.deque()
+        submitted_batches: Deque[_ScrubBatch] = collections.deque()
+        current_batch = _ScrubBatch()
+
+        def submit_current_batch():
+            nonlocal current_batch
+            current_batch.future = executor.submit(_scrub_batch, current_batch.file_name_lists)
+            submitted_batches.append(current_batch)
+            current_batch = _ScrubBatch()
+
+        def release_ready_directories(drain_all: bool):
+            while pending_directories:
+                directory_listing, scrub_batch, batch_index = pending_directories[0]
+                wait = drain_all or len(submitted_batches) >= self.max_pending_batches
+
+                if scrub_batch is not None:
+                    if scrub_batch.future is None:
+                        if not wait:
+                            return
+                        submit_current_batch()
+                    elif not wait and not scrub_batch.future.done():
+                        return
+
+                pending_directories.popleft()
+                if scrub_batch is None:
+                    yield directory_listing, [], 0
+                    continue
+
+                scrubbed_rows, ignored_file_count = scrub_batch.future.result()[batch_index]
+                if batch_index == len(scrub_batch.file_name_lists) - 1:
+                    submitted_batches.popleft()
+                yield directory_listing, make_video_files(directory_listing.dir_path, scrubbed_rows), ignored_file_count
+
+        try:
+            for directory_listing in directory_listings:
+                if directory_listing.file_entries:
+                    pending_directories.append((directory_listing, current_batch, len(current_batch.file_name_lists)))
+                    current_batch.file_name_lists.append([file_entry.name for file_entry in directory_listing.file_entries])
+                    current_batch.file_count += len(directory_listing.file_entries)
+                    if current_batch.file_count >= self.batch_size:
+                        submit_current_batch()
+                else:
+                    # Nothing to scrub (an empty or cached directory), but it still has to keep its place in line
+                    pending_directories.append((directory_listing, None, 0))
+
+                yield from release_ready_directories(drain_all=False)
+
+            yield from release_ready_directories(drain_all=True)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,70 @@
+from typing import Callable, Text
+import dataclasses
+import time
+
+
+@dataclasses.dataclass
+class ScanProgress:
+    files_seen: int = 0
+    files_kept: int = 0
+    current_dir: Text = ''
+    files_per_second: float = 0.0
+    elapsed_seconds: float = 0.0
+    is_complete: bool = False
+
+    def summary(self) -> Text:
+        state = 'Complete' if self.is_complete else 'Scanning'
+        return f'{state}: {self.files_seen} files seen, {self.files_kept} kept, {self.files_per_second:.0f} files/s, {self.elapsed_seconds:.1f}s elapsed, "{self.current_dir}"'
+
+
+class ScanProgressReporter:
+    # Coalesces per-file scan events into ScanProgress summaries, emitted at no more than max_rate_hz.
+    # The emit callable is the only toolkit-specific part: wrap GLib.idle_add for GTK, pass Signal.emit for Qt.
+
+    def __init__(self, emit: Callable[[ScanProgress], object], max_rate_hz: float = 10.0, clock: Callable[[], float] = time.monotonic):
+        self.emit = emit
+        self.min_interval = 1.0 / max_rate_hz if max_rate_hz > 0 else 0.0
+        self.clock = clock
+        self.files_seen = 0
+        self.files_kept = 0
+        self.current_dir = ''
+        self.start_time = clock()
+        self.last_emit_time = self.start_time
+        self.last_emit_files_seen = 0
+
+    def enter_directory(self, dir_path: Text):
+        self.current_dir = dir_path
+
+    def file_seen(self, kept: bool):
+        self.files_seen += 1
+        if kept:
+            self.files_kept += 1
+
+        now = self.clock()
+        if now - self.last_emit_time >= self.min_interval:
+            self._emit(now, is_complete=False)
+
+    def files_seen_batch(self, seen_count: int, kept_count: int):
+        self.files_seen += seen_count
+        self.files_kept += kept_count
+
+        now = self.clock()
+        if now - self.last_emit_time >= self.min_interval:
+            self._emit(now, is_complete=False)
+
+    def complete(self):
+        self._emit(self.clock(), is_complete=True)
+
+    def _emit(self, now: float, is_complete: bool):
+        interval = now - self.last_emit_time
+        elapsed = now - self.start_time
+        if is_complete:
+            files_per_second = self.files_seen / elapsed if elapsed > 0 else 0.0
+        else:
+            files_per_second = (self.files_seen - self.last_emit_files_seen) / interval if interval > 0 else 0.0
+
+        self.last_emit_time = now
+        self.last_emit_files_seen = self.files_seen
+
+        progress = ScanProgress(files_seen=self.files_seen, files_kept=self.files_kept, current_dir=self.current_dir, files_per_second=files_per_second, elapsed_seconds=elapsed, is_complete=is_complete)
+        self.emit(progress)
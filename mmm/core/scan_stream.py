@@ -0,0 +1,70 @@
+from typing import Callable, List, Tuple
+import queue
+import time
+
+from mmm.core.video_file import VideoFile
+
+
+class VideoFileBatchQueue:
+    # Thread-safe hand-off of scan results from a worker thread to the UI. The producer adds VideoFiles one at a
+    # time; they are queued in batches, flushed when a batch fills up or max_batch_delay has passed, so the first
+    # rows of a huge scan reach the UI within a fraction of a second while later ones travel in bulk. The
+    # consumer polls get_batches() from its main loop and gets back a bounded chunk of rows per call.
+
+    def __init__(self, max_batch_size: int = 1000, max_batch_delay: float = 0.1, clock: Callable[[], float] = time.monotonic):
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.clock = clock
+        self.batch_queue = queue.SimpleQueue()
+        self.pending_batch: List[VideoFile] = list()
+        self.pending_batch_start_time = clock()
+        self.is_closed = False
+        self.received_close = False
+        self.leftover_batch: List[VideoFile] = list()
+
+    def put(self, video_file: VideoFile):
+        if not self.pending_batch:
+            self.pending_batch_start_time = self.clock()
+        self.pending_batch.append(video_file)
+
+        if len(self.pending_batch) >= self.max_batch_size or self.clock() - self.pending_batch_start_time >= self.max_batch_delay:
+            self.flush()
+
+    def put_many(self, video_files: List[VideoFile]):
+        # A group of results (typically one directory) is queued right away, so a partial batch never waits in the
+        # queue while the producer is blocked on the next, possibly slow, directory listing
+        self.pending_batch.extend(video_files)
+        self.flush()
+
+    def flush(self):
+        if self.pending_batch:
+            self.batch_queue.put(self.pending_batch)
+            self.pending_batch = list()
+
+    def close(self):
+        if not self.is_closed:
+            self.flush()
+            self.is_closed = True
+            self.batch_queue.put(None)
+
+    def get_batches(self, max_items: int = 5000) -> Tuple[List[VideoFile], bool]:
+        # Returns up to about max_items queued VideoFiles, and whether the producer has closed the queue and
+        # everything it sent has now been handed out
+        video_files = self.leftover_batch
+        self.leftover_batch = list()
+
+        while len(video_files) < max_items and not self.received_close:
+            try:
+                batch = self.batch_queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self.received_close = True
+            else:
+                video_files.extend(batch)
+
+        if len(video_files) > max_items:
+            self.leftover_batch = video_files[max_items:]
+            video_files = video_files[:max_items]
+
+        return video_files, self.received_close and not self.leftover_batch
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Text
+import dataclasses
+import os
+
+
+@dataclasses.dataclass
+class DirectoryListing:
+    dir_path: Text
+    subdir_paths: List[Text]
+    file_entries: List[os.DirEntry]
+    mtime_ns: int = -1
+    cached: Any = None
+    st_dev: int = 0
+
+
+class ParallelDirectoryWalker:
+    # Lists directories on a bounded thread pool, so many slow (SMB/NFS) directory reads are in flight at once,
+    # while still yielding listings in a deterministic top-down order: sorted by name, depth first, like a
+    # sorted os.walk. Pending directories sit on a stack and are consumed strictly from the top, so the output order
+    # never depends on which thread finishes first. Only the top prefetch_depth entries of the stack (the next
+    # directories to be yielded) are listed ahead of time, which keeps memory flat however wide the tree is.
+    #
+    # If a directory_cache is given, its lookup(dir_path, mtime_ns) is asked first; a hit is yielded as a listing
+    # with no file entries and the cached object attached, and its subdir_paths(dir_path) are walked as usual.
+
+    def __init__(self, max_workers: int = 8, follow_links: bool = False, stat_files: bool = True, scandir: Callable = os.scandir, directory_cache=None, prefetch_depth: int = None):
+        self.max_workers = max(1, max_workers)
+        self.prefetch_depth = prefetch_depth or 4 * self.max_workers
+        self.follow_links = follow_links
+        self.stat_files = stat_files
+        self.scandir = scandir
+        self.directory_cache = directory_cache
+
+    def list_directory(self, dir_path: Text) -> DirectoryListing:
+        try:
+            dir_stat = os.stat(dir_path)
+            mtime_ns, st_dev = dir_stat.st_mtime_ns, dir_stat.st_dev
+        except OSError:
+            mtime_ns, st_dev = -1, 0
+
+        if self.directory_cache is not None and mtime_ns >= 0:
+            cached = self.directory_cache.lookup(dir_path, mtime_ns)
+            if cached is not None:
+                return DirectoryListing(dir_path=dir_path, subdir_paths=cached.subdir_paths(dir_path), file_entries=[], mtime_ns=mtime_ns, cached=cached, st_dev=st_dev)
+
+        subdir_paths = list()
+        file_entries = list()
+
+        try:
+            with self.scandir(dir_path) as dir_entries:
+                for entry in dir_entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_links):
+                            subdir_paths.append(entry.path)
+                            continue
+                        if not self.follow_links and entry.is_symlink() and entry.is_dir():
+                            # A link to a directory, which os.walk(followlinks=False) lists as a directory but
+                            # doesn't go into: neither a file nor a directory to walk
+                            continue
+                        if self.stat_files:
+                            # DirEntry caches its stat result, so doing it here moves the (possibly slow) network
+                            # stat onto the pool thread and later entry.stat() calls are free.
+                            entry.stat()
+                    except OSError:
+                        continue
+                    file_entries.append(entry)
+        except OSError as e:
+            print(f'ParallelDirectoryWalker: Unable to list directory "{dir_path}": {e}')
+            mtime_ns = -1
+
+        subdir_paths.sort()
+        file_entries.sort(key=lambda dir_entry: dir_entry.name)
+        return DirectoryListing(dir_path=dir_path, subdir_paths=subdir_paths, file_entries=file_entries, mtime_ns=mtime_ns, st_dev=st_dev)
+
+    def walk(self, top: Text) -> Iterator[DirectoryListing]:
+        return self.walk_frontier([top])
+
+    def walk_frontier(self, frontier: List[Text]) -> Iterator[DirectoryListing]:
+        # Continue a walk from a saved stack of unvisited directories, the last of which is listed first
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ParallelDirectoryWalker')
+        try:
+            # [dir_path, Future or None] entries; the top of the stack is the next directory to yield
+            pending_dirs: List[List] = [[dir_path, None] for dir_path in frontier]
+            while pending_dirs:
+                for pending_dir in pending_dirs[-self.prefetch_depth:]:
+                    if pending_dir[1] is None:
+                        pending_dir[1] = executor.submit(self.list_directory, pending_dir[0])
+
+                listing: DirectoryListing = pending_dirs.pop()[1].result()
+
+                # Push in reverse so the first subdirectory is the next one popped
+                pending_dirs.extend([subdir_path, None] for subdir_path in reversed(listing.subdir_paths))
+
+                yield listing
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
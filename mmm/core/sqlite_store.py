@@ -0,0 +1,375 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Text, Tuple
+import array
+import collections
+import dataclasses
+import itertools
+import json
+import os.path
+import sqlite3
+import threading
+
+from mmm.core.library_journal import write_library_file
+from mmm.core.video_file import LoadProgress, VideoFile, iter_video_file_batches, video_file_as_dict
+
+
+SQLITE_STORE_SCHEMA_VERSION = 1
+
+# title, year and rating are derived from the VideoFile fields on every write so they can be indexed and sorted on:
+# title is the IMDB name when known and the scrubbed name otherwise, year and rating are numeric (NULL if unknown)
+SQLITE_STORE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS video_files (
+    id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL UNIQUE,
+    scrubbed_file_name TEXT NOT NULL DEFAULT '',
+    scrubbed_file_year TEXT NOT NULL DEFAULT '',
+    imdb_tt TEXT NOT NULL DEFAULT '',
+    imdb_name TEXT NOT NULL DEFAULT '',
+    imdb_year TEXT NOT NULL DEFAULT '',
+    imdb_rating TEXT NOT NULL DEFAULT '',
+    imdb_genres TEXT,
+    imdb_plot TEXT,
+    title TEXT NOT NULL DEFAULT '',
+    year INTEGER,
+    rating REAL
+);
+CREATE INDEX IF NOT EXISTS video_files_imdb_tt ON video_files (imdb_tt);
+CREATE INDEX IF NOT EXISTS video_files_title ON video_files (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS video_files_year ON video_files (year);
+CREATE INDEX IF NOT EXISTS video_files_rating ON video_files (rating);
+'''
+
+VIDEO_FILE_COLUMNS = ('file_path', 'scrubbed_file_name', 'scrubbed_file_year', 'imdb_tt', 'imdb_name', 'imdb_year', 'imdb_rating', 'imdb_genres', 'imdb_plot')
+DERIVED_COLUMNS = ('title', 'year', 'rating')
+SCANNED_COLUMNS = ('scrubbed_file_name', 'scrubbed_file_year')
+
+SELECT_VIDEO_FILES = f'SELECT {", ".join(VIDEO_FILE_COLUMNS)} FROM video_files'
+UPSERT_VIDEO_FILE = (f'INSERT INTO video_files ({", ".join(VIDEO_FILE_COLUMNS + DERIVED_COLUMNS)}) VALUES ({", ".join("?" * len(VIDEO_FILE_COLUMNS + DERIVED_COLUMNS))}) '
+                     f'ON CONFLICT (file_path) DO UPDATE SET {", ".join(f"{column} = excluded.{column}" for column in VIDEO_FILE_COLUMNS[1:] + DERIVED_COLUMNS)}')
+# A rescan only knows what the file name says; it must not wipe IMDB details looked up since
+UPSERT_SCANNED_VIDEO_FILE = (f'INSERT INTO video_files ({", ".join(VIDEO_FILE_COLUMNS + DERIVED_COLUMNS)}) VALUES ({", ".join("?" * len(VIDEO_FILE_COLUMNS + DERIVED_COLUMNS))}) '
+                             f'ON CONFLICT (file_path) DO UPDATE SET {", ".join(f"{column} = excluded.{column}" for column in SCANNED_COLUMNS)}, '
+                             f"title = CASE WHEN imdb_name != '' THEN imdb_name ELSE excluded.title END, "
+                             f"year = CASE WHEN imdb_year != '' THEN year ELSE excluded.year END")
+
+SORT_COLUMNS = {
+    'title': 'title COLLATE NOCASE',
+    'year': 'year',
+    'rating': 'rating',
+    'file_path': 'file_path',
+    'id': 'id',  # the order records were added in, which is the order of the list the front ends show
+}
+
+# SqliteLibraryRows reads this many rows at a time for a view and keeps this many of the pages it read last; it
+# reads ROWS_ITER_BATCH_SIZE at a time when iterated
+ROWS_PAGE_SIZE = 64
+ROWS_CACHED_PAGE_COUNT = 256
+ROWS_ITER_BATCH_SIZE = 5000
+
+
+def parse_number(value: Text, number_type):
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def video_file_row(video_file: VideoFile) -> tuple:
+    return (video_file.file_path, video_file.scrubbed_file_name, video_file.scrubbed_file_year, video_file.imdb_tt, video_file.imdb_name, video_file.imdb_year, video_file.imdb_rating,
+            json.dumps(video_file.imdb_genres, ensure_ascii=False) if video_file.imdb_genres is not None else None, video_file.imdb_plot,
+            video_file.imdb_name or video_file.scrubbed_file_name, parse_number(video_file.imdb_year or video_file.scrubbed_file_year, int), parse_number(video_file.imdb_rating, float))
+
+
+def row_video_file(row: tuple) -> VideoFile:
+    file_path, scrubbed_file_name, scrubbed_file_year, imdb_tt, imdb_name, imdb_year, imdb_rating, imdb_genres, imdb_plot = row
+    return VideoFile(file_path=file_path, scrubbed_file_name=scrubbed_file_name, scrubbed_file_year=scrubbed_file_year, imdb_tt=imdb_tt, imdb_name=imdb_name, imdb_year=imdb_year,
+                     imdb_rating=imdb_rating, imdb_genres=json.loads(imdb_genres) if imdb_genres is not None else None, imdb_plot=imdb_plot)
+
+
+@dataclasses.dataclass
+class LibraryQuery:
+    # Filters for SqliteLibraryStore.query_page() and count(); None means "don't filter on this"
+    title_contains: Text = None
+    min_year: int = None
+    max_year: int = None
+    min_rating: float = None
+    imdb_tt: Text = None
+    genre: Text = None
+    min_id: int = None
+    max_id: int = None
+    order_by: Text = 'title'
+    descending: bool = False
+
+    def where_clause(self) -> Tuple[Text, List]:
+        conditions = list()
+        parameters = list()
+        if self.title_contains:
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            parameters.append('%' + self.title_contains.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if self.min_year is not None:
+            conditions.append('year >= ?')
+            parameters.append(self.min_year)
+        if self.max_year is not None:
+            conditions.append('year <= ?')
+            parameters.append(self.max_year)
+        if self.min_rating is not None:
+            conditions.append('rating >= ?')
+            parameters.append(self.min_rating)
+        if self.imdb_tt is not None:
+            conditions.append('imdb_tt = ?')
+            parameters.append(self.imdb_tt)
+        if self.genre:
+            conditions.append('EXISTS (SELECT 1 FROM json_each(video_files.imdb_genres) WHERE json_each.value = ?)')
+            parameters.append(self.genre)
+        if self.min_id is not None:
+            conditions.append('id >= ?')
+            parameters.append(self.min_id)
+        if self.max_id is not None:
+            conditions.append('id <= ?')
+            parameters.append(self.max_id)
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', parameters
+
+    def order_clause(self) -> Text:
+        direction = 'DESC' if self.descending else 'ASC'
+        # id breaks ties so pages never overlap or skip rows
+        return f' ORDER BY {SORT_COLUMNS[self.order_by]} {direction}, id {direction}'
+
+
+class SqliteLibraryStore:
+    # A library kept in an SQLite database rather than in memory: indexed lookups by file_path and imdb_tt, sorted
+    # and filtered pages by title, year and rating, and writes in batched transactions. WAL mode lets the GUI read
+    # pages while the scanner is writing. Each thread gets its own connection, as sqlite3 requires.
+    #
+    # Offers the same open_rows() / iter_batches() / save_dirty() / write_full() interface as LibraryJournal, so the front ends
+    # can load and save either one (see mmm.core.library_store.open_library). The front ends don't load a store: they
+    # show its open_rows(), which pages through query_page() as the view scrolls.
+
+    def __init__(self, library_path: Text):
+        self.library_path = library_path
+        self.thread_local = threading.local()
+        connection = self.connection()
+        schema_version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if schema_version == 0:
+            # A new database, unless something else already made tables in it
+            if connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]:
+                self.close()
+                raise ValueError(f'"{library_path}" is an SQLite database, but not a library')
+            connection.executescript(SQLITE_STORE_SCHEMA)
+            connection.execute(f'PRAGMA user_version = {SQLITE_STORE_SCHEMA_VERSION}')
+        elif schema_version != SQLITE_STORE_SCHEMA_VERSION:
+            self.close()
+            raise ValueError(f'"{library_path}" is a version {schema_version} library; this version of MMM reads version {SQLITE_STORE_SCHEMA_VERSION}')
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.thread_local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.library_path, timeout=30.0)
+            connection.execute('PRAGMA journal_mode = WAL')
+            # With WAL, NORMAL only risks the last transactions on power loss, never corruption
+            connection.execute('PRAGMA synchronous = NORMAL')
+            self.thread_local.connection = connection
+        return connection
+
+    def close(self):
+        connection = getattr(self.thread_local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.thread_local.connection = None
+
+    def upsert_many(self, video_files: Iterable[VideoFile], scanned_only: bool = False):
+        # One transaction for the whole batch; scanned_only keeps the IMDB details of files already in the store
+        connection = self.connection()
+        with connection:
+            connection.executemany(UPSERT_SCANNED_VIDEO_FILE if scanned_only else UPSERT_VIDEO_FILE, (video_file_row(video_file) for video_file in video_files))
+
+    def delete_paths(self, file_paths: Iterable[Text]):
+        connection = self.connection()
+        with connection:
+            connection.executemany('DELETE FROM video_files WHERE file_path = ?', ((file_path,) for file_path in file_paths))
+
+    def get(self, file_path: Text) -> Optional[VideoFile]:
+        row = self.connection().execute(f'{SELECT_VIDEO_FILES} WHERE file_path = ?', (file_path,)).fetchone()
+        return row_video_file(row) if row else None
+
+    def find_by_imdb_tt(self, imdb_tt: Text) -> List[VideoFile]:
+        return [row_video_file(row) for row in self.connection().execute(f'{SELECT_VIDEO_FILES} WHERE imdb_tt = ?', (imdb_tt,))]
+
+    def count(self, library_query: LibraryQuery = None, connection: sqlite3.Connection = None) -> int:
+        where_clause, parameters = (library_query or LibraryQuery()).where_clause()
+        return (connection or self.connection()).execute(f'SELECT COUNT(*) FROM video_files{where_clause}', parameters).fetchone()[0]
+
+    def query_page(self, library_query: LibraryQuery = None, offset: int = 0, limit: int = 100, connection: sqlite3.Connection = None) -> List[VideoFile]:
+        # connection is this thread's unless another is given (SqliteLibraryRows reads through its own)
+        library_query = library_query or LibraryQuery()
+        where_clause, parameters = library_query.where_clause()
+        cursor = (connection or self.connection()).execute(f'{SELECT_VIDEO_FILES}{where_clause}{library_query.order_clause()} LIMIT ? OFFSET ?', parameters + [limit, offset])
+        return [row_video_file(row) for row in cursor]
+
+    def read_id_range(self, min_id: int, max_id: int, connection: sqlite3.Connection = None) -> Dict[int, VideoFile]:
+        # id -> record for the records with ids from min_id to max_id, by a primary key range scan
+        cursor = (connection or self.connection()).execute(f'SELECT id, {", ".join(VIDEO_FILE_COLUMNS)} FROM video_files WHERE id BETWEEN ? AND ?', (min_id, max_id))
+        return {row[0]: row_video_file(row[1:]) for row in cursor}
+
+    def open_rows(self) -> 'SqliteLibraryRows':
+        # Never loaded: a view reads the pages it shows straight from the database
+        return SqliteLibraryRows(self)
+
+    def iter_batches(self, batch_size: int = 5000, first_batch_size: int = 200, load_progress: LoadProgress = None) -> Iterator[List[VideoFile]]:
+        # Every record in insertion order, paged by id so no cursor is held open between batches
+        load_progress = load_progress or LoadProgress()
+        load_progress.total = self.count()
+        last_id = -1
+        current_batch_size = first_batch_size
+        while True:
+            rows = self.connection().execute(f'SELECT id, {", ".join(VIDEO_FILE_COLUMNS)} FROM video_files WHERE id > ? ORDER BY id LIMIT ?', (last_id, current_batch_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            load_progress.done += len(rows)
+            yield [row_video_file(row[1:]) for row in rows]
+            current_batch_size = batch_size
+
+    def save_dirty(self, video_files: Iterable[VideoFile], removed_file_paths: Iterable[Text] = ()) -> int:
+        dirty_video_files = [video_file for video_file in video_files if video_file.is_dirty]
+        removed_file_paths = list(removed_file_paths)
+        connection = self.connection()
+        with connection:
+            connection.executemany('DELETE FROM video_files WHERE file_path = ?', ((file_path,) for file_path in removed_file_paths))
+            connection.executemany(UPSERT_VIDEO_FILE, (video_file_row(video_file) for video_file in dirty_video_files))
+        for video_file in dirty_video_files:
+            video_file.is_dirty = False
+        return len(dirty_video_files) + len(removed_file_paths)
+
+    def write_full(self, video_files: Iterable[VideoFile]):
+        connection = self.connection()
+        with connection:
+            connection.execute('DELETE FROM video_files')
+            connection.executemany(UPSERT_VIDEO_FILE, (video_file_row(video_file) for video_file in video_files))
+
+    def import_json(self, json_path: Text, batch_size: int = 5000) -> int:
+        # Streams a JSON array or NDJSON library in, one transaction per batch
+        imported_count = 0
+        for video_files in iter_video_file_batches(json_path, batch_size=batch_size, first_batch_size=batch_size):
+            self.upsert_many(video_files)
+            imported_count += len(video_files)
+        return imported_count
+
+    def export_json(self, json_path: Text):
+        write_library_file(json_path, (video_file_as_dict(video_file) for video_files in self.iter_batches() for video_file in video_files))
+
+
+class SqliteLibraryRows(Sequence[VideoFile]):
+    # The records of a SqliteLibraryStore in the order they were added, as a read-only Sequence for a view: a row is
+    # read with the page of rows around it when the view asks for it (read_id_range(), a primary key range scan
+    # however far down the table it is), and the pages read last are cached. A sorted or searched view shows rows
+    # from all over the table, so the pages are small and many are kept. Iterating (to sort or search every record)
+    # reads the table in batches by id instead. Opening reads just the ids, 8 bytes a record.
+    #
+    # Reads go through a connection of its own, each in a transaction of its own, so the store is never held at one
+    # snapshot and WAL checkpoints can go on while a view stays open. The rows are the records that were in the
+    # store when it was opened: a record changed since reads as it is now, a record added since shows up at the next
+    # load, and a record removed since reads as an empty VideoFile. Front ends show it like a LibrarySnapshot,
+    # copying it into a list when they first edit it. It may be read from any thread (a search index is built on a
+    # worker thread), one query at a time.
+
+    def __init__(self, library_store: SqliteLibraryStore, page_size: int = ROWS_PAGE_SIZE, cached_page_count: int = ROWS_CACHED_PAGE_COUNT):
+        self.library_store = library_store
+        self.page_size = page_size
+        self.cached_page_count = cached_page_count
+        self.pages: collections.OrderedDict = collections.OrderedDict()  # page number -> VideoFiles, least recently read first
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(library_store.library_path, timeout=30.0, check_same_thread=False)
+        try:
+            self.ids = array.array('q', itertools.chain.from_iterable(self.connection.execute('SELECT id FROM video_files ORDER BY id').fetchall()))
+        except sqlite3.Error:
+            self.connection.close()
+            raise
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+            self.pages.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.ids)))]
+        if index < 0:
+            index += len(self.ids)
+        if not 0 <= index < len(self.ids):
+            raise IndexError('library row index out of range')
+
+        page_number, row_in_page = divmod(index, self.page_size)
+        with self.lock:
+            page = self.pages.get(page_number)
+            if page is None:
+                first_row = page_number * self.page_size
+                page = self.pages[page_number] = self.read_rows(first_row, min(first_row + self.page_size, len(self.ids)))
+                if len(self.pages) > self.cached_page_count:
+                    self.pages.popitem(last=False)
+            else:
+                self.pages.move_to_end(page_number)
+        return page[row_in_page]
+
+    def __iter__(self) -> Iterator[VideoFile]:
+        for first_row in range(0, len(self.ids), ROWS_ITER_BATCH_SIZE):
+            with self.lock:
+                video_files = self.read_rows(first_row, min(first_row + ROWS_ITER_BATCH_SIZE, len(self.ids)))
+            yield from video_files
+
+    def read_rows(self, first_row: int, end_row: int) -> List[VideoFile]:
+        # Rows first_row up to end_row as the store has them now, with the lock held
+        row_ids = self.ids[first_row:end_row]
+        video_files_by_id = self.library_store.read_id_range(row_ids[0], row_ids[-1], connection=self.connection)
+        return [video_files_by_id.get(row_id) or VideoFile() for row_id in row_ids]
+
+
+class SqliteScanWriter:
+    # A ScanEngine result_sink that upserts scan results into a SqliteLibraryStore in transactions of batch_size
+    # records, keeping IMDB details of files the store already has. With prune_folder_path, finish() also deletes
+    # the records under that folder the scan didn't find; the paths seen are kept in a temp table, not in memory.
+    # Use it from one thread only (the scanning thread), and call finish() once the scan has completed.
+
+    def __init__(self, library_store: SqliteLibraryStore, batch_size: int = 5000, prune_folder_path: Text = None):
+        self.library_store = library_store
+        self.batch_size = batch_size
+        self.prune_folder_path = prune_folder_path
+        self.pending_video_files: List[VideoFile] = list()
+        if prune_folder_path is not None:
+            self.library_store.connection().execute('CREATE TEMP TABLE IF NOT EXISTS scan_seen_paths (file_path TEXT PRIMARY KEY) WITHOUT ROWID')
+            self.library_store.connection().execute('DELETE FROM scan_seen_paths')
+
+    def write_video_files(self, video_files: Sequence[VideoFile]):
+        self.pending_video_files.extend(video_files)
+        if len(self.pending_video_files) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending_video_files:
+            return
+        connection = self.library_store.connection()
+        with connection:
+            connection.executemany(UPSERT_SCANNED_VIDEO_FILE, (video_file_row(video_file) for video_file in self.pending_video_files))
+            if self.prune_folder_path is not None:
+                connection.executemany('INSERT OR IGNORE INTO scan_seen_paths (file_path) VALUES (?)', ((video_file.file_path,) for video_file in self.pending_video_files))
+        self.pending_video_files = list()
+
+    def finish(self) -> int:
+        # Returns the number of records pruned
+        self.flush()
+        if self.prune_folder_path is None:
+            return 0
+
+        folder_prefix = os.path.join(self.prune_folder_path, '')
+        connection = self.library_store.connection()
+        with connection:
+            cursor = connection.execute('DELETE FROM video_files WHERE substr(file_path, 1, ?) = ? AND file_path NOT IN (SELECT file_path FROM scan_seen_paths)', (len(folder_prefix), folder_prefix))
+            connection.execute('DELETE FROM scan_seen_paths')
+        return cursor.rowcount
@@ -0,0 +1,133 @@
+from typing import Dict, Iterable, Iterator, List, Text, Tuple
+import dataclasses
+import json
+import os
+import re
+import sys
+
+
+WHITESPACE_PATTERN = re.compile(r'\s*')
+ARRAY_SEPARATOR_PATTERN = re.compile(r'[\s,]*')
+
+
+# Libraries repeat the same genre lists over and over; every VideoFile with the same genres shares one tuple
+_interned_genres: Dict[Tuple[Text, ...], Tuple[Text, ...]] = dict()
+
+
+def intern_text(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def intern_genres(genres: Iterable[Text]) -> Tuple[Text, ...]:
+    genres = tuple(genres)
+    interned_genres = _interned_genres.get(genres)
+    if interned_genres is None:
+        interned_genres = _interned_genres.setdefault(genres, tuple(intern_text(genre) for genre in genres))
+    return interned_genres
+
+
+@dataclasses.dataclass(slots=True)
+class VideoFile:
+    # One of these per file in the library, so it is kept small: __slots__ instead of a per-instance __dict__, and
+    # the values that repeat across a library (years, ratings, genres) interned so records share one copy of each.
+    # Genres are an immutable tuple; assign a new sequence rather than mutating it.
+    file_path: Text = ''
+    scrubbed_file_name: Text = ''
+    scrubbed_file_year: Text = ''
+    imdb_tt: Text = ''
+    imdb_name: Text = ''
+    imdb_year: Text = ''
+    imdb_rating: Text = ''
+    imdb_genres: Tuple[Text, ...] = None
+    imdb_plot: Text = None
+    is_dirty: bool = False
+
+    def __post_init__(self):
+        self.scrubbed_file_year = intern_text(self.scrubbed_file_year)
+        self.imdb_year = intern_text(self.imdb_year)
+        self.imdb_rating = intern_text(self.imdb_rating)
+        if self.imdb_genres is not None:
+            self.imdb_genres = intern_genres(self.imdb_genres)
+
+
+@dataclasses.dataclass
+class LoadProgress:
+    # How far a library load has got, counted in whatever its source knows the total of up front: characters of a
+    # JSON file, rows of a snapshot or a database. Updated by the loading thread, read by the UI.
+    done: int = 0
+    total: int = 0
+
+    @property
+    def fraction(self) -> float:
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+
+VIDEO_FILE_FIELD_NAMES = tuple(field.name for field in dataclasses.fields(VideoFile))
+
+
+def video_file_as_dict(video_file: VideoFile) -> dict:
+    # dataclasses.asdict deep-copies every value, which dominates the cost of serializing a large library
+    return {field_name: getattr(video_file, field_name) for field_name in VIDEO_FILE_FIELD_NAMES}
+
+
+def iter_video_file_dicts(video_file_path: str, read_size: int = 1 << 20, load_progress: LoadProgress = None) -> Iterator[dict]:
+    # Parses a library file one record at a time, holding only about read_size characters of it in memory. Accepts the
+    # JSON array written by the front ends and the NDJSON written by "python -m mmm scan".
+    decoder = json.JSONDecoder()
+    load_progress = load_progress or LoadProgress()
+
+    with open(video_file_path, encoding='utf8') as f:
+        # Progress counts characters against the size in bytes: exact for ASCII, and never past the end otherwise
+        load_progress.total = os.fstat(f.fileno()).st_size
+        buffer = f.read(read_size)
+        load_progress.done = len(buffer)
+        position = WHITESPACE_PATTERN.match(buffer).end()
+        if buffer.startswith('[', position):
+            position += 1
+            separator_pattern = ARRAY_SEPARATOR_PATTERN
+        else:
+            separator_pattern = WHITESPACE_PATTERN
+
+        at_end_of_file = len(buffer) < read_size
+        while True:
+            position = separator_pattern.match(buffer, position).end()
+            if buffer.startswith(']', position) or (position == len(buffer) and at_end_of_file):
+                return
+
+            if position < len(buffer):
+                try:
+                    video_file_dict, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if at_end_of_file:
+                        raise
+                else:
+                    yield video_file_dict
+                    continue
+
+            # The next record runs past the end of the buffer: drop what has been parsed and read more
+            more_text = f.read(read_size)
+            load_progress.done += len(more_text)
+            at_end_of_file = len(more_text) < read_size
+            buffer = buffer[position:] + more_text
+            position = 0
+
+
+def iter_video_file_batches(video_file_path: str, batch_size: int = 5000, first_batch_size: int = 200, load_progress: LoadProgress = None) -> Iterator[List[VideoFile]]:
+    # The first batch is small so a view can show its first screenful straight away
+    video_files = list()
+    current_batch_size = first_batch_size
+    for video_file_dict in iter_video_file_dicts(video_file_path, load_progress=load_progress):
+        video_files.append(VideoFile(**video_file_dict))
+        if len(video_files) >= current_batch_size:
+            yield video_files
+            video_files = list()
+            current_batch_size = batch_size
+    if video_files:
+        yield video_files
+
+
+def load_video_file_data(video_file_path: str) -> List[VideoFile]:
+    video_files_data = list()
+    for video_files in iter_video_file_batches(video_file_path):
+        video_files_data.extend(video_files)
+    return video_files_data
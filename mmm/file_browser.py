@@ -1,23 +1,20 @@
-from typing import List
+from typing import Callable, List, Sequence
+import threading
+import time
 
 import gi
 gi.require_version('Gtk', '4.0')
 
-from gi.repository import Gtk, Gio, GObject, GLib
+from gi.repository import Gtk, Gio, GLib
 
-from mmm.file_scanner import VideoFile, load_video_file_data
-
-
-class FileBrowserListModelDataItem(GObject.Object):
-    # __gtype_name__ = "MyListModelDataItem"
-
-    def __init__(self, title, year, rating, imdb_tt):
-        super().__init__()
-
-        self.title = title
-        self.year = year
-        self.rating = rating
-        self.imdb_tt = imdb_tt
+from mmm.core.library_catalog import CatalogShard, LibraryCatalog, is_catalog_manifest, normalize_root_path
+from mmm.core.library_loader import LibraryLoader
+from mmm.core.library_reconcile import apply_library_diff, reconcile_scan
+from mmm.core.library_watch import LibraryChange, LibraryEdit, LibraryWatch, apply_library_change, is_same_or_under
+from mmm.core.scan_engine import ScanEngine
+from mmm.core.video_file import VideoFile
+from mmm.core.scan_stream import VideoFileBatchQueue
+from mmm.video_file_list_model import FIELD_SORT_TEXTS, VideoFileListModel
 
 
 class FileBrowserItemFactory(Gtk.SignalListItemFactory):
@@ -43,27 +40,71 @@ class FileBrowserPanel(Gtk.Box):
     def __init__(self, *args, **kwargs):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=10, vexpand=True, hexpand=True, margin_top=10, margin_bottom=10, margin_start=10, margin_end=10, *args, **kwargs)
 
-        self.video_file_data: List[VideoFile] = None
+        self.video_file_data: Sequence[VideoFile] = None  # a list, or the read-only snapshot of a library as loaded
+        self.library_path: str = None  # the library file video_file_data was loaded from, if it was loaded
+        self.scan_result_queue: VideoFileBatchQueue = None
+        self.scan_result_timer_id = None
+        self.is_merging_scan = False
+        self.library_watch: LibraryWatch = None
+        self.library_loader: LibraryLoader = None
+        self.library_load_queue: VideoFileBatchQueue = None
+        self.library_load_timer_id = None
+        self.loading_video_file_data: List[VideoFile] = None
+        self.library_catalog: LibraryCatalog = None
+        self.catalog_shards: List[CatalogShard] = list()
+        self.catalog_shard: CatalogShard = None
+        self.loading_catalog_shard: CatalogShard = None
 
-        # self.list_store_model = Gio.ListStore(item_type=MyListModelDataItem)
-        self.list_store_model = Gio.ListStore()
+        # Rows are read from video_file_data as the view asks for them; there is no per-row copy to build or keep
+        self.list_model = VideoFileListModel()
+        self.list_model.connect("notify::is-indexing", self.on_search_indexing)
 
         # ColumnView with custom columns
-        self.single_selection_list_store = Gtk.SingleSelection(model=self.list_store_model)
+        self.single_selection_list_store = Gtk.SingleSelection(model=self.list_model)
         self.single_selection_list_store.connect("notify::selected", self.on_item_list_selected)
         self.column_view = Gtk.ColumnView(model=self.single_selection_list_store, hexpand=True, vexpand=True)
         self.column_view.set_show_row_separators(True)
-        self.column_view.append_column(Gtk.ColumnViewColumn(title='TITLE', factory=FileBrowserItemFactory('title'), expand=True))
-        self.column_view.append_column(Gtk.ColumnViewColumn(title='YEAR', factory=FileBrowserItemFactory('year'), expand=True))
-        self.column_view.append_column(Gtk.ColumnViewColumn(title='RATING', factory=FileBrowserItemFactory('rating'), expand=True))
-        self.column_view.append_column(Gtk.ColumnViewColumn(title='IMDB TT', factory=FileBrowserItemFactory('imdb_tt'), expand=True))
+
+        # Each column has a sorter only so its header can be clicked: the sorting itself is done by the list model
+        # with cached sort keys (VideoFileListModel.sort_by), not by a Gtk.SortListModel calling back into Python for
+        # every comparison. Sort keys are kept per column across sorts and libraries.
+        self.column_field_names = dict()
+        self.sort_key_caches = {field_name: dict() for field_name in FIELD_SORT_TEXTS}
+        for title, field_name in (('TITLE', 'title'), ('YEAR', 'year'), ('RATING', 'rating'), ('IMDB TT', 'imdb_tt')):
+            column = Gtk.ColumnViewColumn(title=title, factory=FileBrowserItemFactory(field_name), expand=True, sorter=Gtk.CustomSorter())
+            self.column_field_names[column] = field_name
+            self.column_view.append_column(column)
+        self.column_view.get_sorter().connect("changed", self.on_sort_changed)
 
         self.column_view_scrolled_window = Gtk.ScrolledWindow.new()
         self.column_view_scrolled_window.set_child(self.column_view)
 
+        # Above the list, a search box that filters it as you type (VideoFileListModel.search)
+        self.search_entry = Gtk.SearchEntry(placeholder_text='Search titles and file paths', hexpand=True)
+        self.search_entry.connect("search-changed", self.on_search_changed)
+        self.file_list_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=10, hexpand=True, vexpand=True)
+        self.file_list_box.append(self.search_entry)
+        self.file_list_box.append(self.column_view_scrolled_window)
+
         self.scrolled_window_button = Gtk.Button(label='Load', hexpand=True, vexpand=False)
         self.scrolled_window_button.connect("clicked", self.on_load_video_json)
 
+        # Shown only while a library loads; the library on screen stays usable until the new one replaces it
+        self.load_progress_bar = Gtk.ProgressBar(show_text=True, hexpand=True, valign=Gtk.Align.CENTER)
+        self.load_cancel_button = Gtk.Button(label='Cancel', hexpand=False, vexpand=False)
+        self.load_cancel_button.connect("clicked", self.on_cancel_loading)
+        self.load_progress_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10, hexpand=True, vexpand=False, visible=False)
+        self.load_progress_box.append(self.load_progress_bar)
+        self.load_progress_box.append(self.load_cancel_button)
+
+        # Shown only while a catalog is open: picks the shard (scan root) to browse; the others stay on disk
+        self.catalog_root_list = Gtk.StringList()
+        self.catalog_dropdown = Gtk.DropDown(model=self.catalog_root_list, hexpand=True)
+        self.catalog_dropdown.connect("notify::selected", self.on_catalog_shard_selected)
+        self.catalog_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10, hexpand=True, vexpand=False, visible=False)
+        self.catalog_box.append(Gtk.Label(label='Root:'))
+        self.catalog_box.append(self.catalog_dropdown)
+
         self.details_poster = Gtk.Picture(file=Gio.File.new_for_path('poster.png'), halign=Gtk.Align.START, valign=Gtk.Align.START)
 
         self.details_vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, vexpand=True, hexpand=True, margin_top=10, margin_bottom=10, margin_start=10, margin_end=10)
@@ -79,10 +120,12 @@ class FileBrowserPanel(Gtk.Box):
         self.details_hbox.append(self.details_vbox)
 
         self.file_browser_paned = Gtk.Paned(orientation=Gtk.Orientation.HORIZONTAL, hexpand=True, vexpand=True, wide_handle=True)
-        self.file_browser_paned.set_start_child(self.column_view_scrolled_window)
+        self.file_browser_paned.set_start_child(self.file_list_box)
         self.file_browser_paned.set_end_child(self.details_hbox)
 
+        self.append(self.catalog_box)
         self.append(self.file_browser_paned)
+        self.append(self.load_progress_box)
         self.append(self.scrolled_window_button)
 
     # def file_added_handler(self, instance, filename):
@@ -94,26 +137,278 @@ class FileBrowserPanel(Gtk.Box):
                 gio_file: Gio.File = source_object.open_finish(result)
                 if gio_file is not None:
                     print(f"File path is {gio_file.get_path()}")
-                    self.video_file_data = load_video_file_data(gio_file.get_path())
-                    if self.video_file_data:
-                        self.list_store_model.remove_all()
-                        for video_file in self.video_file_data:
-                            file_name = video_file.imdb_name or video_file.scrubbed_file_name
-                            file_year = video_file.imdb_year or video_file.scrubbed_file_year
-                            imdb_rating = video_file.imdb_rating
-                            imdb_tt = video_file.imdb_tt
-                            self.list_store_model.append(FileBrowserListModelDataItem(file_name, file_year, imdb_rating, imdb_tt))
+                    if is_catalog_manifest(gio_file.get_path()):
+                        self.open_catalog(gio_file.get_path())
+                    else:
+                        self.load_library(gio_file.get_path())
             except GLib.Error as error:
                 print(f"Error opening file: {error.message}")
 
         open_dialog = Gtk.FileDialog(title="Select a File")
         open_dialog.open(None, None, open_dialog_open_callback, None)
 
+    def open_catalog(self, catalog_path: str):
+        # Only the manifest is read here; choosing a root in the dropdown loads its shard like any other library
+        try:
+            library_catalog = LibraryCatalog.load(catalog_path)
+        except (OSError, ValueError) as e:
+            print(f'FileBrowserPanel: Unable to open catalog "{catalog_path}": {e}')
+            return
+
+        # Probing is bounded: a root that doesn't answer in time is shown as offline, and can still be browsed
+        online_roots = library_catalog.online_roots(timeout=0.5)
+        shard_labels = list()
+        for shard in library_catalog.shards.values():
+            last_scan = time.strftime('%Y-%m-%d %H:%M', time.localtime(shard.last_scan_time)) if shard.last_scan_time else 'never'
+            shard_labels.append(f'{shard.root_path}  ({shard.video_file_count} videos, scanned {last_scan}){"" if online_roots[shard.root_path] else "  [offline]"}')
+
+        self.library_catalog = library_catalog
+        self.catalog_shards = list(library_catalog.shards.values())
+        self.catalog_shard = None
+        self.catalog_dropdown.set_selected(Gtk.INVALID_LIST_POSITION)
+        self.catalog_root_list.splice(0, self.catalog_root_list.get_n_items(), shard_labels)
+        self.catalog_box.set_visible(True)
+        if self.catalog_shards:
+            self.catalog_dropdown.set_selected(0)
+
+    def on_catalog_shard_selected(self, _dropdown, _g_param_spec):
+        position = self.catalog_dropdown.get_selected()
+        if self.library_catalog is None or position >= len(self.catalog_shards):
+            return
+        shard = self.catalog_shards[position]
+        if shard is not self.catalog_shard:
+            self.load_library(self.library_catalog.shard_path(shard), shard)
+
+    def close_catalog(self):
+        self.library_catalog = None
+        self.catalog_shards = list()
+        self.catalog_shard = None
+        self.catalog_box.set_visible(False)
+
+    def load_library(self, library_path: str, catalog_shard: CatalogShard = None):
+        # Parse on a worker thread into a list that isn't shown yet, a bounded chunk per tick of the main loop, then
+        # swap a model over it in with one set_model(); cancelling just drops it
+        self.cancel_loading()
+        self.loading_catalog_shard = catalog_shard
+
+        self.library_load_queue = VideoFileBatchQueue()
+        self.library_loader = LibraryLoader(library_path, batch_sink=self.library_load_queue.put_many)
+        self.loading_video_file_data = list()
+        threading.Thread(target=self.run_library_loader, args=(self.library_loader, self.library_load_queue), daemon=True).start()
+
+        self.load_progress_bar.set_fraction(0.0)
+        self.load_progress_bar.set_text(f'Loading "{library_path}"...')
+        self.load_progress_box.set_visible(True)
+        self.library_load_timer_id = GLib.timeout_add(100, self.on_library_load_timer)
+
+    @staticmethod
+    def run_library_loader(library_loader: LibraryLoader, result_queue: VideoFileBatchQueue):
+        try:
+            library_loader.load()
+        finally:
+            result_queue.close()
+
+    def on_library_load_timer(self):
+        library_loader = self.library_loader
+        video_files, is_finished = self.library_load_queue.get_batches(max_items=5000)
+
+        if video_files:
+            self.loading_video_file_data.extend(video_files)
+            self.load_progress_bar.set_fraction(library_loader.load_progress.fraction)
+            self.load_progress_bar.set_text(f'Loading "{library_loader.library_path}": {len(self.loading_video_file_data)} videos')
+
+        if not is_finished:
+            return GLib.SOURCE_CONTINUE
+
+        self.library_load_timer_id = None
+        if library_loader.error is None:
+            self.show_loaded_library()
+        else:
+            print(f'FileBrowserPanel: Keeping the current library; "{library_loader.library_path}" failed to load: {library_loader.error}')
+        self.finish_loading()
+        return GLib.SOURCE_REMOVE
+
+    def show_loaded_library(self):
+        # Whatever the view showed before (a library, scan results still arriving) is replaced wholesale
+        if self.scan_result_timer_id is not None:
+            GLib.source_remove(self.scan_result_timer_id)
+            self.scan_result_timer_id = None
+            self.scan_result_queue = None
+        self.stop_watching()
+
+        # An up-to-date snapshot is shown as it is, without being loaded (see LibraryLoader)
+        loaded_video_file_data = self.library_loader.video_file_rows if self.library_loader.video_file_rows is not None else self.loading_video_file_data
+        if self.video_file_data is not None and self.library_loader.library_path == self.library_path:
+            # The library on screen loaded again: update just the rows that differ, keeping scroll position and selection
+            library_edit = apply_library_diff(self.editable_video_file_data(), loaded_video_file_data)
+            self.mirror_library_edit(library_edit)
+        else:
+            self.video_file_data = loaded_video_file_data
+            self.list_model = VideoFileListModel(self.video_file_data)
+            self.list_model.connect("notify::is-indexing", self.on_search_indexing)
+            self.sort_list_model()
+            self.single_selection_list_store.set_model(self.list_model)
+            self.on_search_indexing(self.list_model)
+        self.library_path = self.library_loader.library_path
+
+        if self.loading_catalog_shard is None:
+            self.close_catalog()
+        self.catalog_shard = self.loading_catalog_shard
+
+    def editable_video_file_data(self) -> List[VideoFile]:
+        # A library shown straight from its snapshot can't be edited; the first edit copies it into a list
+        if not isinstance(self.video_file_data, list):
+            self.video_file_data = list(self.video_file_data)
+            self.list_model.replace_video_files(self.video_file_data)
+        return self.video_file_data
+
+    def on_cancel_loading(self, _widget):
+        self.cancel_loading()
+
+    def cancel_loading(self):
+        if self.library_loader is None:
+            return
+        self.library_loader.cancel()
+        if self.library_load_timer_id is not None:
+            GLib.source_remove(self.library_load_timer_id)
+        self.finish_loading()
+
+    def finish_loading(self):
+        self.library_loader = None
+        self.library_load_queue = None
+        self.library_load_timer_id = None
+        self.loading_video_file_data = None
+        self.loading_catalog_shard = None
+        self.load_progress_box.set_visible(False)
+
+    def consume_video_file_batches(self, result_queue: VideoFileBatchQueue):
+        # Show video files as a scan produces them: poll the queue from the main loop and append each chunk of rows
+        # with a single items-changed, so the view is never flooded with one items-changed per row. If a library is already
+        # showing, it stays on screen and the completed scan is merged into it instead (merge_scan_results), so its
+        # IMDB details survive the rescan.
+        if self.scan_result_timer_id is not None:
+            GLib.source_remove(self.scan_result_timer_id)
+        self.cancel_loading()
+        self.stop_watching()
+
+        self.scan_result_queue = result_queue
+        self.is_merging_scan = bool(self.video_file_data)
+        if not self.is_merging_scan:
+            self.video_file_data = list()
+            self.library_path = None
+            self.list_model.set_video_files(self.video_file_data)
+        self.scan_result_timer_id = GLib.timeout_add(100, self.on_video_file_batches_timer)
+
+    def on_video_file_batches_timer(self):
+        video_files, is_finished = self.scan_result_queue.get_batches(max_items=5000)
+
+        if video_files and not self.is_merging_scan:
+            self.video_file_data.extend(video_files)
+            self.list_model.rows_appended()
+
+        if is_finished:
+            self.scan_result_queue = None
+            self.scan_result_timer_id = None
+            return GLib.SOURCE_REMOVE
+
+        return GLib.SOURCE_CONTINUE
+
+    def merge_scan_results(self, scan_engine: ScanEngine):
+        # Called once a scan completes. Streamed results are already on screen; otherwise reconcile the library that
+        # is showing with everything the scan found, keeping its metadata, and mirror just what changed. With a
+        # catalog open, a folder outside the shard on screen goes into its own shard instead, on a worker thread.
+        if not self.is_merging_scan or scan_engine.folder_data is None:
+            return
+        if self.scan_result_timer_id is not None:
+            GLib.source_remove(self.scan_result_timer_id)
+        self.scan_result_queue = None
+        self.scan_result_timer_id = None
+        self.is_merging_scan = False
+
+        if self.library_catalog is not None and (self.catalog_shard is None or not is_same_or_under(normalize_root_path(scan_engine.folder_path), self.catalog_shard.root_path)):
+            threading.Thread(target=self.library_catalog.merge_scan, args=(scan_engine.folder_path, scan_engine.folder_data, scan_engine.recorded_file_identity), daemon=True).start()
+            return
+
+        change_set = reconcile_scan(self.editable_video_file_data(), scan_engine.folder_data, scan_engine.folder_path, recorded_identity=scan_engine.recorded_file_identity)
+        print(f'FileBrowserPanel: Merged scan of "{scan_engine.folder_path}": {change_set.summary()}')
+        self.mirror_library_edit(change_set.library_edit())
+        if self.catalog_shard is not None:
+            self.library_catalog.record_scan(self.catalog_shard.root_path, len(self.video_file_data))
+            try:
+                self.library_catalog.save()
+            except (OSError, ValueError) as e:
+                print(f'FileBrowserPanel: Unable to update catalog "{self.library_catalog.manifest_path}": {e}')
+
+    def watch_folder(self, folder_path: str):
+        # Keep the browser in step with the folder after a scan: changes arrive debounced from the watch thread
+        self.stop_watching()
+        self.library_watch = LibraryWatch(folder_path, change_sink=lambda library_change: GLib.idle_add(self.on_library_change, library_change))
+        self.library_watch.start()
+
+    def stop_watching(self):
+        if self.library_watch is not None:
+            self.library_watch.stop_watching()
+            self.library_watch = None
+
+    def on_library_change(self, library_change: LibraryChange):
+        if self.video_file_data is None:
+            return GLib.SOURCE_REMOVE
+        if self.scan_result_queue is not None:
+            # Scan results are still being added to the list; apply this once they are all in
+            GLib.timeout_add(100, self.on_library_change, library_change)
+            return GLib.SOURCE_REMOVE
+
+        library_edit = apply_library_change(self.editable_video_file_data(), library_change)
+        self.mirror_library_edit(library_edit)
+        return GLib.SOURCE_REMOVE
+
+    def mirror_library_edit(self, library_edit: LibraryEdit):
+        # The list model already reads the edited list; it just has to tell the view which rows changed
+        self.list_model.apply_library_edit(library_edit)
+
+    def on_sort_changed(self, _sorter, _change):
+        self.keep_selection(self.sort_list_model)
+
+    def on_search_changed(self, search_entry: Gtk.SearchEntry):
+        self.keep_selection(lambda: self.list_model.search(search_entry.get_text()))
+
+    def on_search_indexing(self, list_model: VideoFileListModel, _g_param_spec=None):
+        # The search box can't be used until the library has been indexed for search; once it has, a model made
+        # for a newly loaded library is searched for what the box already says
+        if list_model is not self.list_model:
+            return
+        self.search_entry.set_sensitive(not list_model.props.is_indexing)
+        self.search_entry.set_placeholder_text('Indexing…' if list_model.props.is_indexing else 'Search titles and file paths')
+        if not list_model.props.is_indexing and list_model.search_query != self.search_entry.get_text():
+            self.on_search_changed(self.search_entry)
+
+    def keep_selection(self, change: Callable[[], None]):
+        # Keep the selected record selected at whatever position the change moves it to, if it is still shown
+        position = self.single_selection_list_store.get_selected()
+        selected_list_position = self.list_model.list_position(position) if position < self.list_model.get_n_items() else None
+        change()
+        if selected_list_position is not None:
+            model_position = self.list_model.model_position(selected_list_position)
+            self.single_selection_list_store.set_selected(model_position if model_position is not None else Gtk.INVALID_LIST_POSITION)
+
+    def sort_list_model(self):
+        # Sort the list model the way the column headers say
+        column_view_sorter = self.column_view.get_sorter()
+        column = column_view_sorter.get_primary_sort_column()
+        if column is None:
+            self.list_model.sort_by(None)
+            return
+        field_name = self.column_field_names[column]
+        descending = column_view_sorter.get_primary_sort_order() == Gtk.SortType.DESCENDING
+        self.list_model.sort_by(FIELD_SORT_TEXTS[field_name], descending=descending, key_cache=self.sort_key_caches[field_name])
+
     def on_item_list_selected(self, obj, g_param_spec):
         # selected_item = self.single_selection_list_store.props.selected_item
 
         position = self.single_selection_list_store.get_selected()
-        selected_item = self.video_file_data[position]
+        if position >= self.list_model.get_n_items():
+            return
+        selected_item = self.video_file_data[self.list_model.list_position(position)]
         self.details_title_label.set_label(f'Title: {selected_item.imdb_name}')
         self.details_year_label.set_label(f'Year: {selected_item.imdb_year}')
         self.details_rating_label.set_label(f'Rating: {selected_item.imdb_rating}')
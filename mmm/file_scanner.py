@@ -1,126 +1,63 @@
 from threading import Thread
-from typing import List, Text, Tuple, Callable
-import dataclasses
-import json
-import os
-import os.path
-import re
-import sys
-import threading
-import time
+from typing import List, Text, Callable
 
 import gi
 
 gi.require_version('Gtk', '4.0')
-from gi.repository import Gtk, Gio, GObject, Gdk, GLib
+from gi.repository import Gtk, Gio, GObject, Gdk, GLib, Pango
 
-
-@dataclasses.dataclass
-class VideoFile:
-    file_path: Text = ''
-    scrubbed_file_name: Text = ''
-    scrubbed_file_year: Text = ''
-    imdb_tt: Text = ''
-    imdb_name: Text = ''
-    imdb_year: Text = ''
-    imdb_rating: Text = ''
-    imdb_genres: List[Text] = None
-    imdb_plot: Text = None
-    is_dirty: bool = False
-
-
-def load_video_file_data(video_file_path: str) -> List[VideoFile]:
-    with open(video_file_path, encoding='utf8') as f:
-        video_files_json = json.load(f)
-
-    video_files_data = list()
-    for video_file_dict in video_files_json:
-        video_file = VideoFile(**video_file_dict)
-        video_files_data.append(video_file)
-
-    return video_files_data
+from mmm.core.scan_cache import ScanDiff
+from mmm.core.scan_engine import ScanEngine
+from mmm.core.scan_progress import ScanProgress
+from mmm.core.scan_stream import VideoFileBatchQueue
+from mmm.core.video_file import VideoFile
 
 
 class FolderScanWorker(Thread):
-    def __init__(self, folder_path: Text, ignore_extensions: Text = None, filename_metadata_tokens: Text = None, progress_callback: Callable = None, complete_callback: Callable = None):
+    # Runs a ScanEngine on a background thread and delivers its progress and completion on the GLib main loop.
+    # Keyword arguments not used here are ScanEngine options (ignore_extensions, max_workers, use_process_pool, ...).
+
+    def __init__(self, folder_path: Text, progress_callback: Callable = None, complete_callback: Callable = None, result_queue: VideoFileBatchQueue = None, **scan_options):
         super().__init__(daemon=True)
-        self.folder_data = None
-        self.ignore_extensions = ignore_extensions or 'png,jpg,nfo,srt'
-        self.filename_metadata_tokens = filename_metadata_tokens or '480p,720p,1080p,bluray,hevc,x265,x264,web,webrip,web-dl,repack,proper,extended,remastered,dvdrip,dvd,hdtv,xvid,hdrip,brrip,dvdscr,pdtv'
         self.folder_path = folder_path
-        self.keep_scanning = True
         self.progress_callback = progress_callback
         self.complete_callback = complete_callback
+        self.result_queue = result_queue
+        self.scan_engine = ScanEngine(folder_path, progress_sink=self.emit_progress, result_sink=result_queue.put_many if result_queue else None, **scan_options)
 
-    def stop_scanning(self):
-        self.keep_scanning = False
-
-    @staticmethod
-    def scrub_video_file_name(file_name: Text, filename_metadata_tokens: Text) -> Tuple[Text, Text]:
-        year = ''
+    @property
+    def folder_data(self) -> List[VideoFile]:
+        return self.scan_engine.folder_data
 
-        match = re.match(r'((.*)\((\d{4})\))', file_name)
-        if match:
-            file_name = match.group(2)
-            year = match.group(3)
-            scrubbed_file_name_list = file_name.replace('.', ' ').split()
+    @property
+    def scan_diff(self) -> ScanDiff:
+        return self.scan_engine.scan_diff
 
-        else:
-            metadata_token_list = [token.lower().strip() for token in filename_metadata_tokens.split(',')]
-            file_name_parts = file_name.replace('.', ' ').split()
-            scrubbed_file_name_list = list()
+    def stop_scanning(self):
+        self.scan_engine.stop_scanning()
 
-            for file_name_part in file_name_parts:
-                file_name_part = file_name_part.lower()
+    def pause_scanning(self):
+        self.scan_engine.pause_scanning()
 
-                if file_name_part in metadata_token_list:
-                    break
-                scrubbed_file_name_list.append(file_name_part)
+    def resume_scanning(self):
+        self.scan_engine.resume_scanning()
 
-            if scrubbed_file_name_list:
-                match = re.match(r'\(?(\d{4})\)?', scrubbed_file_name_list[-1])
-                if match:
-                    year = match.group(1)
-                    del scrubbed_file_name_list[-1]
+    @property
+    def is_paused(self) -> bool:
+        return self.scan_engine.is_paused
 
-        scrubbed_file_name = ' '.join(scrubbed_file_name_list).strip()
-        scrubbed_file_name = re.sub(' +', ' ', scrubbed_file_name)
-        return scrubbed_file_name, year
+    def emit_progress(self, progress: ScanProgress):
+        if self.progress_callback:
+            GLib.idle_add(self.progress_callback, progress)
 
     def run(self):
-        print(f'FolderScanWorker: Begin processing directory "{self.folder_path}"')
-
-        ignore_extensions_list = [ext.lower().strip() for ext in self.ignore_extensions.split(',')]
-
-        self.folder_data = list()
-
-        for dir_path, dirs, files in os.walk(self.folder_path):
-            for filename in files:
-                if self.keep_scanning is False:
-                    print(f'FolderScanWorker: Stopping scanning')
-                    return
-
-                print(f'FolderScanWorker: Processing file "{filename}"')
-                GLib.idle_add(self.progress_callback, filename)
-                time.sleep(1.0)
-
-                file_path = os.path.join(dir_path, filename)
-                filename_parts = os.path.splitext(filename)
-                filename_no_extension = filename_parts[0]
-                filename_extension = filename_parts[1]
-                if filename_extension.startswith('.'):
-                    filename_extension = filename_extension[1:]
+        try:
+            completed = self.scan_engine.run()
+        finally:
+            if self.result_queue:
+                self.result_queue.close()
 
-                if filename_extension.lower() in ignore_extensions_list:
-                    continue
-
-                scrubbed_video_file_name, year = self.scrub_video_file_name(filename_no_extension, self.filename_metadata_tokens)
-                video_file = VideoFile(file_path=file_path, scrubbed_file_name=scrubbed_video_file_name, scrubbed_file_year=year)
-                self.folder_data.append(video_file)
-
-        print(f'FolderScanWorker: End processing directory "{self.folder_path}"')
-
-        if self.complete_callback:
+        if completed and self.complete_callback:
             print(f'FolderScanWorker: Scheduling self.complete_callback')
             GLib.idle_add(self.complete_callback, self.folder_path)
 
@@ -129,8 +66,8 @@ class FileScannerPanel(Gtk.Box):
     def __init__(self, *args, **kwargs):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=10, vexpand=True, hexpand=True, margin_top=10, margin_bottom=10, margin_start=10, margin_end=10, *args, **kwargs)
 
-        self.file_scanning_thread = FolderScanWorker(folder_path='/home/rrwood/Downloads/ZZ_Movies_Copied_To_External/', progress_callback=self.on_scanning_progress, complete_callback=self.on_scanning_complete)
-        # thread.start()
+        self.folder_path = '/home/rrwood/Downloads/ZZ_Movies_Copied_To_External/'
+        self.file_scanning_thread: FolderScanWorker = None
 
         self.progress_log_text_buffer = Gtk.TextBuffer()
         text_buffer_end_iter = self.progress_log_text_buffer.get_end_iter()
@@ -139,17 +76,22 @@ class FileScannerPanel(Gtk.Box):
         self.progress_log_text_scrolled_window = Gtk.ScrolledWindow(has_frame=True)
         self.progress_log_text_scrolled_window.set_child(self.progress_log_text_view)
 
+        self.progress_status_label = Gtk.Label(label='', halign=Gtk.Align.START, ellipsize=Pango.EllipsizeMode.MIDDLE)
+        self.last_logged_dir = None
+
         self.file_scanning_start_button = Gtk.Button(label='Start', hexpand=True, vexpand=False)
         self.file_scanning_start_button.connect("clicked", self.on_start_scanning)
         self.file_scanning_pause_button = Gtk.Button(label='Pause', hexpand=True, vexpand=False)
-        # self.file_scanning_pause_button.connect("clicked", self.on_show_scroll_info)
+        self.file_scanning_pause_button.connect("clicked", self.on_pause_scanning)
         self.file_scanning_cancel_button = Gtk.Button(label='Cancel', hexpand=True, vexpand=False)
+        self.file_scanning_cancel_button.connect("clicked", self.on_cancel_scanning)
         self.file_scanning_button_box = Gtk.Box(vexpand=False, spacing=10, orientation=Gtk.Orientation.HORIZONTAL)
         self.file_scanning_button_box.append(self.file_scanning_start_button)
         self.file_scanning_button_box.append(self.file_scanning_pause_button)
         self.file_scanning_button_box.append(self.file_scanning_cancel_button)
 
         self.append(self.progress_log_text_scrolled_window)
+        self.append(self.progress_status_label)
         self.append(self.file_scanning_button_box)
 
     @GObject.Signal(arg_types=(str,))
@@ -160,9 +102,38 @@ class FileScannerPanel(Gtk.Box):
     def file_scanning_complete(self, *args):
         pass
 
+    @GObject.Signal(arg_types=(object,))
+    def file_scanning_started(self, *args):
+        pass
+
     def on_start_scanning(self, _widget):
+        if self.file_scanning_thread and self.file_scanning_thread.is_alive():
+            return
+
+        # Threads can't be restarted, so every scan gets a fresh worker and result queue. A cancelled or interrupted
+        # scan of the same folder resumes from its checkpoint, replaying the directories it had already finished.
+        result_queue = VideoFileBatchQueue()
+        self.file_scanning_thread = FolderScanWorker(folder_path=self.folder_path, progress_callback=self.on_scanning_progress, complete_callback=self.on_scanning_complete, result_queue=result_queue, use_checkpoint=True)
+        self.file_scanning_pause_button.set_label('Pause')
+        self.emit('file_scanning_started', result_queue)
         self.file_scanning_thread.start()
-        pass
+
+    def on_pause_scanning(self, _widget):
+        if not (self.file_scanning_thread and self.file_scanning_thread.is_alive()):
+            return
+
+        if self.file_scanning_thread.is_paused:
+            self.file_scanning_thread.resume_scanning()
+            self.file_scanning_pause_button.set_label('Pause')
+        else:
+            # The engine saves a checkpoint when it pauses, so closing the app while paused loses nothing
+            self.file_scanning_thread.pause_scanning()
+            self.file_scanning_pause_button.set_label('Resume')
+
+    def on_cancel_scanning(self, _widget):
+        if self.file_scanning_thread and self.file_scanning_thread.is_alive():
+            self.file_scanning_thread.stop_scanning()
+            self.file_scanning_pause_button.set_label('Pause')
 
     # def on_show_scroll_info(self, message):
     #     visible_rect: Gdk.Rectangle = self.file_scanning_text_view.get_visible_rect()
@@ -176,10 +147,15 @@ class FileScannerPanel(Gtk.Box):
     #
     #     print(f'end_line_top={end_line_top} end_line_bottom={end_line_bottom} visible_rect_top={visible_rect_top} visible_rect_bottom={visible_rect_bottom} end_line_visible={end_line_visible}')
 
-    def on_scanning_progress(self, message):
-        print(f'on_scanning_progress: {message}')
-
+    def on_scanning_progress(self, progress: ScanProgress):
+        message = progress.summary()
         self.emit('file_added', message)
+        self.progress_status_label.set_label(message)
+
+        # Only log directory changes; the status label carries the per-update summary
+        if progress.current_dir == self.last_logged_dir and not progress.is_complete:
+            return
+        self.last_logged_dir = progress.current_dir
 
         visible_rect: Gdk.Rectangle = self.progress_log_text_view.get_visible_rect()
         text_buffer_end_iter = self.progress_log_text_buffer.get_end_iter()
@@ -192,8 +168,6 @@ class FileScannerPanel(Gtk.Box):
         if end_line_visible:
             self.progress_log_text_view.scroll_to_mark(self.text_buffer_mark_end, 0, False, 0, 0)
 
-        pass
-
     def on_scanning_complete(self, message):
         print(f'on_scanning_complete: {message}')
 
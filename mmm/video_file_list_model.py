@@ -0,0 +1,314 @@
+from typing import Callable, Dict, List, Optional, Sequence, Text
+import bisect
+import itertools
+import operator
+import threading
+import time
+import weakref
+
+import gi
+gi.require_version('Gio', '2.0')
+
+from gi.repository import Gio, GLib, GObject
+
+from mmm.core.library_search import MAX_INDEX_CATCH_UP_RECORDS, LibrarySearchIndex, index_library, search_tokens
+from mmm.core.library_sort import LibrarySortOrder, RowEdit
+from mmm.core.library_watch import LibraryEdit, LibraryEditLog, index_runs
+from mmm.core.video_file import VideoFile
+
+
+def display_title(video_file: VideoFile) -> Text:
+    return video_file.imdb_name or video_file.scrubbed_file_name
+
+
+def display_year(video_file: VideoFile) -> Text:
+    return video_file.imdb_year or video_file.scrubbed_file_year
+
+
+# FileBrowserListModelDataItem field -> the VideoFile text it shows, which is what the column sorts by
+FIELD_SORT_TEXTS: Dict[Text, Callable[[VideoFile], Text]] = {
+    'title': display_title,
+    'year': display_year,
+    'rating': operator.attrgetter('imdb_rating'),
+    'imdb_tt': operator.attrgetter('imdb_tt'),
+}
+
+
+class FileBrowserListModelDataItem(GObject.Object):
+    # __gtype_name__ = "MyListModelDataItem"
+
+    def __init__(self, title, year, rating, imdb_tt):
+        super().__init__()
+
+        self.title = title
+        self.year = year
+        self.rating = rating
+        self.imdb_tt = imdb_tt
+
+    @classmethod
+    def from_video_file(cls, video_file: VideoFile) -> 'FileBrowserListModelDataItem':
+        return cls(display_title(video_file), display_year(video_file), video_file.imdb_rating, video_file.imdb_tt)
+
+
+class VideoFileListModel(GObject.Object, Gio.ListModel):
+    # A Gio.ListModel read straight from a list of VideoFiles (or anything indexable like one, such as a
+    # LibrarySnapshot). Nothing is built up front: get_item() makes a row's FileBrowserListModelDataItem when the view
+    # first asks for it, and the cache only holds it weakly. The items GTK has bound to row widgets stay alive (and
+    # cached) through the references GTK holds; once a row scrolls away and GTK lets go, its item is freed. Memory
+    # for items follows what is on screen, not the size of the library.
+    #
+    # Like VideoFileTableModel in the Qt front end, the model shares the list with its owner, who changes it and then
+    # says what changed, a sort goes through a LibrarySortOrder that maps rows to list positions, and a search shows
+    # just the records a LibrarySearchIndex matches (search_positions, in the order of the rows) rather than going
+    # through a Gtk.FilterListModel, which would call back into Python for every record on every keystroke. The
+    # index is made on a worker thread whenever the model is given a list, never while a search is typed; until it
+    # is ready (the is-indexing property says when) every record is shown. item_count is how many items the view
+    # has been told about, and while an edit is being told, the items told about so far are read from
+    # announced_positions.
+
+    is_indexing = GObject.Property(type=bool, default=False)  # True while the search index is being made
+
+    def __init__(self, video_files: Sequence[VideoFile] = None):
+        super().__init__()
+        self.video_files: Sequence[VideoFile] = video_files if video_files is not None else list()
+        self.item_count = len(self.video_files)
+        self.list_count = len(self.video_files)  # how long the list was when the model was last told about it
+        self.items = weakref.WeakValueDictionary()  # position in the model -> FileBrowserListModelDataItem
+        self.sort_order: LibrarySortOrder = None
+        self.search_index: LibrarySearchIndex = None
+        self.search_index_edit_log: LibraryEditLog = None  # the edits made while the search index is being made
+        self.search_index_count = 0  # how many indexes have been started: only the last one is wanted
+        self.search_query = ''
+        self.search_positions: List[int] = None  # None while no search is shown
+        self.announced_positions: List[int] = None  # the list position of each item told about so far (-1 for a removed record) while an edit is told
+        self.start_indexing()
+
+    def do_get_item_type(self):
+        return FileBrowserListModelDataItem.__gtype__
+
+    def do_get_n_items(self) -> int:
+        return self.item_count
+
+    def do_get_item(self, position: int):
+        if position >= self.item_count:
+            return None
+        item = self.items.get(position)
+        if item is None:
+            list_position = self.list_position(position)
+            if list_position < 0:
+                # A removed record the view hasn't been told is gone yet (only while an edit is being told)
+                return FileBrowserListModelDataItem('', '', '', '')
+            item = FileBrowserListModelDataItem.from_video_file(self.video_files[list_position])
+            self.items[position] = item
+        return item
+
+    def shown_count(self) -> int:
+        # How many items there are once the view has been told everything (item_count may still lag behind)
+        if self.search_positions is not None:
+            return len(self.search_positions)
+        return len(self.video_files) if self.sort_order is None else len(self.sort_order)
+
+    def list_position(self, position: int) -> int:
+        # The position in the list of the record at this position of the model
+        if self.announced_positions is not None:
+            return self.announced_positions[position]
+        if self.search_positions is not None:
+            return self.search_positions[position]
+        return position if self.sort_order is None else self.sort_order.position(position)
+
+    def shown_positions(self) -> Sequence[int]:
+        # The list position of every item, once the view has been told everything; not to be changed
+        if self.search_positions is not None:
+            return self.search_positions
+        if self.sort_order is not None:
+            return self.sort_order.positions[::-1] if self.sort_order.descending else self.sort_order.positions
+        return range(self.list_count)
+
+    def model_position(self, list_position: int) -> Optional[int]:
+        # None for a record a search doesn't show
+        if self.search_positions is not None:
+            # By binary search: unsorted the matches are ascending, sorted they are in the order's rows
+            if self.sort_order is not None:
+                return self.sort_order.view_index(self.search_positions, list_position)
+            position = bisect.bisect_left(self.search_positions, list_position)
+            return position if position < len(self.search_positions) and self.search_positions[position] == list_position else None
+        return list_position if self.sort_order is None else self.sort_order.rows_of([list_position])[list_position]
+
+    def sort_by(self, sort_text: Callable[[VideoFile], Text], descending: bool = False, key_cache: Dict[Text, Text] = None):
+        # sort_text None goes back to the order of the list. Every item is replaced, but the view only rebinds the
+        # rows it is showing.
+        if sort_text is None:
+            self.sort_order = None
+        elif self.sort_order is not None and self.sort_order.sort_text is sort_text:
+            self.sort_order.descending = descending
+        else:
+            self.sort_order = LibrarySortOrder(self.video_files, sort_text, descending=descending, key_cache=key_cache)
+        if self.search_positions is not None:
+            self.search_positions = self.searched_positions()
+        self.items = weakref.WeakValueDictionary()
+        if self.item_count:
+            self.items_changed(0, self.item_count, self.item_count)
+
+    def search(self, query: Text):
+        # Shows just the records matching query, as LibrarySearchIndex matches them; a query with no words shows
+        # them all again. Every item is replaced, as for a sort.
+        removed_count = self.item_count
+        self.search_query = query
+        self.search_positions = self.searched_positions()
+        self.item_count = self.shown_count()
+        self.items = weakref.WeakValueDictionary()
+        if removed_count or self.item_count:
+            self.items_changed(0, removed_count, self.item_count)
+
+    def searched_positions(self) -> List[int]:
+        # The list positions search_query matches, in the order of the rows, or None if there is nothing to search for
+        # or no search index yet
+        if self.search_index is None or not search_tokens(self.search_query):
+            return None
+        positions = self.search_index.search(self.search_query)
+        return positions if self.sort_order is None else self.sort_order.view_positions(positions)
+
+    def start_indexing(self):
+        # Makes the search index of the list on a worker thread, from a copy of it if it is a list; edits made to
+        # the list meanwhile are logged, to be folded in once the index is back on the main loop
+        self.search_index = None
+        self.search_index_edit_log = LibraryEditLog(len(self.video_files))
+        self.search_index_count += 1
+        video_files = list(self.video_files) if isinstance(self.video_files, list) else self.video_files
+        threading.Thread(target=self.run_search_indexer, args=(self.search_index_count, video_files), daemon=True).start()
+        self.props.is_indexing = True
+
+    def run_search_indexer(self, search_index_number: int, video_files: Sequence[VideoFile]):
+        start_time = time.perf_counter()
+        search_index = index_library(video_files)
+        print(f'VideoFileListModel: Indexed {len(video_files)} records for search in {time.perf_counter() - start_time:.2f}s')
+        GLib.idle_add(self.on_search_index_made, search_index_number, search_index)
+
+    def on_search_index_made(self, search_index_number: int, search_index: LibrarySearchIndex):
+        if search_index_number != self.search_index_count:
+            # Made for a list the model has since been given another one in place of
+            return GLib.SOURCE_REMOVE
+        library_edit = self.search_index_edit_log.library_edit(self.video_files)
+        self.search_index_edit_log = None
+        if len(library_edit.renamed_indices) + len(library_edit.added) > MAX_INDEX_CATCH_UP_RECORDS:
+            # The list changed too much while it was indexed
+            self.start_indexing()
+            return GLib.SOURCE_REMOVE
+
+        search_index.video_files = self.video_files
+        if library_edit.removed_indices or library_edit.renamed_indices or library_edit.added:
+            search_index.apply_library_edit(library_edit)
+        self.search_index = search_index
+        if search_tokens(self.search_query):
+            self.search(self.search_query)
+        self.props.is_indexing = False
+        return GLib.SOURCE_REMOVE
+
+    def set_video_files(self, video_files: Sequence[VideoFile]):
+        # Shown sorted the way the last list was, and searched the same way once its search index is made
+        removed_count = self.item_count
+        self.video_files = video_files
+        self.items = weakref.WeakValueDictionary()
+        if self.sort_order is not None:
+            self.sort_order = LibrarySortOrder(video_files, self.sort_order.sort_text, descending=self.sort_order.descending, key_cache=self.sort_order.key_cache)
+        self.start_indexing()
+        self.search_positions = None
+        self.list_count = len(video_files)
+        self.item_count = self.shown_count()
+        if removed_count or self.item_count:
+            self.items_changed(0, removed_count, self.item_count)
+
+    def replace_video_files(self, video_files: Sequence[VideoFile]):
+        # The same records in another container (a read-only snapshot copied into a list to be edited): no item
+        # changes, so the view isn't told anything
+        self.video_files = video_files
+        if self.sort_order is not None:
+            self.sort_order.video_files = video_files
+        if self.search_index is not None:
+            self.search_index.video_files = video_files
+
+    def rows_appended(self):
+        # The list has grown at the end (a batch scanned or added): unsorted, one items-changed for all of it;
+        # sorted, each new record goes in at its place in the order
+        added_count = len(self.video_files) - self.list_count
+        if added_count > 0:
+            self.apply_library_edit(LibraryEdit(removed_indices=list(), renamed_indices=list(), added=self.video_files[-added_count:]))
+
+    def rows_changed(self, positions: Sequence[int]):
+        # Records replaced or edited in place: their items are dropped, so the view is handed fresh ones
+        for first_position, last_position in index_runs(sorted(positions)):
+            for position in range(first_position, last_position + 1):
+                self.items.pop(position, None)
+            self.items_changed(first_position, last_position - first_position + 1, last_position - first_position + 1)
+
+    def apply_library_edit(self, library_edit: LibraryEdit):
+        # Mirror an edit already made to the list: runs of removed positions last first (so earlier positions stay
+        # valid), then runs of inserted positions first first, then the positions that changed in place. Unsorted,
+        # the inserted positions are everything added, in one run at the end.
+        #
+        # The view may ask for items while it is told, and must get them as the signals so far describe them, not
+        # as the list now is: announced_positions starts as the items after the edit with the inserted ones taken
+        # out and the removed ones put back (as -1), and each signal brings it a run forward. Items only added at
+        # the end (a batch scanned) need none of that.
+        if self.search_index is not None:
+            if self.search_positions is None and len(library_edit.renamed_indices) + len(library_edit.added) > MAX_INDEX_CATCH_UP_RECORDS:
+                # Too many records to index here (a scan streaming in, say): index the list again off this thread
+                self.start_indexing()
+            else:
+                self.search_index.apply_library_edit(library_edit)
+        elif self.search_index_edit_log is not None:
+            self.search_index_edit_log.add(library_edit)
+        if self.sort_order is None:
+            row_edit = RowEdit.from_library_edit(library_edit, len(self.video_files))
+        else:
+            row_edit = self.sort_order.apply_library_edit(library_edit)
+        if self.search_positions is not None:
+            # Searched: the positions are the matches before and after, with the old ones renumbered past the removals
+            old_positions = self.search_positions
+            position_map = LibrarySortOrder.position_map(library_edit.removed_indices, self.list_count)
+            if position_map is not None:
+                old_positions = list(map(position_map.__getitem__, old_positions))
+            self.search_positions = self.searched_positions()
+            row_edit = RowEdit.between(old_positions, self.search_positions, library_edit.renamed_indices)
+        self.list_count = len(self.video_files)
+
+        removed_runs = index_runs(row_edit.removed_rows)
+        inserted_runs = index_runs(row_edit.inserted_rows)
+        if not removed_runs and (not inserted_runs or inserted_runs[0][0] == self.item_count):
+            for first_position, last_position in inserted_runs:
+                self.item_count = last_position + 1
+                self.items_changed(first_position, 0, last_position - first_position + 1)
+            self.rows_changed(row_edit.changed_rows)
+            return
+
+        shown_positions = self.shown_positions()
+        is_kept_position = bytearray(b'\x01') * len(shown_positions)
+        for position in row_edit.inserted_rows:
+            is_kept_position[position] = 0
+        announced_positions = list(itertools.compress(shown_positions, is_kept_position))
+        for first_position, last_position in removed_runs:
+            announced_positions[first_position:first_position] = [-1] * (last_position - first_position + 1)
+
+        # Only the few items still alive are moved along, not every position after the removed or inserted ones
+        self.announced_positions = announced_positions
+        try:
+            for first_position, last_position in reversed(removed_runs):
+                removed_count = last_position - first_position + 1
+                self.items = weakref.WeakValueDictionary({
+                    (position - removed_count if position > last_position else position): item
+                    for position, item in list(self.items.items()) if not first_position <= position <= last_position
+                })
+                del announced_positions[first_position:last_position + 1]
+                self.item_count = len(announced_positions)
+                self.items_changed(first_position, removed_count, 0)
+            for first_position, last_position in inserted_runs:
+                inserted_count = last_position - first_position + 1
+                self.items = weakref.WeakValueDictionary({
+                    (position + inserted_count if position >= first_position else position): item for position, item in list(self.items.items())
+                })
+                announced_positions[first_position:first_position] = shown_positions[first_position:last_position + 1]
+                self.item_count = len(announced_positions)
+                self.items_changed(first_position, 0, inserted_count)
+        finally:
+            self.announced_positions = None
+        self.rows_changed(row_edit.changed_rows)
@@ -0,0 +1,53 @@
+import pytest
+
+from main_scrubber_benchmark import make_release_names, reference_scrub_video_file_name
+from mmm.core.filename_scrubber import DEFAULT_FILENAME_METADATA_TOKENS, FilenameScrubber, scrub_video_file_name
+
+
+@pytest.mark.parametrize('file_name, expected', [
+    ('The.Matrix.1999.1080p.BluRay.x264-SPARKS', ('the matrix', '1999')),
+    ('Blade Runner (1982)', ('Blade Runner', '1982')),
+    ('Blade.Runner.(1982).REPACK', ('Blade Runner', '1982')),
+    ('Alien (1979) 1080p BluRay', ('Alien', '1979')),
+    ('Se7en.1995.PROPER.DVDRip', ('se7en', '1995')),
+    ('1917.2019.720p.WEB', ('1917', '2019')),
+    ('300', ('300', '')),
+    ('Dr. Strangelove.1964p.HDTV', ('dr strangelove', '1964')),
+    ('Mr.  Nobody\t2009 . x265', ('mr nobody', '2009')),
+    ('Return.of.the.King.[2003].WEB-DL', ('return of the king [2003]', '')),
+    ('Léon.1994.HEVC', ('léon', '1994')),
+    ('Ōkami.Über.Straße.x264', ('ōkami über straße', '')),
+    ('ＷＩＤＥ.Amélie (2001)', ('ＷＩＤＥ Amélie', '2001')),
+    ('BluRay.1080p', ('', '')),
+    ('', ('', '')),
+])
+def test_scrub_matches_the_original(file_name, expected):
+    assert reference_scrub_video_file_name(file_name, DEFAULT_FILENAME_METADATA_TOKENS) == expected
+    assert FilenameScrubber().scrub(file_name) == expected
+
+
+def test_metadata_tokens_come_from_the_config():
+    tokens = 'Director.Cut , remux,hevc'
+    scrubber = FilenameScrubber(tokens)
+    for file_name in ['Heat.1995.REMUX.HEVC', 'Heat.1995.hevc', 'Heat 1995 Director.Cut', 'Heat.1995.1080p.remux']:
+        assert scrubber.scrub(file_name) == reference_scrub_video_file_name(file_name, tokens)
+    # As the original does, a trailing '1080p' reads as a year
+    assert scrubber.scrub('Heat.1995.1080p.remux') == ('heat 1995', '1080')
+
+
+def test_generated_release_names_match_the_original():
+    release_names = make_release_names(20_000, unique_fraction=0.5, seed=2)
+    expected = [reference_scrub_video_file_name(release_name, DEFAULT_FILENAME_METADATA_TOKENS) for release_name in release_names]
+    assert FilenameScrubber(memo_size=0).scrub_many(release_names) == expected
+    assert FilenameScrubber(memo_size=1000).scrub_many(release_names) == expected
+
+
+def test_repeated_names_are_scrubbed_once():
+    scrubber = FilenameScrubber(memo_size=2)
+    assert scrubber.scrub_many(['Heat.1995', 'Heat.1995', 'Ronin.1998', 'Heat.1995']) == [('heat', '1995'), ('heat', '1995'), ('ronin', '1998'), ('heat', '1995')]
+    cache_info = scrubber.scrub.cache_info()
+    assert (cache_info.hits, cache_info.misses, cache_info.currsize) == (2, 2, 2)
+
+    scrubber.scrub('Tron.1982')
+    assert scrubber.scrub.cache_info().currsize == 2
+    assert scrub_video_file_name('Heat.1995') == scrub_video_file_name('Heat.1995') == ('heat', '1995')
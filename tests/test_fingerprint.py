@@ -0,0 +1,76 @@
+from typing import Text
+import os
+import random
+
+from mmm.core.fingerprint import FINGERPRINT_CHUNK_COUNT, FINGERPRINT_CHUNK_SIZE, FingerprintCache, compute_fingerprint
+from mmm.core.scan_engine import ScanEngine
+
+
+def write_file(file_path: Text, content: bytes):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(content)
+
+
+def random_bytes(size: int, seed: int) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def test_fingerprint_follows_content_not_name(tmp_path):
+    big_size = FINGERPRINT_CHUNK_SIZE * FINGERPRINT_CHUNK_COUNT * 4
+    content = random_bytes(big_size, seed=1)
+    write_file(os.path.join(tmp_path, 'a.mkv'), content)
+    write_file(os.path.join(tmp_path, 'b.mkv'), content)
+    # Differs only between the chunks that are read, so it fingerprints the same
+    write_file(os.path.join(tmp_path, 'between.mkv'), content[:FINGERPRINT_CHUNK_SIZE] + b'\0' + content[FINGERPRINT_CHUNK_SIZE + 1:])
+    write_file(os.path.join(tmp_path, 'end.mkv'), content[:-1] + b'\0')
+    write_file(os.path.join(tmp_path, 'longer.mkv'), content + b'\0')
+
+    fingerprints = {file_name: compute_fingerprint(os.path.join(tmp_path, file_name)) for file_name in os.listdir(tmp_path)}
+    assert fingerprints['a.mkv'] == fingerprints['b.mkv'] == fingerprints['between.mkv']
+    assert len({fingerprints['a.mkv'], fingerprints['end.mkv'], fingerprints['longer.mkv']}) == 3
+
+    write_file(os.path.join(tmp_path, 'empty.mkv'), b'')
+    assert compute_fingerprint(os.path.join(tmp_path, 'empty.mkv')) != compute_fingerprint(os.path.join(tmp_path, 'a.mkv'))
+
+
+def test_cache_round_trips_and_finds_duplicates(tmp_path):
+    cache_path = os.path.join(tmp_path, 'fingerprints.json')
+    file_paths = [os.path.join(tmp_path, 'videos', file_name) for file_name in ('one.mkv', 'copy of one.mkv', 'two.mkv')]
+    for file_path, seed in zip(file_paths, (1, 1, 2)):
+        write_file(file_path, random_bytes(1000, seed))
+    os.link(file_paths[0], os.path.join(tmp_path, 'videos', 'link to one.mkv'))
+    file_paths.append(os.path.join(tmp_path, 'videos', 'link to one.mkv'))
+
+    fingerprint_cache = FingerprintCache.load(cache_path)
+    fingerprints = fingerprint_cache.fingerprint_files(file_paths)
+    assert len(fingerprints) == 4
+    fingerprint_cache.save()
+
+    reloaded_cache = FingerprintCache.load(cache_path)
+    assert reloaded_cache.files == fingerprint_cache.files
+    assert reloaded_cache.fingerprint_files(file_paths) == fingerprints
+    assert reloaded_cache.updated_paths == {}
+    # A hard link is the same file, not a copy of it: the group names the file once
+    assert reloaded_cache.find_duplicate_groups(file_paths) == [sorted([file_paths[1], min(file_paths[0], file_paths[3])])]
+
+
+def test_rescan_reports_moved_files_as_moves(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', os.path.join(tmp_path, 'cache'))
+    top = os.path.join(tmp_path, 'videos')
+    write_file(os.path.join(top, 'new', 'Heat.1995.mkv'), random_bytes(1000, seed=1))
+    write_file(os.path.join(top, 'new', 'Ronin.1998.mkv'), random_bytes(1000, seed=2))
+    assert ScanEngine(top, use_fingerprints=True).run()
+
+    os.makedirs(os.path.join(top, 'watched'))
+    os.rename(os.path.join(top, 'new', 'Heat.1995.mkv'), os.path.join(top, 'watched', 'Heat (1995).mkv'))
+    os.remove(os.path.join(top, 'new', 'Ronin.1998.mkv'))
+    write_file(os.path.join(top, 'new', 'Tron.1982.mkv'), random_bytes(1000, seed=3))
+
+    rescan = ScanEngine(top, use_fingerprints=True)
+    assert rescan.run()
+    assert [(old_video_file.file_path, new_video_file.file_path) for old_video_file, new_video_file in rescan.scan_diff.moved] == [(os.path.join(top, 'new', 'Heat.1995.mkv'), os.path.join(top, 'watched', 'Heat (1995).mkv'))]
+    assert [video_file.file_path for video_file in rescan.scan_diff.removed] == [os.path.join(top, 'new', 'Ronin.1998.mkv')]
+    assert [video_file.file_path for video_file in rescan.scan_diff.added] == [os.path.join(top, 'new', 'Tron.1982.mkv')]
+    # The paths that are gone were dropped from the cache
+    assert set(FingerprintCache.load(FingerprintCache.default_path()).files) == {os.path.join(top, 'watched', 'Heat (1995).mkv'), os.path.join(top, 'new', 'Tron.1982.mkv')}
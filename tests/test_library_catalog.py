@@ -0,0 +1,83 @@
+import dataclasses
+import json
+import os
+
+import pytest
+
+from mmm.core.library_catalog import LibraryCatalog
+from mmm.core.video_file import VideoFile
+
+
+def scanned_video_files(root_path: str, count: int):
+    return [VideoFile(file_path=os.path.join(root_path, f'{number}.mkv'), scrubbed_file_name=f'movie {number}') for number in range(count)]
+
+
+def test_scans_are_merged_into_one_shard_per_root(tmp_path):
+    catalog_dir = os.path.join(tmp_path, 'catalog')
+    movies_path = os.path.join(tmp_path, 'movies')
+    tv_path = os.path.join(tmp_path, 'tv')
+
+    catalog = LibraryCatalog.load(catalog_dir)
+    assert len(catalog.merge_scan(movies_path, scanned_video_files(movies_path, 3)).added) == 3
+    assert len(catalog.merge_scan(tv_path, scanned_video_files(tv_path, 2)).added) == 2
+
+    reloaded_catalog = LibraryCatalog.load(os.path.join(catalog_dir, 'catalog.json'))
+    assert list(reloaded_catalog.shards) == [movies_path, tv_path]
+    assert [shard.video_file_count for shard in reloaded_catalog.shards.values()] == [3, 2]
+    assert all(shard.last_scan_time for shard in reloaded_catalog.shards.values())
+    movies_shard = reloaded_catalog.shards[movies_path]
+    assert [video_file.file_path for video_file in reloaded_catalog.open_shard(movies_shard).load()] == [video_file.file_path for video_file in scanned_video_files(movies_path, 3)]
+
+    # A rescan keeps what was looked up for the records it finds again
+    shard_store = reloaded_catalog.open_shard(movies_shard)
+    video_files = shard_store.load()
+    video_files[1] = dataclasses.replace(video_files[1], imdb_tt='tt0113277', is_dirty=True)
+    shard_store.save_dirty(video_files)
+    change_set = reloaded_catalog.merge_scan(movies_path, scanned_video_files(movies_path, 2))
+    assert (len(change_set.removed), change_set.unchanged_count) == (1, 2)
+    assert [video_file.imdb_tt for video_file in reloaded_catalog.open_shard(movies_shard).load()] == ['', 'tt0113277']
+    assert LibraryCatalog.load(catalog_dir).shards[movies_path].video_file_count == 2
+
+
+def test_catalogs_saved_by_two_processes_keep_both_roots(tmp_path):
+    catalog_dir = os.path.join(tmp_path, 'catalog')
+    first_catalog = LibraryCatalog.load(catalog_dir)
+    second_catalog = LibraryCatalog.load(catalog_dir)
+    first_catalog.record_scan(os.path.join(tmp_path, 'movies'), 10)
+    second_catalog.record_scan(os.path.join(tmp_path, 'tv'), 20)
+    first_catalog.save()
+    second_catalog.save()
+
+    assert {os.path.basename(root_path): shard.video_file_count for root_path, shard in LibraryCatalog.load(catalog_dir).shards.items()} == {'movies': 10, 'tv': 20}
+
+
+def test_paths_belong_to_the_innermost_root(tmp_path):
+    catalog = LibraryCatalog(os.path.join(tmp_path, 'catalog'))
+    media_shard = catalog.add_root(os.path.join(tmp_path, 'media'))
+    tv_shard = catalog.add_root(os.path.join(tmp_path, 'media', 'tv') + os.sep)
+    assert catalog.add_root(os.path.join(tmp_path, 'media', '.', 'tv')) is tv_shard
+    assert media_shard.shard_file_name != tv_shard.shard_file_name
+
+    assert catalog.shard_for_path(os.path.join(tmp_path, 'media', 'movies', 'Heat.mkv')) is media_shard
+    assert catalog.shard_for_path(os.path.join(tmp_path, 'media', 'tv', 'show', 'episode.mkv')) is tv_shard
+    assert catalog.shard_for_path(os.path.join(tmp_path, 'media', 'tvshows', 'episode.mkv')) is media_shard
+    assert catalog.shard_for_path(os.path.join(tmp_path, 'elsewhere.mkv')) is None
+
+
+def test_empty_and_missing_roots_are_offline(tmp_path):
+    catalog = LibraryCatalog(os.path.join(tmp_path, 'catalog'))
+    for root_name in ('mounted', 'unmounted'):
+        os.makedirs(os.path.join(tmp_path, root_name))
+        catalog.add_root(os.path.join(tmp_path, root_name))
+    with open(os.path.join(tmp_path, 'mounted', 'Heat.mkv'), 'w'):
+        pass
+    catalog.add_root(os.path.join(tmp_path, 'missing'))
+
+    assert {os.path.basename(root_path): is_online for root_path, is_online in catalog.online_roots().items()} == {'mounted': True, 'unmounted': False, 'missing': False}
+
+
+def test_catalog_of_another_version_is_refused(tmp_path):
+    with open(os.path.join(tmp_path, 'catalog.json'), 'w', encoding='utf8') as f:
+        json.dump({'version': 99, 'shards': []}, f)
+    with pytest.raises(ValueError):
+        LibraryCatalog.load(str(tmp_path))
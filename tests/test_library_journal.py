@@ -0,0 +1,112 @@
+from typing import List
+import json
+import os
+import stat
+
+from mmm.core.library_journal import LibraryJournal
+from mmm.core.video_file import VideoFile
+
+
+def make_video_file(number: int) -> VideoFile:
+    return VideoFile(file_path=f'/m/{number}.mkv', scrubbed_file_name=f'movie {number}')
+
+
+def loaded_names(library_path: str) -> List[str]:
+    # A fresh journal each time, as a new session would open it, and never through a snapshot
+    return [video_file.scrubbed_file_name for video_files in LibraryJournal(library_path).iter_batches(use_snapshot=False) for video_file in video_files]
+
+
+def make_edited_library(library_path: str) -> LibraryJournal:
+    library_journal = LibraryJournal(library_path)
+    library_journal.write_full([make_video_file(number) for number in range(5)])
+    renamed = make_video_file(2)
+    renamed.scrubbed_file_name = 'renamed 2'
+    renamed.is_dirty = True
+    assert library_journal.save_dirty([renamed, make_video_file(3), VideoFile(file_path='/m/new.mkv', scrubbed_file_name='new', is_dirty=True)], removed_file_paths=['/m/0.mkv']) == 3
+    return library_journal
+
+
+EDITED_NAMES = ['movie 1', 'renamed 2', 'movie 3', 'movie 4', 'new']
+
+
+def test_new_library_file_gets_the_umask_mode(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    umask = os.umask(0o027)
+    try:
+        LibraryJournal(library_path).write_full([make_video_file(1)])
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(library_path).st_mode) == 0o640
+
+
+def test_rewritten_library_file_keeps_its_mode(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    library_journal = LibraryJournal(library_path)
+    library_journal.write_full([make_video_file(1)])
+    os.chmod(library_path, 0o604)
+
+    library_journal.write_full([make_video_file(2)])
+    assert stat.S_IMODE(os.stat(library_path).st_mode) == 0o604
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
+
+
+def test_saved_edits_are_replayed_over_the_base(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    make_edited_library(library_path)
+    assert loaded_names(library_path) == EDITED_NAMES
+    # Only the dirty records and the removal were journaled
+    with open(library_path + '.journal', encoding='utf8') as f:
+        assert len(f.readlines()) == 3
+
+
+def test_compaction_folds_the_journal_into_the_base(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    make_edited_library(library_path).compact()
+    assert not os.path.exists(library_path + '.journal')
+    assert not os.path.exists(library_path + '.compacting')
+    with open(library_path, encoding='utf8') as f:
+        assert [video_file_dict['scrubbed_file_name'] for video_file_dict in json.load(f)] == EDITED_NAMES
+    assert loaded_names(library_path) == EDITED_NAMES
+
+
+def test_saves_past_the_threshold_compact_in_the_background(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    library_journal = LibraryJournal(library_path, compact_threshold_bytes=1)
+    library_journal.write_full([make_video_file(number) for number in range(5)])
+    library_journal.save_dirty([VideoFile(file_path='/m/new.mkv', scrubbed_file_name='new', is_dirty=True)])
+    library_journal.wait_for_compaction()
+    assert library_journal.journal_size() == 0
+    assert loaded_names(library_path) == [f'movie {number}' for number in range(5)] + ['new']
+
+
+def test_torn_save_is_dropped(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    make_edited_library(library_path)
+    # A crash partway through the write() of a save
+    with open(library_path + '.journal', 'ab') as f:
+        f.write(b'{"file_path": "/m/torn.mkv", "scrubbed_fi')
+    assert loaded_names(library_path) == EDITED_NAMES
+
+    LibraryJournal(library_path).save_dirty([VideoFile(file_path='/m/later.mkv', scrubbed_file_name='later', is_dirty=True)])
+    assert loaded_names(library_path) == EDITED_NAMES + ['later']
+
+
+def test_interrupted_compaction_is_recovered(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    make_edited_library(library_path)
+    # A crash after the journal was set aside for compaction, before the base was replaced; saves went on meanwhile
+    os.replace(library_path + '.journal', library_path + '.compacting')
+    renamed = make_video_file(4)
+    renamed.scrubbed_file_name = 'renamed 4'
+    renamed.is_dirty = True
+    LibraryJournal(library_path).save_dirty([renamed])
+    names = EDITED_NAMES[:3] + ['renamed 4', 'new']
+    assert loaded_names(library_path) == names
+
+    LibraryJournal(library_path).compact()
+    assert not os.path.exists(library_path + '.compacting')
+    assert loaded_names(library_path) == names
+
+    LibraryJournal(library_path).compact()
+    assert LibraryJournal(library_path).journal_size() == 0
+    assert loaded_names(library_path) == names
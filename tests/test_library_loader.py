@@ -0,0 +1,53 @@
+from typing import List
+import json
+import os
+
+from mmm.core.library_journal import LibraryJournal
+from mmm.core.library_loader import LibraryLoader
+from mmm.core.library_snapshot import LibrarySnapshot
+from mmm.core.video_file import VideoFile, video_file_as_dict
+
+
+def write_library(library_path: str, count: int):
+    with open(library_path, 'w', encoding='utf8') as f:
+        json.dump([video_file_as_dict(VideoFile(file_path=f'/m/{index}.mkv', scrubbed_file_name=f'movie {index}')) for index in range(count)], f)
+
+
+def load(library_path: str) -> LibraryLoader:
+    batches: List[List[VideoFile]] = list()
+    library_loader = LibraryLoader(library_path, batch_sink=batches.append)
+    assert library_loader.load()
+    library_loader.batches = batches
+    return library_loader
+
+
+def test_up_to_date_snapshot_is_shown_without_loading(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    write_library(library_path, 300)
+
+    first_loader = load(library_path)
+    assert first_loader.video_file_rows is None
+    assert sum(map(len, first_loader.batches)) == 300
+
+    second_loader = load(library_path)
+    assert isinstance(second_loader.video_file_rows, LibrarySnapshot)
+    assert second_loader.batches == []
+    assert len(second_loader.video_file_rows) == 300
+    assert second_loader.video_file_rows[123].scrubbed_file_name == 'movie 123'
+    assert [video_file.file_path for video_file in second_loader.video_file_rows] == [f'/m/{index}.mkv' for index in range(300)]
+
+
+def test_saves_since_the_snapshot_are_loaded(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    write_library(library_path, 300)
+    load(library_path)
+
+    LibraryJournal(library_path).save_dirty([VideoFile(file_path='/m/new.mkv', is_dirty=True)], removed_file_paths=['/m/0.mkv'])
+    loader = load(library_path)
+    assert loader.video_file_rows is None
+    video_files = [video_file for video_files in loader.batches for video_file in video_files]
+    assert len(video_files) == 300
+    assert video_files[-1].file_path == '/m/new.mkv'
+
+    # That load brought the snapshot up to date
+    assert isinstance(load(library_path).video_file_rows, LibrarySnapshot)
@@ -0,0 +1,73 @@
+from typing import List
+import dataclasses
+import random
+
+from mmm.core.library_reconcile import reconcile_scan
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+
+
+def make_video_file(number: int, folder: str = '/m') -> VideoFile:
+    return VideoFile(file_path=f'{folder}/{number}.mkv', scrubbed_file_name=f'movie {number}', imdb_tt=f'tt{number:07}')
+
+
+def apply_library_edit(video_files: List[VideoFile], library_edit: LibraryEdit, new_video_files: List[VideoFile]) -> List[VideoFile]:
+    # What a view model does with the edit: drop the removed rows, refresh the changed ones, append the added ones
+    removed_indices = set(library_edit.removed_indices)
+    edited_video_files = [video_file for index, video_file in enumerate(video_files) if index not in removed_indices]
+    for index in library_edit.renamed_indices:
+        edited_video_files[index] = new_video_files[index]
+    return edited_video_files + list(library_edit.added)
+
+
+def test_rescan_is_merged_into_the_library():
+    library = [make_video_file(number) for number in range(6)] + [make_video_file(number, folder='/other') for number in range(2)]
+    original_library = list(library)
+    # Identities as the last scan recorded them; 2.mkv was renamed to 2b.mkv, 4.mkv was deleted and its inode reused
+    recorded_identities = {video_file.file_path: (1, index, 100, index) for index, video_file in enumerate(library)}
+    current_identities = {'/m/2b.mkv': recorded_identities['/m/2.mkv'], '/m/new.mkv': (1, 4, 5, 99)}
+    scanned = [dataclasses.replace(video_file, imdb_tt='') for video_file in library[:6] if video_file.file_path not in ('/m/2.mkv', '/m/4.mkv')]
+    scanned[0] = dataclasses.replace(scanned[0], scrubbed_file_name='movie zero')
+    scanned += [VideoFile(file_path='/m/2b.mkv', scrubbed_file_name='movie 2b'), VideoFile(file_path='/m/new.mkv', scrubbed_file_name='new')]
+
+    change_set = reconcile_scan(library, scanned, '/m', recorded_identity=recorded_identities.get, current_identity=current_identities.get)
+    assert change_set.summary() == '1 added, 1 removed, 1 renamed, 1 rescrubbed, 3 unchanged'
+    assert [video_file.file_path for video_file in library] == ['/m/0.mkv', '/m/1.mkv', '/m/2b.mkv', '/m/3.mkv', '/m/5.mkv', '/other/0.mkv', '/other/1.mkv', '/m/new.mkv']
+    # Renamed and rescrubbed records keep what was looked up for them
+    assert (library[0].scrubbed_file_name, library[0].imdb_tt) == ('movie zero', 'tt0000000')
+    assert (library[2].scrubbed_file_name, library[2].imdb_tt) == ('movie 2b', 'tt0000002')
+    assert change_set.removed_file_paths == ['/m/4.mkv', '/m/2.mkv']
+    assert [video_file.file_path for video_file in library if video_file.is_dirty] == ['/m/0.mkv', '/m/2b.mkv', '/m/new.mkv']
+    # The records that were in the library before are untouched, so a save running meanwhile sees them as they were
+    assert original_library[0].scrubbed_file_name == 'movie 0' and not original_library[0].is_dirty
+    assert apply_library_edit(original_library, change_set.library_edit(), library) == library
+
+
+def test_library_edit_matches_the_merge():
+    rng = random.Random(1)
+    for _trial in range(50):
+        library = [make_video_file(number) for number in range(40)]
+        original_library = list(library)
+        recorded_identities = {video_file.file_path: (1, index, 100, index) for index, video_file in enumerate(library)}
+        current_identities = dict()
+        scanned = list()
+        for index, video_file in enumerate(library):
+            change = rng.random()
+            if change < 0.1:
+                continue
+            if change < 0.2:
+                file_path = video_file.file_path.replace('.mkv', '.renamed.mkv')
+                current_identities[file_path] = recorded_identities[video_file.file_path]
+                scanned.append(VideoFile(file_path=file_path, scrubbed_file_name=video_file.scrubbed_file_name))
+            elif change < 0.3:
+                scanned.append(VideoFile(file_path=video_file.file_path, scrubbed_file_name=video_file.scrubbed_file_name + ' rescrubbed'))
+            else:
+                scanned.append(VideoFile(file_path=video_file.file_path, scrubbed_file_name=video_file.scrubbed_file_name))
+        scanned += [VideoFile(file_path=f'/m/added {index}.mkv') for index in range(rng.randrange(4))]
+        rng.shuffle(scanned)
+
+        change_set = reconcile_scan(library, scanned, '/m', recorded_identity=recorded_identities.get, current_identity=current_identities.get)
+        assert sorted(video_file.file_path for video_file in library) == sorted(video_file.file_path for video_file in scanned)
+        assert apply_library_edit(original_library, change_set.library_edit(), library) == library
+
+        assert not reconcile_scan(library, [dataclasses.replace(video_file) for video_file in library], '/m')
@@ -0,0 +1,83 @@
+from typing import Tuple
+import os
+import queue
+import threading
+
+from mmm.core.library_journal import LibraryJournal
+from mmm.core.library_saver import LibrarySaver
+from mmm.core.video_file import VideoFile
+
+
+class HeldLibraryJournal(LibraryJournal):
+    # Holds each save until released, like a slow disk
+    def __init__(self, library_path: str):
+        super().__init__(library_path)
+        self.save_started = threading.Event()
+        self.release = threading.Event()
+
+    def save_dirty(self, video_files, removed_file_paths=()) -> int:
+        self.save_started.set()
+        self.release.wait(10)
+        return super().save_dirty(video_files, removed_file_paths)
+
+
+def make_video_files(count: int):
+    return [VideoFile(file_path=f'/m/{number}.mkv', scrubbed_file_name=f'movie {number}') for number in range(count)]
+
+
+def start_saver() -> Tuple[LibrarySaver, queue.Queue]:
+    save_results = queue.Queue()
+    library_saver = LibrarySaver(save_results.put)
+    library_saver.start()
+    return library_saver, save_results
+
+
+def test_edit_during_a_save_goes_into_the_next_one(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.json')
+    library_journal = HeldLibraryJournal(library_path)
+    video_files = make_video_files(4)
+    LibraryJournal(library_path).write_full(video_files)
+    library_saver, save_results = start_saver()
+
+    video_files[1].scrubbed_file_name = 'first edit'
+    video_files[1].is_dirty = True
+    assert library_saver.save_dirty(library_journal, video_files, removed_file_paths=['/m/3.mkv'])
+    assert not video_files[1].is_dirty
+    assert library_journal.save_started.wait(10)
+
+    # Edited while the save is writing: the save writes the record as it was when it was requested
+    video_files[1].scrubbed_file_name = 'second edit'
+    video_files[1].is_dirty = True
+    library_journal.release.set()
+    save_result = save_results.get(timeout=10)
+    assert (save_result.saved_count, save_result.error) == (2, None)
+    assert [video_file.scrubbed_file_name for video_file in LibraryJournal(library_path).load()] == ['movie 0', 'first edit', 'movie 2']
+
+    assert library_saver.save_dirty(library_journal, video_files)
+    assert save_results.get(timeout=10).saved_count == 1
+    assert [video_file.scrubbed_file_name for video_file in LibraryJournal(library_path).load()] == ['movie 0', 'second edit', 'movie 2']
+    assert not library_saver.save_dirty(library_journal, video_files)
+
+    library_saver.stop_saving()
+    library_saver.join()
+
+
+def test_failed_save_hands_back_what_it_held(tmp_path):
+    library_journal = LibraryJournal(os.path.join(tmp_path, 'missing', 'library.json'))
+    video_files = make_video_files(3)
+    video_files[2].is_dirty = True
+    library_saver, save_results = start_saver()
+
+    assert library_saver.save_dirty(library_journal, video_files, removed_file_paths=['/m/9.mkv'])
+    save_result = save_results.get(timeout=10)
+    assert save_result.error
+    assert save_result.unsaved_video_files == [video_files[2]]
+    assert save_result.unsaved_removed_file_paths == ['/m/9.mkv']
+    assert library_saver.wait_until_idle(timeout=10)
+    assert not library_saver.is_saving
+
+    library_saver.save_full(library_journal, video_files)
+    assert save_results.get(timeout=10).error
+
+    library_saver.stop_saving()
+    library_saver.join()
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from mmm.core.library_snapshot import IRREGULAR_VALUE, LibrarySnapshot, encode_rating, encode_year, write_snapshot
+from mmm.core.video_file import VideoFile
+
+
+@pytest.mark.parametrize('year', ['²', '١٩٩٩', '0', '0199', '19999', '1999 '])
+def test_irregular_year_is_not_encoded(year):
+    assert encode_year(year) == IRREGULAR_VALUE
+
+
+@pytest.mark.parametrize('rating', ['inf', '-inf', 'nan', '1e400', '7.50', '-1.0', 'n/a'])
+def test_irregular_rating_is_not_encoded(rating):
+    assert encode_rating(rating) == IRREGULAR_VALUE
+
+
+def test_years_and_ratings_round_trip(tmp_path):
+    snapshot_path = os.path.join(tmp_path, 'library.snapshot')
+    values = ['', '1999', '²', 'inf', 'nan', '7.5', '0.0', '10.0']
+    video_files = [VideoFile(file_path=f'/m/{index}.mkv', scrubbed_file_year=value, imdb_year=value, imdb_rating=value) for index, value in enumerate(values)]
+    write_snapshot(snapshot_path, video_files, {})
+
+    with LibrarySnapshot(snapshot_path) as snapshot:
+        assert [(video_file.scrubbed_file_year, video_file.imdb_year, video_file.imdb_rating) for video_file in snapshot] == [(value, value, value) for value in values]
@@ -0,0 +1,21 @@
+import operator
+import random
+
+import pytest
+
+from mmm.core.library_sort import LibrarySortOrder
+from mmm.core.video_file import VideoFile
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_view_index_finds_positions_in_view_order(descending):
+    rng = random.Random(1)
+    video_files = [VideoFile(file_path=f'/m/{index}.mkv', scrubbed_file_name=f'movie {rng.randrange(100)}') for index in range(500)]
+    sort_order = LibrarySortOrder(video_files, operator.attrgetter('scrubbed_file_name'), descending=descending)
+    matches = sorted(rng.sample(range(len(video_files)), 120))
+    view_positions = sort_order.view_positions(matches)
+
+    for position in range(len(video_files)):
+        expected_index = view_positions.index(position) if position in matches else None
+        assert sort_order.view_index(view_positions, position) == expected_index
+    assert sort_order.view_index([], 0) is None
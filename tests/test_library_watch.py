@@ -0,0 +1,104 @@
+import dataclasses
+import errno
+import os
+import queue
+import random
+import time
+
+import pytest
+
+from mmm.core.fs_events import PollingWatcher
+from mmm.core.inotify import InotifyUnavailableError, InotifyWatcher
+from mmm.core.library_search import LibrarySearchIndex
+from mmm.core.library_watch import LibraryEdit, LibraryEditLog, LibraryWatch
+from mmm.core.scan_engine import ScanEngine
+from mmm.core.video_file import VideoFile
+
+
+def make_video_file(number: int) -> VideoFile:
+    return VideoFile(file_path=f'/m/{number}.mkv', scrubbed_file_name=f'movie {number}')
+
+
+def edit(video_files, rng: random.Random) -> LibraryEdit:
+    # An edit the way apply_library_change() makes one: removals, then replacements in place, then additions
+    removed_indices = sorted(rng.sample(range(len(video_files)), rng.randrange(4)))
+    for index in reversed(removed_indices):
+        del video_files[index]
+    renamed_indices = sorted(rng.sample(range(len(video_files)), rng.randrange(4)))
+    for index in renamed_indices:
+        video_files[index] = dataclasses.replace(video_files[index], scrubbed_file_name=f'renamed {rng.randrange(1000)}')
+    added = [make_video_file(1000 + rng.randrange(1000)) for _index in range(rng.randrange(4))]
+    video_files.extend(added)
+    return LibraryEdit(removed_indices=removed_indices, renamed_indices=renamed_indices, added=added)
+
+
+def test_logged_edits_take_the_copy_to_the_list():
+    rng = random.Random(1)
+    for _trial in range(50):
+        video_files = [make_video_file(number) for number in range(30)]
+        copied_video_files = list(video_files)
+        edit_log = LibraryEditLog(len(copied_video_files))
+        for _edit in range(rng.randrange(1, 6)):
+            edit_log.add(edit(video_files, rng))
+
+        library_edit = edit_log.library_edit(video_files)
+        removed_indices = set(library_edit.removed_indices)
+        edited_video_files = [video_file for index, video_file in enumerate(copied_video_files) if index not in removed_indices]
+        for index in library_edit.renamed_indices:
+            edited_video_files[index] = video_files[index]
+        edited_video_files += library_edit.added
+        assert edited_video_files == video_files
+        # Nothing is replaced that wasn't
+        assert all(edited_video_files[index] is video_files[index] for index in range(len(video_files)))
+
+
+def test_index_of_the_copy_is_brought_up_to_date():
+    rng = random.Random(2)
+    video_files = [make_video_file(number) for number in range(200)]
+    search_index = LibrarySearchIndex(list(video_files))
+    edit_log = LibraryEditLog(len(video_files))
+    for _edit in range(10):
+        edit_log.add(edit(video_files, rng))
+
+    search_index.video_files = video_files
+    search_index.apply_library_edit(edit_log.library_edit(video_files))
+    for query in ('movie', 'renamed', '1', 'movie 12'):
+        assert search_index.search(query) == LibrarySearchIndex(video_files).search(query)
+
+
+def test_watch_polls_once_a_new_directory_cant_be_watched(tmp_path, monkeypatch):
+    try:
+        InotifyWatcher().close()
+    except InotifyUnavailableError:
+        pytest.skip('inotify is not available')
+    monkeypatch.setenv('XDG_CACHE_HOME', os.path.join(tmp_path, 'cache'))
+    folder_path = os.path.join(tmp_path, 'videos')
+    os.mkdir(folder_path)
+    with open(os.path.join(folder_path, 'Old.Movie.1999.mkv'), 'wb') as f:
+        f.write(b'old')
+    ScanEngine(folder_path).run()
+
+    add_watch = InotifyWatcher.add_watch
+
+    def add_watch_up_to_the_limit(watcher: InotifyWatcher, dir_path: str):
+        if os.path.basename(dir_path) == 'new':
+            raise InotifyUnavailableError(errno.ENOSPC, 'inotify watch limit reached')
+        add_watch(watcher, dir_path)
+
+    monkeypatch.setattr(InotifyWatcher, 'add_watch', add_watch_up_to_the_limit)
+    library_changes = queue.Queue()
+    library_watch = LibraryWatch(folder_path, library_changes.put, poll_interval=0.1, debounce_seconds=0.05, max_delay_seconds=0.2)
+    library_watch.start()
+    while not isinstance(library_watch.watcher, InotifyWatcher):
+        time.sleep(0.01)
+
+    os.mkdir(os.path.join(folder_path, 'new'))
+    with open(os.path.join(folder_path, 'new', 'New.Movie.2001.mkv'), 'wb') as f:
+        f.write(b'new')
+    library_change = library_changes.get(timeout=10)
+    assert library_watch.is_alive()
+    assert isinstance(library_watch.watcher, PollingWatcher)
+    assert [video_file.file_path for video_file in library_change.added] == [os.path.join(folder_path, 'new', 'New.Movie.2001.mkv')]
+
+    library_watch.stop_watching()
+    library_watch.join()
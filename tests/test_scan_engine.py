@@ -0,0 +1,123 @@
+from typing import List, Text
+import os
+
+from mmm.core.scan_engine import ScanEngine
+
+
+def make_tree(top: Text, dir_count: int = 6):
+    # top/dir{n}/Movie.{n}.{2000 + n}.mkv plus a subtitle to ignore, and top/Loose.1999.mkv
+    for number in range(dir_count):
+        os.makedirs(os.path.join(top, f'dir{number}'))
+        for file_name in (f'Movie.{number}.{2000 + number}.mkv', f'Movie.{number}.{2000 + number}.srt'):
+            with open(os.path.join(top, f'dir{number}', file_name), 'w'):
+                pass
+    with open(os.path.join(top, 'Loose.1999.mkv'), 'w'):
+        pass
+
+
+def file_paths(video_files) -> List[Text]:
+    return sorted(video_file.file_path for video_file in video_files)
+
+
+def scan(top: Text, tmp_path, **scan_options) -> ScanEngine:
+    scan_engine = ScanEngine(top, scan_cache_path=os.path.join(tmp_path, 'scan_cache'), **scan_options)
+    assert scan_engine.run()
+    return scan_engine
+
+
+def test_rescan_reuses_unchanged_directories(tmp_path):
+    top = os.path.join(tmp_path, 'videos')
+    make_tree(top)
+
+    first_scan = scan(top, tmp_path)
+    assert len(first_scan.folder_data) == 7
+    assert file_paths(first_scan.scan_diff.added) == file_paths(first_scan.folder_data)
+
+    second_scan = scan(top, tmp_path)
+    assert second_scan.scan_diff.added == second_scan.scan_diff.removed == []
+    assert file_paths(second_scan.scan_diff.unchanged) == file_paths(first_scan.folder_data)
+    assert second_scan.folder_data == first_scan.folder_data
+
+
+def test_rescan_finds_what_changed(tmp_path):
+    top = os.path.join(tmp_path, 'videos')
+    make_tree(top)
+    scan(top, tmp_path)
+
+    os.remove(os.path.join(top, 'dir1', 'Movie.1.2001.mkv'))
+    with open(os.path.join(top, 'dir2', 'Extra.2010.mkv'), 'w'):
+        pass
+    os.rename(os.path.join(top, 'dir3'), os.path.join(tmp_path, 'moved_away'))
+
+    rescan = scan(top, tmp_path)
+    assert file_paths(rescan.scan_diff.added) == [os.path.join(top, 'dir2', 'Extra.2010.mkv')]
+    assert file_paths(rescan.scan_diff.removed) == [os.path.join(top, 'dir1', 'Movie.1.2001.mkv'), os.path.join(top, 'dir3', 'Movie.3.2003.mkv')]
+    assert len(rescan.scan_diff.unchanged) == 5
+    assert [(video_file.scrubbed_file_name, video_file.scrubbed_file_year) for video_file in rescan.scan_diff.added] == [('extra', '2010')]
+
+
+def test_changed_settings_rescan_everything(tmp_path):
+    top = os.path.join(tmp_path, 'videos')
+    make_tree(top)
+    scan(top, tmp_path)
+
+    rescan = scan(top, tmp_path, ignore_extensions='png,jpg,nfo')
+    assert len(rescan.scan_diff.added) == 13
+    assert rescan.scan_diff.unchanged == []
+
+
+def test_stopped_scan_resumes_from_its_checkpoint(tmp_path, capsys):
+    top = os.path.join(tmp_path, 'videos')
+    make_tree(top, dir_count=20)
+    checkpoint_dir = os.path.join(tmp_path, 'checkpoint')
+    all_file_paths = file_paths(scan(top, tmp_path, use_scan_cache=False).folder_data)
+
+    stopped_results = list()
+
+    def stop_after_three_directories(video_files):
+        stopped_results.extend(video_files)
+        if len(stopped_results) == 3:
+            stopped_scan.stop_scanning()
+
+    stopped_scan = ScanEngine(top, result_sink=stop_after_three_directories, use_scan_cache=False, use_checkpoint=True, checkpoint_dir=checkpoint_dir, max_workers=1)
+    assert not stopped_scan.run()
+    assert os.path.exists(os.path.join(checkpoint_dir, 'frontier.json'))
+    capsys.readouterr()
+
+    resumed_results = list()
+    resumed_scan = ScanEngine(top, result_sink=resumed_results.extend, use_scan_cache=False, use_checkpoint=True, checkpoint_dir=checkpoint_dir, max_workers=1)
+    assert resumed_scan.run()
+    assert 'Resuming from checkpoint' in capsys.readouterr().out
+    # Finished directories are replayed through the sink, then the walk carries on from where it stopped
+    assert file_paths(resumed_results) == file_paths(resumed_scan.folder_data) == all_file_paths
+    assert resumed_results[:3] == stopped_results[:3]
+    assert not os.path.exists(checkpoint_dir)
+
+
+def test_checkpoint_for_other_settings_is_not_resumed(tmp_path, capsys):
+    top = os.path.join(tmp_path, 'videos')
+    make_tree(top)
+    checkpoint_dir = os.path.join(tmp_path, 'checkpoint')
+
+    def stop(_video_files):
+        stopped_scan.stop_scanning()
+
+    stopped_scan = ScanEngine(top, result_sink=stop, use_scan_cache=False, use_checkpoint=True, checkpoint_dir=checkpoint_dir, max_workers=1)
+    assert not stopped_scan.run()
+
+    rescan = ScanEngine(top, ignore_extensions='png,jpg,nfo', use_scan_cache=False, use_checkpoint=True, checkpoint_dir=checkpoint_dir)
+    assert rescan.run()
+    assert 'Discarding checkpoint' in capsys.readouterr().out
+    assert len(rescan.folder_data) == 13
+
+
+def test_process_pool_scrubs_as_the_scanner_thread_does(tmp_path):
+    top = os.path.join(tmp_path, 'videos')
+    make_tree(top, dir_count=30)
+    inline_scan = scan(top, tmp_path, use_scan_cache=False)
+
+    streamed_video_files = list()
+    pool_scan = scan(top, tmp_path, use_scan_cache=False, use_process_pool=True, process_pool_workers=2, process_pool_batch_size=5, result_sink=streamed_video_files.extend)
+    # In walk order, however the batches finished
+    assert pool_scan.folder_data == inline_scan.folder_data
+    assert streamed_video_files == inline_scan.folder_data
@@ -0,0 +1,48 @@
+import threading
+
+from mmm.core.scan_stream import VideoFileBatchQueue
+from mmm.core.video_file import VideoFile
+
+
+def make_video_files(first_number: int, count: int):
+    return [VideoFile(file_path=f'/m/{number}.mkv') for number in range(first_number, first_number + count)]
+
+
+def test_batches_flush_when_full_or_late():
+    now = [0.0]
+    batch_queue = VideoFileBatchQueue(max_batch_size=3, max_batch_delay=0.1, clock=lambda: now[0])
+    for video_file in make_video_files(0, 2):
+        batch_queue.put(video_file)
+    assert batch_queue.get_batches() == ([], False)
+
+    batch_queue.put(make_video_files(2, 1)[0])
+    assert batch_queue.get_batches() == (make_video_files(0, 3), False)
+
+    batch_queue.put(make_video_files(3, 1)[0])
+    now[0] = 0.2
+    batch_queue.put(make_video_files(4, 1)[0])
+    assert batch_queue.get_batches() == (make_video_files(3, 2), False)
+
+    batch_queue.put_many(make_video_files(5, 2))
+    batch_queue.close()
+    assert batch_queue.get_batches() == (make_video_files(5, 2), True)
+
+
+def test_consumer_gets_everything_in_order_in_bounded_chunks():
+    batch_queue = VideoFileBatchQueue(max_batch_size=100)
+
+    def produce():
+        for first_number in range(0, 10_000, 250):
+            batch_queue.put_many(make_video_files(first_number, 250))
+        batch_queue.close()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    received = list()
+    is_done = False
+    while not is_done:
+        video_files, is_done = batch_queue.get_batches(max_items=700)
+        assert len(video_files) <= 700
+        received.extend(video_files)
+    producer.join()
+    assert received == make_video_files(0, 10_000)
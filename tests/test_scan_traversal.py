@@ -0,0 +1,52 @@
+from typing import List, Text, Tuple
+import os
+
+from mmm.core.scan_traversal import ParallelDirectoryWalker
+
+
+def make_tree(top: Text):
+    # top/a/{one.mkv, b/two.mkv}, top/three.mkv, and links to a directory and to a file
+    os.makedirs(os.path.join(top, 'a', 'b'))
+    for file_path in ('a/one.mkv', 'a/b/two.mkv', 'three.mkv'):
+        with open(os.path.join(top, file_path), 'w'):
+            pass
+    os.makedirs(os.path.join(top, 'elsewhere'))
+    with open(os.path.join(top, 'elsewhere', 'four.mkv'), 'w'):
+        pass
+    os.symlink(os.path.join(top, 'elsewhere'), os.path.join(top, 'linked.mkv'))
+    os.symlink(os.path.join(top, 'three.mkv'), os.path.join(top, 'linked_file.mkv'))
+
+
+def walked(walker: ParallelDirectoryWalker, top: Text) -> List[Tuple[Text, List[Text]]]:
+    return [(listing.dir_path, [entry.name for entry in listing.file_entries]) for listing in walker.walk(top)]
+
+
+def os_walked(top: Text, follow_links: bool) -> List[Tuple[Text, List[Text]]]:
+    # What the walker replaces: a sorted os.walk, with links to directories counted as directories
+    listings = list()
+    for dir_path, dir_names, file_names in os.walk(top, followlinks=follow_links):
+        dir_names.sort()
+        listings.append((dir_path, sorted(file_names)))
+    return listings
+
+
+def test_walk_matches_sorted_os_walk(tmp_path):
+    top = str(tmp_path)
+    make_tree(top)
+    assert walked(ParallelDirectoryWalker(max_workers=2), top) == os_walked(top, follow_links=False)
+
+
+def test_directory_link_is_not_a_file_or_followed(tmp_path):
+    top = str(tmp_path)
+    make_tree(top)
+    listings = walked(ParallelDirectoryWalker(max_workers=2), top)
+    assert (top, ['linked_file.mkv', 'three.mkv']) in listings
+    assert os.path.join(top, 'linked.mkv') not in [dir_path for dir_path, _file_names in listings]
+
+
+def test_directory_link_is_followed_when_asked(tmp_path):
+    top = str(tmp_path)
+    make_tree(top)
+    listings = walked(ParallelDirectoryWalker(max_workers=2, follow_links=True), top)
+    assert listings == os_walked(top, follow_links=True)
+    assert (os.path.join(top, 'linked.mkv'), ['four.mkv']) in listings
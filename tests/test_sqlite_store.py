@@ -0,0 +1,81 @@
+import os
+import sqlite3
+
+import pytest
+
+from mmm.core.library_loader import LibraryLoader
+from mmm.core.sqlite_store import SQLITE_STORE_SCHEMA_VERSION, SqliteLibraryRows, SqliteLibraryStore
+from mmm.core.video_file import VideoFile
+
+
+def make_video_files(count: int):
+    return [VideoFile(file_path=f'/m/{index}.mkv', scrubbed_file_name=f'movie {index}') for index in range(count)]
+
+
+def test_library_is_shown_page_by_page(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.db')
+    video_files = make_video_files(1000)
+    SqliteLibraryStore(library_path).upsert_many(video_files)
+
+    library_loader = LibraryLoader(library_path, batch_sink=lambda video_files: None)
+    assert library_loader.load()
+    rows = library_loader.video_file_rows
+    rows.page_size = 64
+    rows.cached_page_count = 4
+    assert isinstance(rows, SqliteLibraryRows)
+    assert len(rows) == 1000
+    assert rows[0] == video_files[0]
+    assert rows[999] == video_files[999]
+    assert rows[-2] == video_files[998]
+    assert rows[500:503] == video_files[500:503]
+    assert [rows[index] for index in range(0, 1000, 7)] == video_files[::7]
+    assert len(rows.pages) == 4
+    assert list(rows) == video_files
+    rows.close()
+
+
+def test_rows_follow_changes_to_the_records_they_were_opened_with(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.db')
+    video_files = make_video_files(300)
+    library_store = SqliteLibraryStore(library_path)
+    library_store.upsert_many(video_files)
+
+    with library_store.open_rows() as rows:
+        library_store.delete_paths([video_file.file_path for video_file in video_files[:100]])
+        library_store.upsert_many([VideoFile(file_path='/m/150.mkv', scrubbed_file_name='renamed'), VideoFile(file_path='/m/new.mkv')])
+        assert len(rows) == 300
+        assert rows[0] == VideoFile()
+        assert rows[150].scrubbed_file_name == 'renamed'
+        assert list(rows)[100:] == [rows[index] for index in range(100, 300)]
+
+    with library_store.open_rows() as rows:
+        assert [video_file.file_path for video_file in rows] == [video_file.file_path for video_file in video_files[100:]] + ['/m/new.mkv']
+
+
+def test_open_rows_let_the_wal_be_checkpointed(tmp_path):
+    library_path = os.path.join(tmp_path, 'library.db')
+    library_store = SqliteLibraryStore(library_path)
+    library_store.upsert_many(make_video_files(300))
+
+    with library_store.open_rows() as rows:
+        assert rows[10] == make_video_files(11)[10]
+        library_store.upsert_many([VideoFile(file_path='/m/new.mkv')])
+        busy, _log_frames, _checkpointed_frames = library_store.connection().execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        assert busy == 0
+        assert os.path.getsize(library_path + '-wal') == 0
+
+
+def test_other_databases_are_not_opened_as_libraries(tmp_path):
+    other_path = os.path.join(tmp_path, 'other.db')
+    with sqlite3.connect(other_path) as connection:
+        connection.execute('CREATE TABLE notes (text TEXT)')
+    with pytest.raises(ValueError):
+        SqliteLibraryStore(other_path)
+
+    newer_path = os.path.join(tmp_path, 'newer.db')
+    SqliteLibraryStore(newer_path).close()
+    with sqlite3.connect(newer_path) as connection:
+        connection.execute(f'PRAGMA user_version = {SQLITE_STORE_SCHEMA_VERSION + 1}')
+    with pytest.raises(ValueError):
+        SqliteLibraryStore(newer_path)
+    assert SqliteLibraryStore(os.path.join(tmp_path, 'library.db')).count() == 0
@@ -0,0 +1,89 @@
+from typing import List
+import dataclasses
+import random
+
+import pytest
+
+pytest.importorskip('gi')
+
+from gi.repository import GLib
+
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+from mmm.video_file_list_model import FIELD_SORT_TEXTS, VideoFileListModel
+
+
+def make_video_file(number: int) -> VideoFile:
+    return VideoFile(file_path=f'/m/{number}.mkv', scrubbed_file_name=f'movie {number}')
+
+
+def wait_for_search_index(model: VideoFileListModel):
+    while model.search_index is None:
+        GLib.MainContext.default().iteration(True)
+
+
+def item_titles(model: VideoFileListModel) -> List[str]:
+    return [model.get_item(position).title for position in range(model.get_n_items())]
+
+
+def watch_items(model: VideoFileListModel) -> List[str]:
+    # The titles a view would show, kept up to date from items-changed alone; at every signal the items the model
+    # hands out must be the ones the signals so far describe (or blank, for a record removed by a later signal)
+    shown_titles = item_titles(model)
+
+    def on_items_changed(_model, position: int, removed_count: int, added_count: int):
+        shown_titles[position:position + removed_count] = [model.get_item(added_position).title for added_position in range(position, position + added_count)]
+        assert len(shown_titles) == model.get_n_items()
+        for shown_title, title in zip(shown_titles, item_titles(model)):
+            assert title in (shown_title, '')
+
+    model.connect('items-changed', on_items_changed)
+    return shown_titles
+
+
+def edit(model: VideoFileListModel, rng: random.Random, removed_count: int, renamed_count: int, added_count: int):
+    # The list edited as apply_library_change() would, then the model told
+    video_files = model.video_files
+    removed_indices = sorted(rng.sample(range(len(video_files)), removed_count))
+    for index in reversed(removed_indices):
+        del video_files[index]
+    renamed_indices = sorted(rng.sample(range(len(video_files)), renamed_count))
+    for index in renamed_indices:
+        video_files[index] = dataclasses.replace(video_files[index], scrubbed_file_name=f'renamed {rng.randrange(1000)}')
+    added = [make_video_file(1000 + rng.randrange(1000)) for _index in range(added_count)]
+    video_files.extend(added)
+    model.apply_library_edit(LibraryEdit(removed_indices=removed_indices, renamed_indices=renamed_indices, added=added))
+
+
+@pytest.mark.parametrize('descending', [None, False, True])
+@pytest.mark.parametrize('query', ['', 'movie'])
+def test_edits_are_told_consistently(descending, query):
+    rng = random.Random(1)
+    model = VideoFileListModel([make_video_file(number) for number in range(100)])
+    if descending is not None:
+        model.sort_by(FIELD_SORT_TEXTS['title'], descending=descending)
+    wait_for_search_index(model)
+    model.search(query)
+    shown_titles = watch_items(model)
+    for removed_count, renamed_count, added_count in [(0, 0, 5), (4, 0, 0), (10, 6, 10)]:
+        edit(model, rng, removed_count, renamed_count, added_count)
+        assert shown_titles == item_titles(model)
+
+
+def test_search_index_is_made_off_the_main_loop():
+    model = VideoFileListModel([make_video_file(number) for number in range(300)])
+    assert model.props.is_indexing
+    model.search('movie 12')
+    # Typed before the index is ready: nothing is indexed here, every record stays shown
+    assert model.search_index is None and model.get_n_items() == 300
+
+    # Edits made while it is indexed are folded in once it is ready, and the search shown
+    video_files = model.video_files
+    del video_files[5]
+    added = [make_video_file(1200)]
+    video_files.extend(added)
+    model.apply_library_edit(LibraryEdit(removed_indices=[5], renamed_indices=list(), added=added))
+    wait_for_search_index(model)
+    assert not model.props.is_indexing
+    assert item_titles(model) == [video_file.scrubbed_file_name for video_file in video_files if video_file.scrubbed_file_name.split()[1].startswith('12')]
+    assert 'movie 1200' in item_titles(model)
@@ -0,0 +1,133 @@
+from typing import List
+import dataclasses
+import os
+import random
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtCore = pytest.importorskip('PySide6.QtCore')
+from PySide6.QtCore import QItemSelectionModel, Qt
+from PySide6.QtTest import QAbstractItemModelTester
+from PySide6.QtWidgets import QApplication
+
+from main_qt import VideoFileTableModel
+from mmm.core.library_watch import LibraryEdit
+from mmm.core.video_file import VideoFile
+
+
+@pytest.fixture(scope='module')
+def application():
+    return QApplication.instance() or QApplication([])
+
+
+def make_video_file(number: int) -> VideoFile:
+    return VideoFile(file_path=f'/m/{number}.mkv', scrubbed_file_name=f'movie {number}', scrubbed_file_year=str(1950 + number % 70))
+
+
+def make_model(count: int) -> VideoFileTableModel:
+    model = VideoFileTableModel()
+    model.tester = QAbstractItemModelTester(model, QAbstractItemModelTester.FailureReportingMode.Fatal)
+    model.set_video_files([make_video_file(number) for number in range(count)])
+    return model
+
+
+def wait_for_search_index(model: VideoFileTableModel):
+    while model.search_index is None:
+        QApplication.processEvents(QtCore.QEventLoop.ProcessEventsFlag.AllEvents, 50)
+
+
+def shown_titles(model: VideoFileTableModel) -> List[str]:
+    return [model.data(model.index(row, 0)) for row in range(model.rowCount())]
+
+
+def expected_titles(model: VideoFileTableModel, reverse: bool = False, word: str = None) -> List[str]:
+    titles = [video_file.scrubbed_file_name for video_file in model.video_files if word is None or word in video_file.scrubbed_file_name.split()]
+    return titles if model.sort_order is None else sorted(titles, key=model.sort_order.text_sort_key, reverse=reverse)
+
+
+def edit(model: VideoFileTableModel, rng: random.Random, removed_count: int, renamed_count: int, added_count: int):
+    # The list edited as apply_library_change() would, then the model told
+    video_files = model.video_files
+    removed_indices = sorted(rng.sample(range(len(video_files)), removed_count))
+    for index in reversed(removed_indices):
+        del video_files[index]
+    renamed_indices = sorted(rng.sample(range(len(video_files)), renamed_count))
+    for index in renamed_indices:
+        video_files[index] = dataclasses.replace(video_files[index], scrubbed_file_name=f'renamed {rng.randrange(1000)}')
+    added = [make_video_file(1000 + rng.randrange(1000)) for _index in range(added_count)]
+    video_files.extend(added)
+    model.apply_library_edit(LibraryEdit(removed_indices=removed_indices, renamed_indices=renamed_indices, added=added))
+
+
+@pytest.mark.parametrize('sort_order', [None, Qt.AscendingOrder, Qt.DescendingOrder])
+@pytest.mark.parametrize('removed_count, renamed_count, added_count', [(0, 0, 5), (3, 0, 0), (2, 2, 3), (15, 5, 15)])
+def test_edits_are_announced_consistently(application, sort_order, removed_count, renamed_count, added_count):
+    rng = random.Random(removed_count * 100 + renamed_count * 10 + added_count)
+    model = make_model(60)
+    if sort_order is not None:
+        model.sort(0, sort_order)
+    for _edit in range(3):
+        edit(model, rng, removed_count, renamed_count, added_count)
+        assert shown_titles(model) == expected_titles(model, reverse=sort_order == Qt.DescendingOrder)
+
+
+@pytest.mark.parametrize('removed_count, renamed_count, added_count', [(0, 0, 10), (3, 3, 3), (20, 6, 20)])
+def test_searched_edits_are_announced_consistently(application, removed_count, renamed_count, added_count):
+    rng = random.Random(removed_count)
+    model = make_model(80)
+    model.sort(0, Qt.AscendingOrder)
+    wait_for_search_index(model)
+    model.search('movie')
+    for _edit in range(3):
+        edit(model, rng, removed_count, renamed_count, added_count)
+        assert shown_titles(model) == expected_titles(model, word='movie')
+
+
+def test_selection_follows_its_records_through_a_scattered_edit(application):
+    rng = random.Random(1)
+    model = make_model(200)
+    model.sort(0, Qt.AscendingOrder)
+    selection_model = QItemSelectionModel(model)
+    for row in (10, 100, 190):
+        selection_model.select(model.index(row, 0), QItemSelectionModel.Select)
+    selected_titles = [model.data(index) for index in selection_model.selectedIndexes()]
+
+    video_files = model.video_files
+    kept_titles = set(selected_titles)
+    removed_indices = sorted(rng.sample([index for index, video_file in enumerate(video_files) if video_file.scrubbed_file_name not in kept_titles], 40))
+    for index in reversed(removed_indices):
+        del video_files[index]
+    added = [make_video_file(1000 + number) for number in range(40)]
+    video_files.extend(added)
+    model.apply_library_edit(LibraryEdit(removed_indices=removed_indices, renamed_indices=list(), added=added))
+
+    assert shown_titles(model) == expected_titles(model)
+    assert sorted(model.data(index) for index in selection_model.selectedIndexes()) == sorted(selected_titles)
+
+
+def test_search_index_is_made_off_the_gui_thread(application):
+    model = make_model(300)
+    indexing = list()
+    model.indexing_signal.connect(indexing.append)
+    model.search('movie 12')
+    # Typed before the index is ready: nothing is indexed here, every record stays shown
+    assert model.search_index is None and model.search_positions is None
+    assert model.rowCount() == 300
+
+    # Edits made while it is indexed are folded in once it is ready, and the search shown
+    video_files = model.video_files
+    del video_files[5]
+    added = [make_video_file(1200)]
+    video_files.extend(added)
+    model.apply_library_edit(LibraryEdit(removed_indices=[5], renamed_indices=list(), added=added))
+    wait_for_search_index(model)
+    assert indexing == [False]
+    assert shown_titles(model) == [video_file.scrubbed_file_name for video_file in video_files if video_file.scrubbed_file_name.split()[1].startswith('12')]
+    assert 'movie 1200' in shown_titles(model)
+
+    # A different list is indexed again
+    model.set_video_files([make_video_file(number) for number in range(50)])
+    assert indexing == [False, True] and model.search_index is None
+    wait_for_search_index(model)
+    assert shown_titles(model) == ['movie 12']